@@ -0,0 +1,230 @@
+#!/usr/bin/python
+#Benchmark harness for gen-gungeon-audio-bank.py
+#  Generates deterministic synthetic .wav sets, times each phase of building / reading a bank in a separate process,
+#  and compares the results against a stored baseline so regressions show up in one command
+#  Run with -h flag for usage information
+
+import sys, os, re, json, time, wave, random, shutil, tempfile, argparse, subprocess, contextlib, importlib.util
+try:
+  import resource # not available on Windows, where peak memory usage isn't reported
+except ImportError:
+  resource = None
+
+SCRIPT_DESCRIPTION = "benchmark gen-gungeon-audio-bank.py on synthetic .wav sets"
+DEFAULT_SCRIPT     = os.path.join(os.path.dirname(os.path.realpath(__file__)), "gen-gungeon-audio-bank.py")
+
+# Phases to time, in the order they run (each needs the output of the previous ones, which is built untimed)
+PHASES = ["scan", "embed", "save", "load", "readbank"]
+
+# Synthetic corpora: name -> list of (count, channels, sample width, rate, seconds) groups
+#   counts and lengths are multiplied by --scale
+CORPORA = {
+  "sfx"   : [ # lots of tiny sound effects
+    (1200, 1, 2, 22050, 0.25),
+    (600 , 2, 2, 44100, 0.2),
+    (200 , 1, 2, 16000, 0.5),
+  ],
+  "music" : [ # a few huge stereo music tracks
+    (3, 2, 2, 44100, 90.0),
+  ],
+  "mixed" : [ # mixed rates and widths
+    (100, 1, 2, 8000 , 1.0),
+    (100, 2, 2, 32000, 1.0),
+    (50 , 2, 1, 22050, 1.0),
+    (50 , 2, 3, 48000, 1.0),
+    (2  , 2, 2, 48000, 30.0),
+  ],
+}
+
+# Create argument parser and parse the args
+parser = argparse.ArgumentParser()
+parser.description = f"{os.path.basename(sys.argv[0])}: {SCRIPT_DESCRIPTION}"
+parser.add_argument("-c", "--corpus", default="sfx,music,mixed",
+  help=f"comma-separated list of synthetic corpora to benchmark ({', '.join(CORPORA)})")
+parser.add_argument("-p", "--phases", default=",".join(PHASES),
+  help=f"comma-separated list of phases to time ({', '.join(PHASES)})")
+parser.add_argument("-x", "--scale", type=float, default=1.0,
+  help=f"multiply the number and length of synthetic files by this much (default: 1.0)")
+parser.add_argument("-n", "--repeat", type=int, default=1,
+  help=f"run each phase this many times and keep the fastest run (default: 1)")
+parser.add_argument("-b", "--baseline",
+  help=f"compare results against this baseline .json file")
+parser.add_argument("-B", "--save_baseline",
+  help=f"save results to this baseline .json file")
+parser.add_argument("-t", "--threshold", type=float, default=20.0,
+  help=f"percent slowdown (or memory increase) vs. the baseline counted as a regression (default: 20)")
+parser.add_argument("-w", "--workdir",
+  help=f"folder for synthetic corpora and banks (default: a temporary folder that's removed afterwards)")
+parser.add_argument("--script", default=DEFAULT_SCRIPT,
+  help=f"path to gen-gungeon-audio-bank.py (default: the one next to this script)")
+parser.add_argument("--child", nargs=3, metavar=("PHASE", "CORPUS_DIR", "BANK"),
+  help=argparse.SUPPRESS) # run a single phase in this process and print its results as json
+args = parser.parse_args()
+
+#Get the peak resident memory of this process in MB (or None if unsupported)
+def peakRSS():
+  if resource is None:
+    return None
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return rss / (1024*1024) if sys.platform == "darwin" else rss / 1024 # bytes on macOS, KB elsewhere
+
+#Load gen-gungeon-audio-bank.py as a module without running its main()
+def loadScript(path):
+  with open(path,'r') as fin:
+    autorun = re.search(r"^ALLOW_AUTORUN\s*=\s*True", fin.read(), re.M) is not None
+  sys.argv = [path, "-q", "-O", "--names", os.devnull] + (["-i", ".", "-o", "bench"] if autorun else [".", "bench"])
+  spec   = importlib.util.spec_from_file_location("gen_gungeon_audio_bank", path)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+#Write a deterministic synthetic corpus of .wav files to path, returning the total number of audio bytes
+def makeCorpus(name,path,scale):
+  rng   = random.Random(name) # same seed for the same corpus every time
+  total = 0
+  os.makedirs(path, exist_ok=True)
+  for g, (count, channels, width, rate, seconds) in enumerate(CORPORA[name]):
+    count  = max(1, int(count * scale))
+    frames = max(1, int(rate * seconds * scale))
+    for i in range(count):
+      n = frames + rng.randrange(rate // 100 + 1) # vary lengths a little
+      with wave.open(os.path.join(path, f"{name}_{g}_{i:05d}.wav"), 'wb') as fout:
+        fout.setnchannels(channels)
+        fout.setsampwidth(width)
+        fout.setframerate(rate)
+        fout.writeframes(rng.randbytes(n * channels * width))
+      total += n * channels * width
+  return total
+
+#Time a single phase in this process, returning a dict of results
+#  everything a phase depends on is done before the timer starts
+def runPhase(phase,corpus,bank):
+  gen    = loadScript(args.script)
+  nbytes = 0
+  if phase in ["scan", "embed", "save"]:
+    start = time.perf_counter()
+    wavs  = gen.findWavsInDirectory(corpus, recursive=True)
+    if phase == "scan":
+      nbytes = sum(w.size for w in wavs)
+    else:
+      bp = gen.BNKParser().createMinimal(gen.stringToBnkID("bench"))
+      if phase == "save": # only time saving
+        for w in wavs:
+          bp.embedFromWav(w, False)
+        start = time.perf_counter()
+        bp.saveTo(bank)
+        nbytes = os.path.getsize(bank)
+      else:
+        start = time.perf_counter()
+        for w in wavs:
+          bp.embedFromWav(w, False)
+        nbytes = sum(w.data_size for w in wavs)
+  elif phase == "load":
+    nbytes = os.path.getsize(bank)
+    start  = time.perf_counter()
+    gen.BNKParser().loadFrom(bank)
+  elif phase == "readbank":
+    nbytes = os.path.getsize(bank)
+    gen.args.showparse = True
+    gen.args.dumpparse = True
+    with open(os.devnull,'w') as null, contextlib.redirect_stdout(null):
+      start = time.perf_counter()
+      b     = gen.BNKParser()
+      b.loadFrom(bank)
+      b.root.dump()
+  else:
+    raise Exception(f"unknown phase {phase}")
+  wall = time.perf_counter() - start
+  return {"wall" : wall, "bytes" : nbytes, "rss_mb" : peakRSS()}
+
+#Time a phase in a fresh process (so peak memory usage is measured for that phase alone), keeping the fastest of several runs
+def timePhase(phase,corpus,bank,repeat):
+  best = None
+  for _ in range(max(1, repeat)):
+    out = subprocess.run([sys.executable, os.path.realpath(__file__), "--script", args.script, "--child", phase, corpus, bank],
+      check=True, stdout=subprocess.PIPE, text=True).stdout
+    r = json.loads(out.strip().splitlines()[-1])
+    if best is None or r["wall"] < best["wall"]:
+      best = r
+  best["mb_per_s"] = (best["bytes"] / (1024*1024)) / best["wall"] if best["wall"] > 0 else None
+  return best
+
+#Format a number for the results table
+def fmt(x,spec):
+  return "-" if x is None else format(x, spec)
+
+#Compare results against a baseline, returning a list of regressions
+def compareResults(results,baseline,threshold):
+  regressions = []
+  for key, r in results.items():
+    b = baseline.get(key, None)
+    if b is None:
+      continue
+    for metric in ["wall", "rss_mb"]:
+      if r.get(metric) is None or not b.get(metric):
+        continue
+      change = 100.0 * (r[metric] - b[metric]) / b[metric]
+      r[metric+"_change"] = change
+      if change > threshold:
+        regressions.append(f"{key} {metric}: {b[metric]:.3f} -> {r[metric]:.3f} (+{change:.1f}%)")
+  return regressions
+
+def main():
+  if args.child:
+    print(json.dumps(runPhase(*args.child)))
+    return
+
+  corpora = [c.strip() for c in args.corpus.split(",") if c.strip()]
+  phases  = [p.strip() for p in args.phases.split(",") if p.strip()]
+  for c in corpora:
+    if c not in CORPORA:
+      raise Exception(f"unknown corpus {c}")
+  for p in phases:
+    if p not in PHASES:
+      raise Exception(f"unknown phase {p}")
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix="bench-bnk-")
+  results = {}
+  try:
+    for c in corpora:
+      corpus = os.path.join(workdir, f"{c}-x{args.scale:g}")
+      if not os.path.exists(corpus):
+        print(f">> generating {c} corpus in {corpus}")
+        makeCorpus(c, corpus, args.scale)
+      bank = os.path.join(workdir, f"{c}-x{args.scale:g}.bnk")
+      if any(p in ["load", "readbank"] for p in phases) and "save" not in phases and not os.path.exists(bank):
+        timePhase("save", corpus, bank, 1) # build the bank the read phases need
+      for p in phases:
+        print(f">> timing {p} on {c}")
+        results[f"{c}/{p}"] = timePhase(p, corpus, bank, args.repeat)
+  finally:
+    if args.workdir is None:
+      shutil.rmtree(workdir, ignore_errors=True)
+
+  regressions = []
+  if args.baseline:
+    with open(args.baseline,'r') as fin:
+      baseline = json.load(fin)["results"]
+    regressions = compareResults(results, baseline, args.threshold)
+
+  print()
+  print(f"{'corpus/phase':<20s} {'wall (s)':>10s} {'peak RSS (MB)':>14s} {'MB/s':>10s}" + (f" {'wall vs base':>13s} {'RSS vs base':>12s}" if args.baseline else ""))
+  for key, r in results.items():
+    line = f"{key:<20s} {fmt(r['wall'],'10.3f')} {fmt(r['rss_mb'],'14.1f')} {fmt(r['mb_per_s'],'10.1f')}"
+    if args.baseline:
+      line += f" {fmt(r.get('wall_change'),'+12.1f')}% {fmt(r.get('rss_mb_change'),'+11.1f')}%"
+    print(line)
+
+  if args.save_baseline:
+    with open(args.save_baseline,'w') as fout:
+      json.dump({"scale" : args.scale, "results" : results}, fout, indent=2)
+    print(f"\nSaved baseline to {args.save_baseline}")
+
+  if regressions:
+    print(f"\n{len(regressions)} regressions (more than {args.threshold:g}% worse than {args.baseline}):")
+    for r in regressions:
+      print(f"  {r}")
+    sys.exit(1)
+
+if __name__ == "__main__":
+  main()
@@ -57,7 +57,6 @@ ALLOW_AUTORUN = True # change to False if you don't wish to allow this script to
 #  - figure out looping music
 #  - figure out why 8-bit WAVs make Gungeon explode (e.g., minish cap sounds)
 #  -
-#  - add checking for duplicate IDs (in case strings hash to same thing)
 #  - (maybe) add support for different HIRC actions
 #  - (maybe) UI channels
 #  - (maybe) figure out why we have to pretend mono tracks are stereo
@@ -66,11 +65,16 @@ ALLOW_AUTORUN = True # change to False if you don't wish to allow this script to
 SCRIPT_DESCRIPTION = "create a WWise soundbank (.bnk) compatibile with Enter the Gungeon"
 
 # Import necessary modules
-import sys, os, struct, io, wave, csv, argparse, time
-# import numpy as np
+import sys, os, abc, struct, io, wave, csv, argparse, time, tempfile, concurrent.futures, hashlib, json, mmap, math, bisect, array, contextlib, tracemalloc
 # from soundfile import SoundFile
 
-# Install pyaudio and and uncomment below line to use playWAVData()
+# Install numpy to use --normalize and --analyze (only needed for converting audio, everything else works without it)
+try:
+  import numpy as np
+except ImportError:
+  pass
+
+# Install pyaudio and and uncomment below line to use playWAVData() and --preview
 #   (tested with Python 3.9, may not work with Python 3.10 and up)
 # import pyaudio
 
@@ -103,6 +107,9 @@ else: #no colors
     CYN = ''
     WHT = ''
 
+# Ways to split the input .wav files into several banks with --shard
+SHARD_MODES = ["size", "channel", "folder"]
+
 # Create argument parser and parse the args
 parser = argparse.ArgumentParser()
 parser.description = f"{os.path.basename(sys.argv[0])}: {SCRIPT_DESCRIPTION}"
@@ -126,8 +133,52 @@ parser.add_argument("-r", "--recursive", action="store_true",
   help=f"recursively scan subfolders of {col.YLW}input_path{col.BLN} for .wav files")
 parser.add_argument("-w", "--create_wems", action="store_true",
   help=f"create .wem files from .wav files in {col.YLW}input_path{col.BLN}")
+parser.add_argument("--vanilla_ids",
+  help=f"file listing ids (and / or event names) already used by the base game, one per line; generated ids that clash with them are rejected")
+parser.add_argument("-m", "--merge", action="append", default=[],
+  help=f"merge the sounds of an existing .bnk into the output bank (can be passed more than once); .wav files with the same name as an existing sound replace it")
+parser.add_argument("--ogg", action="store_true",
+  help=f"also embed .ogg (Vorbis) files in {col.YLW}input_path{col.BLN} (needs ww2ogg's codebook library; .ogg files are skipped otherwise, and whenever a .wav file has the same name)")
+parser.add_argument("--codebooks",
+  help=f"ww2ogg codebook library used to convert .ogg files (default: packed_codebooks_aoTuV_603.bin next to this script)")
 parser.add_argument("-O", "--overwrite", action="store_true",
   help=f"overwrite existing .bnk files without confirmation")
+parser.add_argument("-N", "--normalize", action="store_true",
+  help=f"convert .wav files to 16-bit stereo PCM (at --rate, if given) before embedding them; converted files are cached in a .wavcache folder next to the output bank (requires numpy)")
+parser.add_argument("--rate", type=int, default=0,
+  help=f"with --normalize, resample .wav files to this sample rate (default: keep each file's rate)")
+parser.add_argument("-T", "--trim", action="store_true",
+  help=f"trim leading and trailing silence from .wav files before embedding them (requires numpy)")
+parser.add_argument("--trim_db", type=float, default=-70.0,
+  help=f"with --trim, samples quieter than this many dBFS count as silence (default: -70)")
+parser.add_argument("--downmix", action="store_true",
+  help=f"embed stereo .wav files whose left and right channels are identical as mono, halving their size (requires numpy)")
+parser.add_argument("-A", "--analyze", action="store_true",
+  help=f"measure the loudness of every .wav file and save it (plus a suggested volume offset) to the spreadsheet given with -s (requires numpy)")
+parser.add_argument("--target_db", type=float, default=-20.0,
+  help=f"with --analyze, the RMS level in dBFS that suggested volume offsets aim for (default: -20)")
+parser.add_argument("-D", "--dedupe", action="store_true",
+  help=f"store identical audio data only once, sharing it between every sound that uses it")
+parser.add_argument("--shard", choices=SHARD_MODES,
+  help=f"split the output into several banks by audio data size, spreadsheet channel, or top-level subfolder, and save a .manifest.json mapping each event to its bank")
+parser.add_argument("--shard_size", type=float, default=16.0,
+  help=f"with --shard size, the maximum megabytes of audio data per bank (default: 16)")
+parser.add_argument("-W", "--watch", action="store_true",
+  help=f"keep running and incrementally rebuild the bank whenever .wav files in {col.YLW}input_path{col.BLN} or the spreadsheet change")
+parser.add_argument("--poll", type=float, default=1.0,
+  help=f"with --watch, seconds between checks for changed files (default: 1.0)")
+parser.add_argument("--debounce", type=float, default=0.5,
+  help=f"with --watch, seconds without further changes to wait for before rebuilding (default: 0.5)")
+parser.add_argument("-S", "--stream", action="store_true",
+  help=f"stream audio data straight from .wav files to the output .bnk instead of loading it all into memory (for very large banks)")
+parser.add_argument("-I", "--incremental", action="store_true",
+  help=f"keep a cache next to the output .bnk and only reload .wav files that changed since the last build (always on in autorun mode)")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+  help=f"number of worker processes used to load .wav files (0 == one per CPU; default: 1)")
+parser.add_argument("--profile",   action="store_true",
+  help=f"print how much time, data, and memory each phase of building the bank takes (slows down the build; with --shard and -j, the times of all worker processes are added together)")
+parser.add_argument("--profile_json",
+  help=f"also save a trace of every profiled phase to {col.YLW}profile_json{col.BLN} (implies --profile)")
 parser.add_argument("--nocolor",   action="store_true",
   help=f"({col.BLU}debug{col.BLN}) disable colored output (if terminal doesn't support ANSI codes)")
 parser.add_argument("--showparse",   action="store_true",
@@ -136,6 +187,24 @@ parser.add_argument("--dumpparse",   action="store_true",
   help=f"({col.BLU}debug{col.BLN}) dump parse structure after parsing BNK data")
 parser.add_argument("--readbank",   action="store_true",
   help=f"({col.BLU}debug{col.BLN}) dump a sound bank to the console (useful for reverse engineering)")
+parser.add_argument("--listevents",   action="store_true",
+  help=f"list the events, actions, sounds, and WEM files in a sound bank without reading any audio data")
+parser.add_argument("--extract",
+  help=f"extract every WEM file in the bank at {col.YLW}input_path{col.BLN} (plus a .wav for each PCM WEM file) into the folder {col.YLW}extract{col.BLN}")
+parser.add_argument("--preview",
+  help=f"play the event, sound, or WEM file {col.YLW}preview{col.BLN} (a name or id) straight from the bank at {col.YLW}input_path{col.BLN} without loading the rest of the bank")
+parser.add_argument("--sink", choices=["audio", "null"], default="audio",
+  help=f"where --preview sends audio: the audio device (needs pyaudio), or a null sink that just reads the audio data (default: audio)")
+parser.add_argument("--verify",   action="store_true",
+  help=f"after building, check that the bank re-serializes byte for byte and that every sound's audio data matches its .wav file; with a .bnk as {col.YLW}input_path{col.BLN}, just check that it re-serializes")
+parser.add_argument("--names", default=None,
+  help=f"name dictionary used to label ids in bank dumps, extracted files, and errors (default: {col.YLW}gungeon-audio-names.bin{col.BLN} next to this script)")
+parser.add_argument("--addnames", action="append", default=[],
+  help=f"add every name in a word list (one name per line) or spreadsheet (.csv, names in the first column) to the name dictionary and exit")
+parser.add_argument("--check",   action="store_true",
+  help=f"check the headers of all .wav files in {col.YLW}input_path{col.BLN} for formats known to cause problems in game without building a bank")
+parser.add_argument("--report",
+  help=f"with --check, also write the results to {col.YLW}report{col.BLN} (.json or .csv)")
 parser.add_argument("--skipchecks",   action="store_true",
   help=f"({col.BLU}debug{col.BLN}) skip sanity checks for parsing bnk files; {col.RED}debug only, can cause crashes{col.BLN}")
 args = parser.parse_args()
@@ -160,9 +229,149 @@ HIRC_TYPE_SFX    = 2 # HIRC event type for a Sound Effect
 HIRC_TYPE_ACTION = 3 # HIRC event type for an Action
 HIRC_TYPE_EVENT  = 4 # HIRC event type for an Event
 
+# Reads larger than this many bytes are returned as zero-copy memoryviews when parsing
+MAX_COPIED_READ = 64
+
+# Block size for copying audio data between files in streaming mode
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# Extension appended to a bank's filename for its incremental build cache
+BANK_CACHE_EXT = ".cache"
+
+# Number of audio frames sent to the audio device at a time by --preview (small so playback starts right away)
+PREVIEW_CHUNK_FRAMES = 1024
+
+# Default number of threads for work that's mostly waiting on the disk (--check, --extract)
+IO_THREADS = 8
+
+# Audio files picked up when scanning input_path (.ogg files only with --ogg)
+AUDIO_FILE_EXTS = (".wav", ".ogg")
+
+# Default location of ww2ogg's codebook library, needed to embed .ogg files
+DEFAULT_CODEBOOKS_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "packed_codebooks_aoTuV_603.bin")
+
+# Default location of the name dictionary used to label ids
+DEFAULT_NAMES_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "gungeon-audio-names.bin")
+
 # Misc. debug stuff
 DUMP_WAV_FILES = False
 
+# Records the wall time, bytes processed, and peak memory allocated by each phase of a build
+#   When disabled (the default), phase() returns a shared do-nothing context manager so profiling costs nothing
+#   Time spent in a phase nested inside another is only counted towards the inner one, so phase times add up to the total
+class Profiler(object):
+  null = contextlib.nullcontext()
+
+  def __init__(self):
+    self.enabled = False
+    self.phases  = {} #phase name -> {calls, wall, bytes, peak}, in the order phases first ran
+    self.events  = [] #(phase name, start, wall, bytes, peak) for every call, for the json trace
+    self.stack   = [] #{base, peak, nested} for each phase currently running, innermost last
+    self.start   = time.perf_counter()
+    self.epoch   = time.time()
+
+  #start a fresh profile (worker processes reuse this for each task they run)
+  def enable(self):
+    self.enabled = True
+    self.phases  = {}
+    self.events  = []
+    self.stack   = []
+    self.start   = time.perf_counter()
+    self.epoch   = time.time()
+    tracemalloc.start()
+
+  def phase(self,name,nbytes=0):
+    if not self.enabled:
+      return self.null
+    return self._timed(name,nbytes)
+
+  @contextlib.contextmanager
+  def _timed(self,name,nbytes):
+    if self.stack: # remember the outer phase's peak before resetting it
+      self.stack[-1]["peak"] = max(self.stack[-1]["peak"], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    frame = {"base" : tracemalloc.get_traced_memory()[0], "peak" : 0, "nested" : 0.0}
+    self.stack.append(frame)
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      wall = time.perf_counter() - start
+      self.stack.pop()
+      top  = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+      if self.stack:
+        self.stack[-1]["peak"]    = max(self.stack[-1]["peak"], top)
+        self.stack[-1]["nested"] += wall
+      self._record(name, start, wall, nbytes, top - frame["base"], nested=frame["nested"])
+
+  #nested is the time spent in phases nested inside this call, which isn't added to this phase's total
+  def _record(self,name,start,wall,nbytes,peak,nested=0.0):
+    p = self.phases.setdefault(name, {"calls" : 0, "wall" : 0.0, "bytes" : 0, "peak" : 0})
+    p["calls"] += 1
+    p["wall"]  += wall - nested
+    p["bytes"] += nbytes
+    p["peak"]   = max(p["peak"], peak)
+    self.events.append((name, start - self.start, wall, nbytes, peak))
+
+  #add to the bytes processed by a phase once they're known
+  def addBytes(self,name,nbytes):
+    if self.enabled and name in self.phases:
+      self.phases[name]["bytes"] += nbytes
+      e = self.events[-1]
+      if e[0] == name:
+        self.events[-1] = (e[0], e[1], e[2], e[3] + nbytes, e[4])
+
+  #time getting each item from an iterable as a call to the named phase
+  def iterate(self,name,iterable,size=None):
+    if not self.enabled:
+      return iterable
+    return self._iterate(name,iterable,size)
+
+  def _iterate(self,name,iterable,size):
+    it = iter(iterable)
+    while True:
+      with self.phase(name):
+        item = next(it, StopIteration)
+      if item is StopIteration:
+        self.phases[name]["calls"] -= 1 # don't count the call that found the end
+        self.events.pop()
+        return
+      if size is not None:
+        self.addBytes(name, size(item))
+      yield item
+
+  #everything recorded so far, for a worker process to send back to the parent
+  def results(self):
+    return {"epoch" : self.epoch, "phases" : self.phases, "events" : self.events}
+
+  #add the phases recorded by a worker process to this profile
+  def merge(self,results):
+    offset = results["epoch"] - self.epoch # worker events start relative to when the worker started profiling
+    for name, w in results["phases"].items():
+      p = self.phases.setdefault(name, {"calls" : 0, "wall" : 0.0, "bytes" : 0, "peak" : 0})
+      p["calls"] += w["calls"]
+      p["wall"]  += w["wall"]
+      p["bytes"] += w["bytes"]
+      p["peak"]   = max(p["peak"], w["peak"])
+    self.events.extend((n, s + offset, w, b, pk) for n, s, w, b, pk in results["events"])
+
+  def summary(self):
+    total = sum(p["wall"] for p in self.phases.values()) or 1
+    print(f"{'phase':<20s} {'calls':>7s} {'wall (s)':>10s} {'% time':>7s} {'MB':>10s} {'MB/s':>9s} {'peak alloc (MB)':>16s}")
+    for name, p in self.phases.items():
+      mb = p["bytes"] / (1024*1024)
+      print(f"{name:<20s} {p['calls']:>7d} {p['wall']:>10.3f} {100*p['wall']/total:>6.1f}% {mb:>10.2f} {(mb / p['wall'] if p['wall'] > 0 else 0):>9.1f} {p['peak'] / (1024*1024):>16.2f}")
+
+  def saveJson(self,path):
+    with open(path,'w') as fout:
+      json.dump({
+        "phases" : self.phases,
+        "events" : [{"phase" : n, "start" : s, "wall" : w, "bytes" : b, "peak" : p} for n, s, w, b, p in self.events],
+      }, fout, indent=1)
+
+# Profiler for the current run (enabled in main())
+PROFILER = Profiler()
+
 #Verbose printing
 def vprint(*listargs, **kwargs):
   if args.verbose:
@@ -191,89 +400,982 @@ def saveWAVData(fname,data,channels,rate,samplebits):
       fout.writeframes(data)
       # fout.writeframesraw(data)
 
-#Play raw WAV data using PyAudio
-def playWAVData(data,channels,rate,samplebits):
+#Yield successive chunks of raw PCM data holding up to frames audio frames each
+#  chunks are memoryviews of data, so nothing is copied until a chunk is actually played
+def pcmChunks(data,frame_size,frames=PREVIEW_CHUNK_FRAMES):
+  view = memoryview(data)
+  step = max(1, frame_size * frames)
+  for pos in range(0, len(view), step):
+    yield view[pos:pos+step]
+
+#Play an iterable of raw PCM chunks using PyAudio (or just consume them if sink is "null"), returning the number of bytes played
+def playPCMChunks(chunks,channels,rate,width,sink="audio"):
+  if sink == "null":
+    return sum(len(chunk) for chunk in chunks)
   if not "pyaudio" in sys.modules:
-    print("pyaudio not loaded, refusing to play audio")
-    return
-
-  CHUNK        = 256  # Chunk size for streaming audio data
-  BUFFSIZE     = 1024 # Buffer size for streaming audio data
-
-  tmpfile = "/tmp/tmptest.wav"
-  width = samplebits//8
-  with wave.open(tmpfile, "wb") as fout:
-      fout.setnchannels(channels)
-      fout.setsampwidth(width) # number of bytes
-      fout.setframerate(rate)
-      fout.writeframesraw(data)
-
-  with wave.open(tmpfile, "rb") as wf:
-
-    # suppress errors
-    devnull = os.open(os.devnull, os.O_WRONLY)
-    old_stderr = os.dup(2)
-    sys.stderr.flush()
-    os.dup2(devnull, 2)
-    os.close(devnull)
-
-    # open player
-    player = pyaudio.PyAudio()
-
-    # unsuppress errors
-    os.dup2(old_stderr, 2)
-    os.close(old_stderr)
-
-    # open output stream
-    stream = player.open(
-        format   = player.get_format_from_width(width),
-        channels = channels,
-        rate     = rate,
-        output   = True)
-    # playback loop
-    while more := wf.readframes(CHUNK):
-      stream.write(more)
+    print("pyaudio not loaded, refusing to play audio (use --sink null to preview without an audio device)")
+    return 0
+
+  # suppress errors
+  devnull = os.open(os.devnull, os.O_WRONLY)
+  old_stderr = os.dup(2)
+  sys.stderr.flush()
+  os.dup2(devnull, 2)
+  os.close(devnull)
+
+  # open player
+  player = pyaudio.PyAudio()
+
+  # unsuppress errors
+  os.dup2(old_stderr, 2)
+  os.close(old_stderr)
+
+  # open output stream
+  stream = player.open(
+      format            = player.get_format_from_width(width),
+      channels          = channels,
+      rate              = rate,
+      output            = True,
+      frames_per_buffer = PREVIEW_CHUNK_FRAMES)
+  # playback loop
+  played = 0
+  try:
+    for chunk in chunks:
+      stream.write(bytes(chunk))
+      played += len(chunk)
+  finally:
     stream.close()
     player.terminate()
+  return played
+
+#Play raw WAV data using PyAudio
+def playWAVData(data,channels,rate,samplebits):
+  width = samplebits//8
+  playPCMChunks(pcmChunks(data, channels * width), channels, rate, width)
 
 #Get .bnk id from a string using a 32-bit FNV1 hash
 #Modified from https://github.com/znerol/py-fnvhash/blob/master/fnvhash/__init__.py
 #See also
 # - https://www.audiokinetic.com/library/edge/?source=SDK&id=_ak_f_n_v_hash_8h_source.html
 # - https://www.audiokinetic.com/library/edge/?source=SDK&id=namespace_a_k_1_1_sound_engine_a1aae6ebdec25946fb2897ce0e025366d.html#a1aae6ebdec25946fb2897ce0e025366d
-def stringToBnkID(string):
+#  FNV-1 consumes one byte at a time, so passing the hash of a prefix as hval continues hashing from the end of that prefix
+def stringToBnkID(string, hval=FNV_32_INIT):
     data = string.lower().encode()
-    hval = FNV_32_INIT
     for byte in data:
-        hval = (hval * FNV_32_PRIME) % FNV_32_MOD
-        hval = hval ^ byte
+        hval = ((hval * FNV_32_PRIME) % FNV_32_MOD) ^ byte
     return hval
 
-#Check header of file and see if it matches wav signature
-def isWaveFile(path):
+#Get .bnk ids for several strings sharing a common prefix, hashing the prefix only once
+def stringsToBnkIDs(prefix, suffixes):
+  base = stringToBnkID(prefix)
+  return [stringToBnkID(suffix, base) for suffix in suffixes]
+
+# Registry of every id used in a bank, which fails fast when two different names share an id
+class BnkIdRegistry(object):
+  def __init__(self):
+    self.owners = {} #id -> (name, source) of whatever first claimed the id
+
+  #claim an id for a name; source is where the name came from (e.g., a wav file) and is used for error messages
+  def register(self,bnkid,name,source=None):
+    owner = self.owners.get(bnkid, None)
+    if owner is None:
+      self.owners[bnkid] = (name, source)
+    elif owner[0].lower() != name.lower() or owner[1] != source:
+      raise Exception(f"id {col.CRT}{bnkid}{col.BLN} for '{name}' ({source}) clashes with '{owner[0]}' ({owner[1]})")
+    return bnkid
+
+  #register every id in a dict of {kind : id} generated for the same source
+  #  ids generated directly from names are also checked against the name dictionary for hash collisions with known names
+  def registerAll(self,ids,names,source=None):
+    for kind, bnkid in ids.items():
+      name  = names.get(kind, kind)
+      known = ID_NAMES.get(bnkid) if kind in EMBED_ID_SUFFIXES else None
+      if known is not None and known.lower() != name.lower():
+        warn(f"WARNING: id {bnkid} for '{name}' ({source}) is also the id of known name '{known}'")
+      self.register(bnkid, name, source)
+
+  #load a list of ids already used by the base game (one id, name, or "id name" per line)
+  def loadVanillaIds(self,path):
+    with open(path,'r') as fin:
+      for line in fin:
+        tokens = line.replace(","," ").split()
+        if len(tokens) == 0 or tokens[0].startswith("#"):
+          continue
+        if tokens[0].isdigit():
+          bnkid = int(tokens[0])
+          name  = " ".join(tokens[1:]) or ID_NAMES.get(bnkid, f"vanilla id {bnkid}")
+        else:
+          name  = tokens[0]
+          bnkid = stringToBnkID(name)
+        self.register(bnkid, name, "vanilla")
+    return self
+
+#Compute the SHA-1 hash of a file's contents in fixed-size blocks
+def hashFile(path,blocksize=COPY_BLOCK_SIZE):
+  h = hashlib.sha1()
+  with open(path,'rb') as fin:
+    while block := fin.read(blocksize):
+      h.update(block)
+  return h.hexdigest()
+
+# Write-only stream that hashes everything written to it instead of storing it
+class HashSink(object):
+  def __init__(self):
+    self.h = hashlib.sha1()
+
+  def write(self,data):
+    self.h.update(data)
+    return len(data)
+
+  def hexdigest(self):
+    return self.h.hexdigest()
+
+# Find the first offset at which two buffers differ, comparing them a block at a time (None if they're identical)
+#   if one buffer is a prefix of the other, they differ at the end of the shorter one
+def firstDifference(a,b,blocksize=COPY_BLOCK_SIZE):
+  a, b = memoryview(a).cast("B"), memoryview(b).cast("B")
+  n    = min(len(a), len(b))
+  for pos in range(0, n, blocksize):
+    x, y = bytes(a[pos:pos+blocksize]), bytes(b[pos:pos+blocksize]) # comparing bytes is much faster than comparing memoryviews
+    if x != y:
+      return pos + next(i for i in range(len(x)) if x[i] != y[i])
+  return None if len(a) == len(b) else n
+
+# Write-only stream that compares everything written to it against existing data (e.g., a memory-mapped bank) instead of storing it
+#   sections is a list of (name, start, end) byte ranges, and the first differing offset within each one is recorded in diffs (keyed by index)
+class CompareSink(object):
+  def __init__(self,data,sections):
+    self.view     = memoryview(data)
+    self.sections = sections + [("past end of file", len(self.view), math.inf)]
+    self.pos      = 0
+    self.diffs    = {}
+
+  def write(self,data):
+    data = memoryview(data).cast("B")
+    end  = self.pos + len(data)
+    for i, (name, start, stop) in enumerate(self.sections):
+      if i in self.diffs or stop <= self.pos or start >= end:
+        continue
+      lo, hi = max(start, self.pos), min(stop, end)
+      off    = firstDifference(self.view[lo:hi], data[lo-self.pos:hi-self.pos])
+      if off is not None:
+        self.diffs[i] = lo + off
+    self.pos = end
+    return len(data)
+
+  #note a difference if less was written than the data we're comparing against
+  def finish(self):
+    for i, (name, start, stop) in enumerate(self.sections):
+      if start <= self.pos < min(stop, len(self.view)) and i not in self.diffs:
+        self.diffs[i] = self.pos
+    self.view.release()
+
+#Compute the SHA-1 hash of a buffer or FileSlice in fixed-size blocks
+#  hashlib releases the GIL while hashing large blocks, so several of these can run in parallel threads
+def hashChunked(data,blocksize=COPY_BLOCK_SIZE):
+  sink = HashSink()
+  if isinstance(data,FileSlice):
+    data.copyTo(sink, blocksize)
+  else:
+    view = memoryview(data).cast("B")
+    for pos in range(0, len(view), blocksize):
+      sink.write(view[pos:pos+blocksize])
+  return sink.hexdigest()
+
+# Header information for a wav file, read without loading any of its samples
+class WavManifest(object):
+  __slots__ = ("path", "size", "mtime_ns", "format_tag", "channels", "rate", "sampwidth", "block_align", "frames", "data_offset", "data_size", "extra_chunks")
+
+  def __init__(self,path):
+    self.path         = path
+    self.size         = 0
+    self.mtime_ns     = 0
+    self.format_tag   = 0    # 1 == PCM (WAVE_FORMAT_EXTENSIBLE files use the format tag of their subformat)
+    self.channels     = 0
+    self.rate         = 0
+    self.sampwidth    = 0    # bytes per sample
+    self.block_align  = 0    # bytes per frame, as stored in the fmt chunk
+    self.frames       = 0
+    self.data_offset  = 0    # byte offset of the first sample in the file
+    self.data_size    = 0    # bytes of sample data in the file (frames * channels * sampwidth)
+    self.extra_chunks = []   # ids of any chunks other than fmt and data
+
+  def __repr__(self):
+    return f"WavManifest({self.path}: {self.channels}ch {self.rate}hz {self.sampwidth*8}bit, {self.frames} frames @ {self.data_offset})"
+
+WAVE_FORMAT_PCM        = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+WAV_FMT_LAYOUT = struct.Struct("<HHIIHH")
+
+#Read the RIFF header and fmt chunk of a wav file, returning a WavManifest (or None if the file isn't a wav file at all)
+#  st may be an existing os.stat() result for the file (e.g., from os.scandir()) to avoid another stat call
+#  wav files missing their fmt or data chunk are skipped with a warning, or raise an exception if strict is True (e.g., for --check)
+def readWavManifest(path,st=None,strict=False):
+  m = WavManifest(path)
+  if st is None:
+    st = os.stat(path)
+  m.size, m.mtime_ns = st.st_size, st.st_mtime_ns
   try:
     with open(path,'rb') as fin:
-      header = fin.read()[:12]
-    if not (header[:4] == b'RIFF'):
-      return False
-    if not (header[8:] == b'WAVE'):
-      return False
-    return True
-  except Exception:
-    return False #if anything goes wrong, assume its not a valid wave file
+      header = fin.read(12)
+      if not (header[:4] == b'RIFF' and header[8:] == b'WAVE'):
+        return None
+      pos      = 12
+      has_fmt  = False
+      has_data = False
+      while pos + 8 <= m.size:
+        fin.seek(pos)
+        chunkid, chunksize = struct.unpack('<4sI', fin.read(8))
+        pos += 8
+        if chunkid == b'fmt ' and not has_fmt:
+          fmt = fin.read(min(chunksize, 40))
+          m.format_tag, m.channels, m.rate, _, m.block_align, bits = WAV_FMT_LAYOUT.unpack_from(fmt)
+          if m.format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            m.format_tag = struct.unpack_from('<H', fmt, 24)[0] # first two bytes of the subformat GUID
+          m.sampwidth = (bits + 7) // 8
+          has_fmt     = True
+        elif chunkid == b'data' and not has_data:
+          m.data_offset = pos
+          m.data_size   = min(chunksize, m.size - pos) # truncated files only contain as many samples as fit
+          has_data      = True
+        else:
+          m.extra_chunks.append(chunkid.decode('latin-1'))
+        pos += chunksize + (chunksize & 1) # chunks are padded to even sizes
+  except (OSError, struct.error):
+    return None #if anything goes wrong reading the header, assume its not a valid wave file
+  if not (has_fmt and has_data):
+    missing = "fmt" if not has_fmt else "data"
+    if strict:
+      raise Exception(f"{path} has no {missing} chunk")
+    warn(f"WARNING: skipping {path}, which has no {missing} chunk")
+    return None
+  framesize = m.channels * m.sampwidth
+  if framesize > 0:
+    m.frames    = m.data_size // framesize
+    m.data_size = m.frames * framesize
+  return m
+
+# Bump whenever normalizeSamples(), silenceBounds() or downmixSamples() change so previously cached conversions aren't reused
+NORMALIZE_VERSION = 3
+
+# Mono sounds with lower sample rates than this have been known to be pitch shifted in game
+MIN_MONO_RATE = 16000
+
+#Get a string identifying normalization settings, used to tell whether cached conversions / bank entries are still valid
+def normalizeKey(normalize):
+  if normalize is None:
+    return None
+  return f"v{NORMALIZE_VERSION} convert={normalize['convert']} rate={normalize['rate']} trim={normalize['trim_db']} downmix={normalize['downmix']}"
+
+#Check whether a wav file needs converting to be embedded as 16-bit stereo PCM at the target rate (0 == any rate)
+def needsNormalizing(m,rate=0):
+  return not (m.format_tag == WAVE_FORMAT_PCM and m.sampwidth == 2 and m.channels == 2 and rate in [0, m.rate])
+
+#Decode raw sample data from a wav file into an int16 array of shape (frames, channels)
+def decodeWavSamples(m,data):
+  if m.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+    x = np.frombuffer(data, dtype='<f4' if m.sampwidth == 4 else '<f8')
+    x = np.round(np.clip(x, -1.0, 1.0) * 32767).astype(np.int16)
+  elif m.format_tag != WAVE_FORMAT_PCM:
+    raise Exception(f"{m.path} has unsupported format {m.format_tag}, only PCM and floating point wave files can be converted")
+  elif m.sampwidth == 1: # 8-bit wav data is unsigned
+    x = ((np.frombuffer(data, dtype=np.uint8).astype(np.int16) - 128) << 8).astype(np.int16)
+  elif m.sampwidth == 2:
+    x = np.frombuffer(data, dtype='<i2')
+  else: # keep the two most significant bytes of 24-bit / 32-bit samples
+    x = np.frombuffer(data, dtype=np.uint8).reshape(-1, m.sampwidth)[:, -2:].copy().view('<i2').reshape(-1)
+  return x.reshape(-1, m.channels)
+
+#Convert int16 samples of shape (frames, channels) to true stereo at the target rate (0 == keep rate)
+#  resampling uses linear interpolation, which is plenty for game sound effects
+def normalizeSamples(x,rate,target_rate=0):
+  if x.shape[1] == 1:
+    x = np.repeat(x, 2, axis=1)
+  elif x.shape[1] > 2:
+    x = x[:, :2] # front left / right
+  if target_rate not in [0, rate] and len(x) > 0:
+    n = max(1, round(len(x) * target_rate / rate))
+    t = np.arange(n) * (rate / target_rate)
+    s = np.arange(len(x))
+    x = np.stack([np.round(np.interp(t, s, x[:, c])) for c in range(2)], axis=1).astype(np.int16)
+  return np.ascontiguousarray(x, dtype='<i2')
+
+#Find the range of frames left after trimming leading and trailing frames whose samples are all quieter than threshold_db dBFS
+#  from int16 samples of shape (frames, channels), returning (start, end)
+#  at least one frame is always kept so fully silent files still produce a valid sound
+def silenceBounds(x,threshold_db):
+  if len(x) == 0:
+    return 0, 0
+  threshold = 32768.0 * (10 ** (threshold_db / 20))
+  loud      = np.flatnonzero(np.abs(x.astype(np.int32)).max(axis=1) > threshold)
+  if len(loud) == 0:
+    return 0, 1
+  return loud[0], loud[-1]+1
+
+#Downmix stereo samples of shape (frames, 2, ...) to mono if both channels are identical
+def downmixSamples(x):
+  if x.shape[1] == 2 and np.array_equal(x[:, 0], x[:, 1]):
+    return x[:, :1]
+  return x
+
+#Convert a wav file according to the normalization settings, returning a WavManifest for the converted file
+#  normalize["convert"]: convert to 16-bit stereo PCM at normalize["rate"]
+#  normalize["trim_db"]: trim leading / trailing silence below this many dBFS (None == don't trim)
+#  normalize["downmix"]: store stereo files with identical channels as mono
+#  converted files are named after a hash of the original file's contents and the settings, so they're only converted once;
+#  files trimming / downmixing doesn't change are remembered with an empty .same file so they aren't decoded again
+def normalizeWav(m,normalize):
+  convert = normalize["convert"] and needsNormalizing(m, normalize["rate"])
+  downmix = normalize["downmix"] and not normalize["convert"] and m.channels == 2 and m.rate >= MIN_MONO_RATE # converted files are always stereo
+  shrink  = normalize["trim_db"] is not None or downmix
+  if not (convert or shrink):
+    return m
+  if not "numpy" in sys.modules:
+    raise Exception("numpy not loaded, refusing to convert audio (install numpy to use --normalize, --trim or --downmix)")
+  h = hashlib.sha1(normalizeKey(normalize).encode())
+  with open(m.path,'rb') as fin:
+    while block := fin.read(COPY_BLOCK_SIZE):
+      h.update(block)
+  outfile = os.path.join(normalize["cachedir"], h.hexdigest() + ".wav")
+  if os.path.exists(outfile + ".same"):
+    return m
+  if not os.path.exists(outfile):
+    rate  = m.rate
+    data  = FileSlice(m.path, m.data_offset, m.data_size).read()
+    x     = decodeWavSamples(m, data)
+    y     = x # samples that are written out
+    width = 2
+    if normalize["convert"]:
+      rate = normalize["rate"] or m.rate
+      x    = normalizeSamples(x, m.rate, rate)
+      y    = x
+    elif m.format_tag == WAVE_FORMAT_PCM: # only trimming / downmixing, so keep the original samples (and sample width)
+      y     = np.frombuffer(data, dtype=np.uint8).reshape(m.frames, m.channels, m.sampwidth)
+      width = m.sampwidth
+    if normalize["trim_db"] is not None:
+      start, end = silenceBounds(x, normalize["trim_db"])
+      y          = y[start:end]
+    if downmix:
+      y = downmixSamples(y)
+    os.makedirs(normalize["cachedir"], exist_ok=True)
+    if not convert and y.shape[:2] == (m.frames, m.channels):
+      open(outfile + ".same", 'wb').close()
+      return m
+    # identical files share a cache name, so parallel workers may be converting the same file; each writes its own temp file
+    fd, tmpfile = tempfile.mkstemp(dir=normalize["cachedir"], suffix=".tmp")
+    try:
+      with os.fdopen(fd, 'wb') as fraw, wave.open(fraw, 'wb') as fout:
+        fout.setnchannels(y.shape[1])
+        fout.setsampwidth(width)
+        fout.setframerate(rate)
+        fout.writeframes(np.ascontiguousarray(y if y.dtype == np.uint8 else y.astype('<i2')).tobytes())
+      os.replace(tmpfile, outfile)
+    except OSError:
+      if os.path.exists(tmpfile):
+        os.remove(tmpfile)
+      if not os.path.exists(outfile): # fine if another worker just saved the same conversion (e.g., the replace failed on Windows)
+        raise
+    except BaseException:
+      if os.path.exists(tmpfile):
+        os.remove(tmpfile)
+      raise
+    vprint(f"      >> converted {m.path} ({m.channels}ch {m.rate}hz {m.sampwidth*8}bit {m.frames} frames) to {outfile} ({y.shape[1]}ch {rate}hz {width*8}bit {len(y)} frames)")
+  return readWavManifest(outfile)
+
+# Number of frames read at a time when measuring loudness
+ANALYSIS_CHUNK_FRAMES = 1 << 18
+
+#Convert a linear level (1.0 == full scale) to dBFS, or None for silence
+def toDb(level):
+  return round(20 * math.log10(level), 2) if level > 0 else None
+
+#Measure the RMS and peak levels of a wav file in dBFS, reading its samples in chunks so long files aren't loaded all at once
+def analyzeWav(m):
+  sumsq     = 0.0
+  peak      = 0
+  nsamples  = 0
+  chunk     = ANALYSIS_CHUNK_FRAMES * m.channels * m.sampwidth
+  remaining = m.data_size
+  with open(m.path,'rb') as fin:
+    fin.seek(m.data_offset)
+    while remaining > 0:
+      data = fin.read(min(chunk, remaining))
+      if len(data) == 0:
+        break
+      remaining -= len(data)
+      x         = decodeWavSamples(m, data).ravel().astype(np.float64)
+      sumsq    += float(np.dot(x, x))
+      peak      = max(peak, float(np.abs(x).max()) if len(x) > 0 else 0)
+      nsamples += len(x)
+  rms = math.sqrt(sumsq / nsamples) if nsamples > 0 else 0
+  return {"rms_db" : toDb(rms / 32768), "peak_db" : toDb(peak / 32768)}
+
+#Suggest a volume offset in dB that brings a sound's RMS level to target_db without pushing its peak above -1 dBFS
+def suggestVolume(analysis,target_db):
+  if analysis["rms_db"] is None:
+    return 0.0
+  return round(min(target_db - analysis["rms_db"], -1.0 - analysis["peak_db"]), 1)
+
+#Measure the loudness of wav files with up to jobs threads, returning {sound name : analysis}
+#  results are cached in cachefile keyed by each file's hash, so unchanged files are never measured twice
+def analyzeWavs(wavs,jobs=1,cachefile=None):
+  if not "numpy" in sys.modules:
+    raise Exception("numpy not loaded, refusing to analyze audio (install numpy to use --analyze)")
+  cache = {"version" : 1, "files" : {}, "results" : {}}
+  if cachefile is not None and os.path.exists(cachefile):
+    with open(cachefile,'r') as fin:
+      cache = json.load(fin)
+
+  # analyze one file, returning its path, size, mtime, hash, and results
+  def analyze(m):
+    f = cache["files"].get(os.path.abspath(m.path), None)
+    if f is not None and f["size"] == m.size and f["mtime_ns"] == m.mtime_ns:
+      sha1 = f["sha1"]
+    else:
+      sha1 = hashFile(m.path)
+    result = cache["results"].get(sha1, None)
+    if result is None:
+      result = analyzeWav(m)
+    return m, sha1, result
+
+  analysis = {}
+  with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool: # numpy releases the GIL for the heavy lifting
+    for m, sha1, result in pool.map(analyze, wavs):
+      cache["files"][os.path.abspath(m.path)] = {"size" : m.size, "mtime_ns" : m.mtime_ns, "sha1" : sha1}
+      cache["results"][sha1] = result
+      analysis[os.path.splitext(os.path.basename(m.path))[0]] = result
+  if cachefile is not None:
+    os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+    with open(cachefile,'w') as fout:
+      json.dump(cache, fout)
+  return analysis
+
+#Get the path of a wav file from either a path or a WavManifest
+def wavPath(wav):
+  return wav.path if isinstance(wav, WavManifest) else wav
+
+# Event names from the base game whose ids are known
+KNOWN_GUNGEON_NAMES = [
+  "STOP_MUS_ALL",                  # 3649037401
+  "Play_MUS_Boss_Theme_Beholster", # 1075162602
+  "SFX",                           # 393239870, language id of the base game's banks
+]
+
+# Persistent dictionary mapping .bnk ids back to the names they were hashed from
+#   Stored as a sorted array of uint32 ids, an array of offsets into a string table, and the string table itself,
+#   so loading is a couple of array copies and lookups are a binary search
+#   File layout: magic, version, count, ids[count], offsets[count+1], utf-8 strings
+class NameDictionary(object):
+  magic   = b'BNKNAMES'
+  version = 1
+  header  = struct.Struct("<8sII")
+
+  def __init__(self):
+    self.ids     = array.array('I')
+    self.offsets = array.array('I', [0])
+    self.strings = b''
+    self.added   = {} #names added since loading, keyed by id
+
+  def __len__(self):
+    return len(self.ids) + len(self.added)
+
+  def __contains__(self,bnkid):
+    return self.get(bnkid) is not None
+
+  def __getitem__(self,bnkid):
+    name = self.get(bnkid)
+    if name is None:
+      raise KeyError(bnkid)
+    return name
+
+  def get(self,bnkid,default=None):
+    name = self.added.get(bnkid, None)
+    if name is not None:
+      return name
+    i = bisect.bisect_left(self.ids, bnkid)
+    if i < len(self.ids) and self.ids[i] == bnkid:
+      return self.strings[self.offsets[i]:self.offsets[i+1]].decode('utf-8')
+    return default
+
+  #add a name (if its id isn't already named), returning its id
+  def add(self,name):
+    bnkid = stringToBnkID(name)
+    if bnkid not in self:
+      self.added[bnkid] = name
+    return bnkid
+
+  def addMany(self,names):
+    n = len(self)
+    for name in names:
+      self.add(name)
+    return len(self) - n
+
+  #add every name from a word list (one name per line) or a spreadsheet (.csv, names in the first column)
+  #  names from spreadsheets are sound names, so the names of every event generated for them are added as well
+  def addFromFile(self,path):
+    if not path.endswith(".csv"):
+      with open(path,'r') as fin:
+        return self.addMany(line.strip() for line in fin if line.strip() and not line.startswith("#"))
+    names = []
+    for base_fname in loadSoundParamsFromCSV(path):
+      names.extend(base_fname + suffix for suffix in EMBED_ID_SUFFIXES.values())
+    return self.addMany(names)
+
+  def load(self,path):
+    with open(path,'rb') as fin:
+      data = fin.read()
+    if len(data) < self.header.size:
+      raise Exception(f"{path} is not a name dictionary")
+    magic, version, count = self.header.unpack_from(data)
+    if magic != self.magic or version != self.version or len(data) < self.header.size + 4*(2*count+1): # ids and offsets must be complete
+      raise Exception(f"{path} is not a name dictionary")
+    pos          = self.header.size
+    self.ids     = array.array('I', data[pos:pos+4*count])
+    pos         += 4*count
+    self.offsets = array.array('I', data[pos:pos+4*(count+1)])
+    pos         += 4*(count+1)
+    self.strings = data[pos:]
+    if sys.byteorder == "big":
+      self.ids.byteswap()
+      self.offsets.byteswap()
+    return self
 
-#Scan a directory for valid wav files
-def findWavsInDirectory(path,recursive=False):
+  #save all names, including any added since loading, to a new sorted file
+  def save(self,path):
+    names   = {bnkid : self.get(bnkid) for bnkid in self.ids}
+    names.update(self.added)
+    ids     = array.array('I', sorted(names))
+    offsets = array.array('I', [0])
+    strings = bytearray()
+    for bnkid in ids:
+      strings += names[bnkid].encode('utf-8')
+      offsets.append(len(strings))
+    if sys.byteorder == "big":
+      ids.byteswap()
+      offsets.byteswap()
+    with open(path+".tmp",'wb') as fout:
+      fout.write(self.header.pack(self.magic, self.version, len(ids)))
+      fout.write(ids.tobytes())
+      fout.write(offsets.tobytes())
+      fout.write(strings)
+    os.replace(path+".tmp", path)
+    return self
+
+# Names used to label ids in bank dumps, extracted files, and error messages (loaded in main())
+ID_NAMES = NameDictionary()
+ID_NAMES.addMany(KNOWN_GUNGEON_NAMES)
+
+#Label an id with its name from the name dictionary (if known)
+def labelId(x):
+  if isinstance(x,int) and not isinstance(x,bool):
+    name = ID_NAMES.get(x % FNV_32_MOD, None) # signed ids are stored as unsigned in the dictionary
+    if name is not None:
+      return f"{x} ({name})"
+  return x
+
+#Check whether a value matches an expected value, or is one of a list / set / dict of expected values
+#  large collections of expected values (e.g., every WEM id in a bank) should be sets or dicts so lookups stay O(1)
+def isExpected(x,val):
+  return (x == val) or (isinstance(val,(list,set,frozenset,dict)) and x in val)
+
+#Describe an expected value for error messages without printing huge collections
+def describeExpected(val):
+  if isinstance(val,(set,frozenset,dict)) or (isinstance(val,list) and len(val) > 8):
+    return f"one of {len(val)} known values"
+  return val
+
+# Lazy reference to a range of bytes within a file, copied in blocks when written out
+class FileSlice(object):
+  def __init__(self,path,offset,size):
+    self.path   = path
+    self.offset = offset
+    self.size   = size
+
+  def __len__(self):
+    return self.size
+
+  #load the entire range into memory
+  def read(self):
+    with open(self.path,'rb') as fin:
+      fin.seek(self.offset)
+      return fin.read(self.size)
+
+  #copy the range to an open file in fixed-size blocks, returning the number of bytes copied
+  def copyTo(self,fout,blocksize=COPY_BLOCK_SIZE):
+    buf       = bytearray(min(blocksize, max(self.size, 1)))
+    remaining = self.size
+    with open(self.path,'rb') as fin:
+      fin.seek(self.offset)
+      while remaining > 0:
+        view = memoryview(buf)[:min(remaining, len(buf))]
+        n    = fin.readinto(view)
+        if n == 0:
+          raise Exception(f"unexpected end of file while copying from {self.path}")
+        fout.write(view[:n])
+        remaining -= n
+    return self.size
+
+# Read-only stream over a buffer (e.g., a memory-mapped file) that returns memoryview slices instead of copying data
+class BufferStream(object):
+  def __init__(self,data):
+    self.view = memoryview(data)
+    self.pos  = 0
+
+  def read(self,n):
+    x         = self.view[self.pos:self.pos+n]
+    self.pos += len(x)
+    return x
+
+  def tell(self):
+    return self.pos
+
+  def seek(self,pos,whence=0):
+    if whence == 1:
+      pos += self.pos
+    elif whence == 2:
+      pos += len(self.view)
+    self.pos = max(0, min(pos, len(self.view)))
+    return self.pos
+
+  def getvalue(self):
+    return self.view
+
+#List the .wav files in a directory as (path, os.stat() result) pairs without opening any of them
+def listWavFiles(path,recursive=False,exts=(".wav",)):
+  files = []
+  with os.scandir(path) as it:
+    entries = sorted(it, key=lambda e: e.name)
+  for e in entries:
+    p = os.path.join(path,e.name)
+    if recursive and e.is_dir() and not e.name.startswith("."): # skip hidden folders (e.g., our own .wavcache)
+      files.extend(listWavFiles(p,True,exts))
+    if not (e.name.endswith(exts) and e.is_file()):
+      continue
+    files.append((p, e.stat()))
+  return files
+
+#Scan a directory for valid wav (and Ogg Vorbis) files, returning a WavManifest for each
+#  .ogg files are only included if ogg is True, and never when a .wav file has the same name
+def findWavsInDirectory(path,recursive=False,ogg=False):
   wavs_to_parse = []
-  for f in sorted(os.listdir(path)):
-    p = os.path.join(path,f)
-    if os.path.isdir(p) and recursive:
-      wavs_to_parse.extend(findWavsInDirectory(p,True))
-    if not (p.endswith(".wav") and isWaveFile(p)):
+  files         = listWavFiles(path, recursive, exts=AUDIO_FILE_EXTS)
+  wavnames      = {os.path.splitext(os.path.basename(p))[0].lower() for p, _ in files if p.endswith(".wav")}
+  skipped       = []
+  for p, st in files:
+    if p.endswith(".ogg"):
+      if ogg and os.path.splitext(os.path.basename(p))[0].lower() in wavnames:
+        warn(f"WARNING: skipping {p}, using the .wav file with the same name instead")
+        continue
+      if not ogg:
+        skipped.append(p)
+        continue
+    m = readOggManifest(p, st) if p.endswith(".ogg") else readWavManifest(p, st)
+    if m is None:
       continue
-    wavs_to_parse.append(p)
+    wavs_to_parse.append(m)
+  if skipped:
+    warn(f"WARNING: skipping {len(skipped)} .ogg files (pass --ogg to embed them)")
+    for p in skipped:
+      vprint(f"  >> skipped {p}")
   return wavs_to_parse
 
+# Format tag for Vorbis-encoded WEM files (compression code -1), also used for the manifests of .ogg files
+WAVE_FORMAT_WWISE_VORBIS = 0xFFFF
+OGG_PAGE_HEADER          = struct.Struct("<4sBBqIIIB") # capture pattern, version, flags, granule, serial, sequence, crc, segments
+VORBIS_CODEBOOK_SYNC     = 0x564342
+
+# Wwise describes channel layouts with packed AkChannelConfig values (channel count | config type << 8 | channel mask << 12)
+WWISE_CHANNEL_CONFIGS = {
+  1 : 16641, # 0x4101: 1 channel, standard config, front center
+  2 : 12546, # 0x3102: 2 channels, standard config, front left + front right
+}
+
+# Values copied from the vanilla Beholster theme (stereo, 44100hz, blocksizes 2^8 / 2^11, aoTuV 6.03 codebooks)
+#   Wwise doesn't document how the decoder allocation sizes are computed, so we reuse ones known to work for that setup
+WWISE_VORBIS_CODEBOOK_HASH  = 2840645231
+WWISE_VORBIS_DECODE_ALLOC   = 13300
+WWISE_VORBIS_DECODE_ALLOC64 = 13716
+WWISE_VORBIS_BLOCKSIZES     = (8, 11)
+
+# Read bits least significant bit first, as Vorbis packs them
+class BitReader(object):
+  def __init__(self,data):
+    self.data = data
+    self.pos  = 0 # in bits
+
+  def read(self,n):
+    if n == 0:
+      return 0
+    start, end = self.pos >> 3, (self.pos + n + 7) >> 3
+    if end > len(self.data):
+      raise Exception("unexpected end of Vorbis packet")
+    x         = int.from_bytes(self.data[start:end], 'little') >> (self.pos & 7)
+    self.pos += n
+    return x & ((1 << n) - 1)
+
+# Write bits least significant bit first, as Vorbis packs them
+class BitWriter(object):
+  def __init__(self):
+    self.value = 0
+    self.nbits = 0
+
+  def write(self,x,n):
+    self.value |= (x & ((1 << n) - 1)) << self.nbits
+    self.nbits += n
+
+  def getvalue(self):
+    return self.value.to_bytes((self.nbits + 7) // 8, 'little')
+
+#Number of bits needed to store x (Vorbis' ilog())
+def ilog(x):
+  return x.bit_length() if x > 0 else 0
+
+#Number of lookup values in a type 1 Vorbis codebook (the largest r such that r ** dims <= entries)
+def lookup1Values(entries,dims):
+  r = int(round(entries ** (1.0 / dims)))
+  while (r + 1) ** dims <= entries:
+    r += 1
+  while r > 0 and r ** dims > entries:
+    r -= 1
+  return r
+
+#Read the codeword lengths of an ordered Vorbis codebook (stored the same way in Ogg and Wwise codebooks)
+def readOrderedLengths(br,entries):
+  lengths = []
+  length  = br.read(5) + 1
+  while len(lengths) < entries:
+    lengths.extend([length] * br.read(ilog(entries - len(lengths))))
+    length += 1
+  if len(lengths) > entries:
+    raise Exception("invalid ordered Vorbis codebook")
+  return lengths
+
+#Read the value lookup table of a Vorbis codebook, returning (min, delta, value bits, sequence flag, values) or None
+def readCodebookLookup(br,lookup_type,entries,dims):
+  if lookup_type == 0:
+    return None
+  if lookup_type not in [1,2]:
+    raise Exception(f"invalid Vorbis codebook lookup type {lookup_type}")
+  minv, delta, bits, seq = br.read(32), br.read(32), br.read(4) + 1, br.read(1)
+  n = lookup1Values(entries, dims) if lookup_type == 1 else entries * dims
+  return (minv, delta, bits, seq, tuple(br.read(bits) for _ in range(n)))
+
+#Read a codebook from a standard Vorbis setup header, returning a key describing its contents independent of how it was packed
+def readVorbisCodebook(br):
+  if br.read(24) != VORBIS_CODEBOOK_SYNC:
+    raise Exception("invalid Vorbis codebook sync pattern")
+  dims, entries = br.read(16), br.read(24)
+  if br.read(1): # ordered
+    lengths = readOrderedLengths(br, entries)
+  else:
+    sparse  = br.read(1)
+    lengths = [0 if (sparse and not br.read(1)) else br.read(5) + 1 for _ in range(entries)]
+  lookup_type = br.read(4)
+  return (dims, entries, tuple(lengths), lookup_type, readCodebookLookup(br, lookup_type, entries, dims))
+
+#Read a codebook packed in Wwise's format (as found in ww2ogg's codebook libraries), returning the same key as readVorbisCodebook()
+def readWwiseCodebook(br):
+  dims, entries = br.read(4), br.read(14)
+  if br.read(1): # ordered
+    lengths = readOrderedLengths(br, entries)
+  else:
+    length_bits, sparse = br.read(3), br.read(1)
+    if length_bits == 0 or length_bits > 5:
+      raise Exception("invalid Wwise codebook codeword length")
+    lengths = [0 if (sparse and not br.read(1)) else br.read(length_bits) + 1 for _ in range(entries)]
+  lookup_type = br.read(1)
+  return (dims, entries, tuple(lengths), lookup_type, readCodebookLookup(br, lookup_type, entries, dims))
+
+# Codebook libraries loaded so far, keyed by path
+_CODEBOOK_LIBRARIES = {}
+
+#Load a packed codebook library in ww2ogg's format (e.g., packed_codebooks_aoTuV_603.bin), returning a dict of codebook key -> codebook id
+#  the file is every codebook packed back to back, followed by a table of uint32 offsets whose own offset is stored in the last 4 bytes
+def loadCodebookLibrary(path):
+  if path in _CODEBOOK_LIBRARIES:
+    return _CODEBOOK_LIBRARIES[path]
+  if not os.path.exists(path):
+    raise Exception(f"codebook library {path} not found; embedding .ogg files needs ww2ogg's packed_codebooks_aoTuV_603.bin (put it next to this script or pass it with --codebooks)")
+  with open(path,'rb') as fin:
+    data = fin.read()
+  table   = struct.unpack_from('<I', data, len(data) - 4)[0]
+  offsets = struct.unpack_from(f"<{(len(data) - table) // 4}I", data, table)
+  library = {}
+  for i in range(len(offsets) - 1):
+    try:
+      key = readWwiseCodebook(BitReader(data[offsets[i]:offsets[i+1]]))
+    except Exception:
+      continue # unused slots in the library are empty
+    library.setdefault(key, i)
+  _CODEBOOK_LIBRARIES[path] = library
+  return library
+
+#Split an Ogg bitstream into packets, returning (packets, granule position of the last page)
+#  only a single logical stream is supported, and page checksums aren't verified
+def readOggPackets(data):
+  packets = []
+  partial = []
+  granule = 0
+  serial  = None
+  pos     = 0
+  while pos < len(data):
+    if len(data) - pos < OGG_PAGE_HEADER.size:
+      raise Exception("truncated Ogg page")
+    capture, version, flags, page_granule, page_serial, _, _, nsegs = OGG_PAGE_HEADER.unpack_from(data, pos)
+    if capture != b'OggS' or version != 0:
+      raise Exception(f"invalid Ogg page at byte {pos}")
+    if serial is None:
+      serial = page_serial
+    elif page_serial != serial:
+      raise Exception("chained or multiplexed Ogg files are not supported")
+    lacing = data[pos+OGG_PAGE_HEADER.size:pos+OGG_PAGE_HEADER.size+nsegs]
+    pos   += OGG_PAGE_HEADER.size + nsegs
+    for n in lacing:
+      partial.append(data[pos:pos+n])
+      pos += n
+      if n < 255: # a lacing value under 255 ends the packet
+        packets.append(b''.join(partial))
+        partial = []
+    if page_granule != -1:
+      granule = page_granule
+  if partial:
+    packets.append(b''.join(partial))
+  return packets, granule
+
+#Parse a Vorbis identification header, returning (channels, rate, nominal bitrate, blocksize 0 exponent, blocksize 1 exponent)
+def readVorbisIdHeader(packet):
+  if packet[:7] != b'\x01vorbis' or len(packet) < 30:
+    raise Exception("missing Vorbis identification header (only Ogg Vorbis files are supported)")
+  version, channels, rate, _, bitrate, _, blocksizes = struct.unpack_from('<IBIiiiB', packet, 7)
+  if version != 0:
+    raise Exception(f"unsupported Vorbis version {version}")
+  return channels, rate, bitrate, blocksizes & 0x0F, blocksizes >> 4
+
+#Convert a standard Vorbis setup header to the stripped setup packet Wwise expects, returning (wwise setup packet, mode block flags)
+#  Wwise leaves out the packet header, time domain transforms, and the floor / mapping / window / transform type fields,
+#  shrinks residue types to 2 bits, and replaces each codebook with its 10-bit id in the codebook library
+def convertVorbisSetup(packet,channels,library):
+  if packet[:7] != b'\x05vorbis':
+    raise Exception("missing Vorbis setup header")
+  br = BitReader(packet[7:])
+  bw = BitWriter()
+  def copy(n):
+    x = br.read(n)
+    bw.write(x, n)
+    return x
+
+  ncodebooks = copy(8) + 1
+  for i in range(ncodebooks):
+    key = readVorbisCodebook(br)
+    if key not in library:
+      raise Exception(f"codebook {i} isn't in the codebook library (encode with libvorbis / aoTuV, or pass a matching library with --codebooks)")
+    bw.write(library[key], 10)
+
+  for _ in range(br.read(6) + 1):
+    if br.read(16) != 0:
+      raise Exception("invalid Vorbis time domain transform")
+
+  for _ in range(copy(6) + 1):
+    if br.read(16) != 1:
+      raise Exception("Vorbis floor type 0 is not supported by Wwise")
+    partitions = copy(5)
+    classes    = [copy(4) for _ in range(partitions)]
+    dims       = []
+    for _ in range(max(classes, default=-1) + 1):
+      dims.append(copy(3) + 1)
+      subclasses = copy(2)
+      if subclasses:
+        copy(8) # masterbook
+      for _ in range(1 << subclasses):
+        copy(8) # subclass book
+    copy(2) # multiplier
+    rangebits = copy(4)
+    for c in classes:
+      for _ in range(dims[c]):
+        copy(rangebits)
+
+  for _ in range(copy(6) + 1):
+    rtype = br.read(16)
+    if rtype > 2:
+      raise Exception(f"invalid Vorbis residue type {rtype}")
+    bw.write(rtype, 2)
+    copy(24), copy(24), copy(24) # begin, end, partition size
+    classifications = copy(6) + 1
+    copy(8) # classbook
+    cascade = []
+    for _ in range(classifications):
+      low = copy(3)
+      cascade.append((copy(5) << 3 if copy(1) else 0) | low)
+    for c in cascade:
+      for bit in range(8):
+        if c & (1 << bit):
+          copy(8)
+
+  for _ in range(copy(6) + 1):
+    if br.read(16) != 0:
+      raise Exception("invalid Vorbis mapping type")
+    submaps = copy(4) + 1 if copy(1) else 1
+    if copy(1): # square polar coupling
+      for _ in range(copy(8) + 1):
+        copy(ilog(channels - 1)), copy(ilog(channels - 1))
+    if copy(2) != 0:
+      raise Exception("invalid Vorbis mapping")
+    if submaps > 1:
+      for _ in range(channels):
+        copy(4)
+    for _ in range(submaps):
+      copy(8), copy(8), copy(8) # time config, floor, residue
+
+  blockflags = []
+  for _ in range(copy(6) + 1):
+    blockflags.append(copy(1))
+    if br.read(16) != 0 or br.read(16) != 0:
+      raise Exception("invalid Vorbis window or transform type")
+    copy(8) # mapping
+  if br.read(1) != 1:
+    raise Exception("invalid Vorbis setup header framing bit")
+  return bw.getvalue(), blockflags
+
+#Convert a standard Vorbis audio packet to Wwise's modified packet format
+#  Wwise drops the leading packet type bit and, for long blocks, the previous / next window flags after the mode number
+#  (the decoder works them out from neighbouring packets), so the rest of the packet is shifted down by 1 or 3 bits
+def convertVorbisAudioPacket(packet,mode_bits,blockflags):
+  if len(packet) == 0:
+    return packet, None
+  x = int.from_bytes(packet, 'little')
+  if x & 1:
+    raise Exception("unexpected non-audio Vorbis packet")
+  mode = (x >> 1) & ((1 << mode_bits) - 1)
+  if mode >= len(blockflags):
+    raise Exception(f"invalid Vorbis mode {mode}")
+  skip = 1 + mode_bits + (2 if blockflags[mode] else 0)
+  x    = mode | ((x >> skip) << mode_bits)
+  return x.to_bytes(len(packet), 'little'), mode
+
+#Read the identification header and final granule position of an Ogg Vorbis file, returning a WavManifest (or None if it isn't one)
+#  only the first and last pages are read, so this is about as fast as reading a wav header
+def readOggManifest(path,st=None):
+  m = WavManifest(path)
+  if st is None:
+    st = os.stat(path)
+  m.size, m.mtime_ns = st.st_size, st.st_mtime_ns
+  try:
+    with open(path,'rb') as fin:
+      head = fin.read(4096)
+      fin.seek(max(0, m.size - 65307)) # the largest possible Ogg page
+      tail = fin.read()
+    packets, _ = readOggPackets(head[:OGG_PAGE_HEADER.size + head[26] + sum(head[27:27+head[26]])])
+    m.channels, m.rate, _, _, _ = readVorbisIdHeader(packets[0])
+  except Exception:
+    return None
+  last = tail.rfind(b'OggS')
+  if last >= 0 and len(tail) - last >= OGG_PAGE_HEADER.size:
+    m.frames = max(0, OGG_PAGE_HEADER.unpack_from(tail, last)[3])
+  m.format_tag = WAVE_FORMAT_WWISE_VORBIS
+  m.data_size  = m.size
+  return m
+
 # Wrapper class for passing a bunch of data by reference for clean(er) binary data parsing
 class Ref(object):
   def __init__(self,val={},mode="read"):
@@ -361,12 +1463,12 @@ class Ref(object):
         print(f"""{'':>{newindent}s}{i:<5d} : """,end='')
         v.dump(newindent)
       print(f"""{'':>{indent}s}"""+"]")
-    elif isinstance(self.val,bytes) and len(self.val) > 4:
+    elif isinstance(self.val,(bytes,memoryview,FileSlice)) and len(self.val) > 4:
       print(f"[array of {len(self.val)} bytes]")
     elif self.val is None:
       print(col.CRT+str(self.val)+col.BLN)
     else:
-      print(str(self.val))
+      print(str(labelId(self.val)))
 
   @property
   def val(self):
@@ -396,19 +1498,25 @@ class Ref(object):
     self.autokeycount = 0
     self.autoindex = 0
 
-    if isinstance(self.val,dict):
-      for k,v in self.val.items():
+    val = getattr(self, "_val", None) # optional fields that were skipped when writing have no value
+    if isinstance(val,dict):
+      for k,v in val.items():
         v.resetState()
-    elif isinstance(self.val,list):
-      for i,v in enumerate(self.val):
+    elif isinstance(val,list):
+      for i,v in enumerate(val):
         v.resetState()
 
 # Class for serializing / deserializing data from / to a hieararchical Ref structure
 class Decoder(object):
-  def __init__(self,data,iomode="read"):
+  def __init__(self,data,iomode="read",stream=None):
     self.data      = data
     self.len       = 0 if self.data is None else len(self.data)
-    self.iostream  = io.BytesIO(self.data)
+    if stream is not None:
+      self.iostream = stream
+    elif iomode == "read":
+      self.iostream = BufferStream(b'' if self.data is None else self.data)
+    else:
+      self.iostream = io.BytesIO(self.data)
     self.indent    = 2
     self.iomode    = iomode
     self.printmode = self.pprint
@@ -427,15 +1535,20 @@ class Decoder(object):
   def dontPrint(self):
     self.printmode = self.noprint
 
+  #drop our references to the data being parsed (so, e.g., a memory map can be closed once parsing is done)
+  def release(self):
+    self.data     = None
+    self.iostream = None
+
   def noprint(self,x,outcome,tag=None):
     return
 
   def pprint(self,x,outcome,tag=None):
-    if isinstance(x,bytes) and len(x) > 8:
+    if isinstance(x,(bytes,memoryview,FileSlice)) and len(x) > 8:
       xp = f"[bytes x {len(x)}]"
     else:
-      xp = x
-    pad = self.labelpos - len(str(xp))
+      xp = labelId(x)
+    pad = max(1, self.labelpos - len(str(xp)))
     print(f"{self.cmap[outcome]}{xp}{col.BLN}{' '*pad}{'' if tag is None else (col.YLW if '?' in tag else col.CYN)+tag+col.BLN}")
 
   def readAndEval(self,ref,nbytes,fapply,*,val=None,tag=None):
@@ -449,7 +1562,7 @@ class Decoder(object):
       raise Exception("Unsupported io")
     if val is None or args.skipchecks:
       outcome = "any"
-    elif (x == val) or (isinstance(val,list) and x in val):
+    elif isExpected(x, val):
       outcome = "good"
     else:
       raise Exception(f"expected to read {col.CRT}{val}{col.BLN}, actually read {col.CRT}{x}{col.BLN}")
@@ -494,6 +1607,64 @@ class Decoder(object):
       cb = lambda x: struct.pack('<i', int(x))
     return self.readAndEval(ref, 4, cb, val=val, tag=tag)
 
+  #read / write every field of a Layout with a single struct call, storing the values as children of ref
+  #  vals adds or overrides expected values for individual fields, and i / j / k fill in tags when printing
+  def asLayout(self,ref,layout,*,vals=None,i=None,j=None,k=None):
+    if ref.val is None:
+      ref.val = {}
+    d = ref.val
+    if self.iomode == "read":
+      x = self.readLayout(layout, vals=vals, i=i, j=j, k=k)
+      for name, v in zip(layout.fields, x):
+        d[name] = Ref(v,ref.mode)
+    elif self.iomode == "write":
+      x = self.writeLayout(layout, [d[name].val for name in layout.fields], vals=vals, i=i, j=j, k=k)
+    else:
+      raise Exception("Unsupported io")
+    return x
+
+  #read every field of a Layout with a single struct call, returning a tuple of values
+  def readLayout(self,layout,*,vals=None,i=None,j=None,k=None):
+    x = layout.unpack(self.read(layout.size))
+    self.checkLayout(layout, x, vals, i, j, k)
+    return x
+
+  #write every field of a Layout with a single struct call
+  def writeLayout(self,layout,x,*,vals=None,i=None,j=None,k=None):
+    self.write(layout.pack(x))
+    self.checkLayout(layout, x, vals, i, j, k)
+    return x
+
+  #check and print the fields of a Layout that was just read / written
+  def checkLayout(self,layout,x,vals,i,j,k):
+    checks = layout.checks if vals is None else {**layout.checks, **vals}
+    if checks and not args.skipchecks:
+      for name, val in checks.items():
+        v = x[layout.index[name]]
+        if not isExpected(v, val):
+          raise Exception(f"expected to read {col.CRT}{describeExpected(val)}{col.BLN} for {layout.name} {name}, actually read {col.CRT}{v}{col.BLN}")
+
+    if self.printmode != self.noprint:
+      for name, v, tag in zip(layout.fields, x, layout.tags):
+        self.printmode(v, "good" if (name in checks and not args.skipchecks) else "any", tag.format(i=i,j=j,k=k))
+
+  #read / write raw bytes without storing them in a Ref
+  def readBytes(self,n,*,tag=None):
+    x = self.read(n)
+    self.printmode(x,"any",tag)
+    return x
+
+  def writeBytes(self,x,*,tag=None):
+    self.write(x)
+    self.printmode(x,"any",tag)
+    return x
+
+  #raise an exception if a value read from / written to the stream doesn't match its expected value
+  def expect(self,x,val,what):
+    if args.skipchecks or isExpected(x, val):
+      return
+    raise Exception(f"expected {what} to be {col.CRT}{describeExpected(val)}{col.BLN}, actually found {col.CRT}{x}{col.BLN}")
+
   def asShort(self,ref,*,val=None,tag=None):
     if self.iomode == "read":
       cb = lambda x: struct.unpack('<h', x)[0]
@@ -501,19 +1672,36 @@ class Decoder(object):
       cb = lambda x: struct.pack('<h', int(x))
     return self.readAndEval(ref, 2, cb, val=val, tag=tag)
 
+  #large reads return zero-copy memoryviews into the underlying data, which are only copied when actually used
   def read(self,n):
     self.bytes_read += n
-    return self.iostream.read(n)
+    x = self.iostream.read(n)
+    if n <= MAX_COPIED_READ:
+      return bytes(x)
+    return x
+
+  def skip(self,n):
+    self.bytes_read += n
+    self.iostream.seek(n,1)
 
   def write(self,data):
-    self.bytes_read += self.iostream.write(data)
+    if isinstance(data,FileSlice):
+      self.bytes_read += data.copyTo(self.iostream)
+    else:
+      self.bytes_read += self.iostream.write(data)
     return data
 
+  #get all data written so far (only available when not streaming to a file)
+  def getvalue(self):
+    if isinstance(self.iostream,(io.BytesIO,BufferStream)):
+      return self.iostream.getvalue()
+    return None
+
   def speculate(self,ref,*,val,tag):
     n = len(val)
     if self.iomode == "read":
       orig = self.iostream.tell()
-      x = self.iostream.read(n)
+      x = bytes(self.iostream.read(n))
       if x == val:
         self.bytes_read += n
         ref.val = x
@@ -535,6 +1723,662 @@ class Decoder(object):
       except AttributeError:
         return False
 
+# Fixed-shape binary record, compiled once into a struct.Struct so all of its fields can be read or written in a single call
+#   each field is (name, struct format, tag) or (name, struct format, tag, expected value(s))
+class Layout(object):
+  converters = {"s" : bytes, "f" : float}
+
+  def __init__(self,name,fields):
+    self.name       = name
+    self.fields     = [f[0] for f in fields]
+    self.tags       = [f[2] for f in fields]
+    self.checks     = {f[0] : f[3] for f in fields if len(f) > 3}
+    self.index      = {name : i for i, name in enumerate(self.fields)}
+    self.struct     = struct.Struct("<" + "".join(f[1] for f in fields))
+    self.size       = self.struct.size
+    self.convert    = [self.converters.get(f[1][-1], int) for f in fields]
+
+  def unpack(self,data):
+    return self.struct.unpack(data)
+
+  def pack(self,values):
+    return self.struct.pack(*[c(v) for c, v in zip(self.convert, values)])
+
+# Layouts for all fixed-shape records in WEM and BNK files
+WEM_FMT_LAYOUT = Layout("wem fmt", [
+  ("wem_header"       , "4s" , "'RIFF'"                       , b"RIFF"),
+  ("wem_length"       , "i"  , "bytes remaining"),
+  ("wem_wave"         , "4s" , "'WAVE'"                       , b"WAVE"),
+  ("fmt_header"       , "4s" , "format chunk"                 , b"fmt "),
+  ("fmt_size"         , "h"  , "????? always 24 [wav i think?] or 66 [vorbis i think?]", [24,66]),
+  ("fmt_size_high"    , "h"  , "????? always 0"               , 0),
+  ("compression_code" , "h"  , "compression code, always -2 for flat bitrate / no compression, -1 = ogg compression?, 2 = wav compression?", [-2,-1,2]),
+  ("channels"         , "h"  , "number of audio channels (1-2)", [1,2]),
+  ("sample_rate"      , "i"  , "samples / second"),
+  ("avg_byte_rate"    , "i"  , "avg. bytes / second"),
+  ("block_align"      , "h"  , "block align? (2 or 4 for our purposes, 36 and 72 also seen)"),
+  ("sample_width"     , "h"  , "bits per sample"),
+  ("extra_bytes"      , "h"  , "extra byte count == fmt_size - 18 (always 6 for WAVs and 48 for oggs)"),
+  ("extra_unk"        , "h"  , "2 unknown extra bytes"),
+])
+WEM_OGG_LAYOUT = Layout("wem vorbis header", [
+  ("ogg_subtype"                   , "i"   , "ogg subtype"), # same as valid bits
+  ("ogg_sample_count"              , "i"   , "ogg sample count"),              # 0x00
+  ("ogg_mod_signal"                , "I"   , "ogg mod signal / loop start packet offset"), # 0x04
+  ("ogg_loop_end_offset"           , "I"   , "ogg loop end packet offset"),    # 0x08
+  ("ogg_loop_begin_extra"          , "H"   , "ogg loop begin extra samples"),  # 0x0C
+  ("ogg_loop_end_extra"            , "H"   , "ogg loop end extra samples"),    # 0x0E
+  ("ogg_setup_packet_offset"       , "I"   , "ogg setup packet offset (== seek table size)"), # 0x10
+  ("ogg_first_audio_packet_offset" , "I"   , "ogg first audio packet offset"), # 0x14
+  ("ogg_max_packet_size"           , "H"   , "ogg max packet size"),           # 0x18
+  ("ogg_last_granule_extra"        , "H"   , "ogg last granule extra samples"), # 0x1A
+  ("ogg_decode_alloc_size"         , "I"   , "ogg decoder allocation size"),   # 0x1C
+  ("ogg_decode_x64_alloc_size"     , "I"   , "ogg decoder allocation size (64-bit)"), # 0x20
+  ("ogg_uid"                       , "I"   , "ogg uid / codebook hash"),       # 0x24
+  ("ogg_blocksize_0_pow"           , "B"   , "ogg blocksize 0 pow"),           # 0x28
+  ("ogg_blocksize_1_pow"           , "B"   , "ogg blocksize 1 pow"),           # 0x29
+])
+BKHD_LAYOUT = Layout("bkhd", [
+  ("bnk_head"    , "4s" , "bkhd header"    , b"BKHD"),
+  ("seclen"      , "i"  , "section length" , [24,28]),
+  ("version"     , "i"  , "bank version"),
+  ("bankid"      , "I"  , "bank id"),
+  ("language_id" , "I"  , "language id"),
+  ("alt_values"  , "i"  , "alt values"),
+  ("project_id"  , "i"  , "project id"),
+  ("padding"     , "i"  , "padding"),
+])
+DIDX_HEAD_LAYOUT = Layout("didx header", [
+  ("didx_head"   , "4s" , "didx header"    , b"DIDX"),
+  ("didx_seclen" , "i"  , "section length"),
+])
+WEM_INFO_LAYOUT = Layout("didx entry", [
+  ("wemid"  , "I" , "wem {i} id"),
+  ("wemoff" , "i" , "wem {i} offset"),
+  ("wemlen" , "i" , "wem {i} length"),
+])
+DATA_HEAD_LAYOUT = Layout("data header", [
+  ("data_head"   , "4s" , "data header"    , b"DATA"),
+  ("data_seclen" , "i"  , "section length"),
+])
+HIRC_HEAD_LAYOUT = Layout("hirc header", [
+  ("hirc_head"       , "4s" , "hirc header"       , b"HIRC"),
+  ("hirc_seclen"     , "i"  , "section length"),
+  ("hirc_numobjects" , "i"  , "number of objects"),
+])
+HIRC_OBJ_LAYOUT = Layout("hirc object", [
+  ("type"      , "B" , "obj {i} type"),
+  ("subseclen" , "i" , "obj {i} subsection length"),
+])
+SFX_SOURCE_LAYOUT = Layout("sfx source", [
+  ("sfx_id"              , "I" , "SFX {i} ID"),
+  ("plugin_id"           , "i" , "SFX {i} PluginID (65537 = PCM, 131073 = ADPCM, 262145 = VORBIS)", [65537,262145,131073]),
+  ("external_state"      , "B" , "SFX {i} external state (should be 0 == embedded)"     , 0),
+  ("wem_file_id"         , "I" , "SFX {i} WEM file id"),
+  ("wem_file_num_bytes"  , "i" , "SFX {i} in-memory byte length"),
+  ("sfx_unknown"         , "B" , "SFX {i} source bits (usually 0, see uSourceBits in XML)", 0),
+  ("sfx_override_parent" , "B" , "SFX {i} override parent"                              , [0,1]),
+  ("num_fx"              , "B" , "SFX {i} number of effects"),
+])
+SFX_FX_BYPASS_LAYOUT = Layout("sfx fx bypass", [
+  ("fx_bypass" , "B" , "SFX {i} bits effects bypass?"),
+])
+SFX_BUS_LAYOUT = Layout("sfx bus", [
+  ("override_attachments" , "B" , "SFX {i} override attachments"),
+  ("bus_id"               , "I" , "SFX {i} bus id"),
+  ("parent_id"            , "i" , "SFX {i} parent object id"),
+  ("misc_flags"           , "B" , "SFX {i} misc. flags"),
+  ("num_params"           , "B" , "SFX {i} num additional parameters"),
+])
+SFX_PARAM_TYPE_LAYOUT = Layout("sfx param type", [
+  ("param_type" , "B" , "SFX {i} param {j} type"),
+])
+SFX_VOLUME_PARAM_LAYOUT = Layout("sfx volume param", [
+  ("volume"      , "f"  , "SFX {i} param {j} volume (float)"),
+])
+SFX_LOOP_PARAM_LAYOUT = Layout("sfx loop param", [
+  ("num_loops"   , "i"  , "SFX {i} param {j} num loops (float, 0 == inf)"),
+])
+SFX_UNKNOWN_PARAM_LAYOUT = Layout("sfx unknown param", [
+  ("param_value" , "4s" , "SFX {i} unknown param {j} value"),
+])
+SFX_PARAM_LAYOUTS = {
+  0  : SFX_VOLUME_PARAM_LAYOUT, # volume
+  58 : SFX_LOOP_PARAM_LAYOUT,   # loop
+}
+SFX_NUM_RANGE_PARAMS_LAYOUT = Layout("sfx range param count", [
+  ("num_range_modifiers" , "B" , "SFX {i} num additional range paramters"),
+])
+SFX_RANGE_PARAM_TYPE_LAYOUT = Layout("sfx range param type", [
+  ("range_param_type" , "B" , "SFX {i} range param {j} type"),
+])
+SFX_RANGE_PARAM_LAYOUT = Layout("sfx range param", [
+  ("min_value" , "f" , "SFX {i} range param {j} min value (float)"),
+  ("max_value" , "f" , "SFX {i} range param {j} max value (float)"),
+])
+SFX_POSITIONING_LAYOUT = Layout("sfx positioning", [
+  ("positioning_data" , "B" , "SFX {i} positioning data (7 is normal)"),
+])
+SFX_POSITIONING_3D_LAYOUT = Layout("sfx 3d positioning", [
+  ("positioning_data_3d" , "B" , "SFX {i} 3D positioning data"),
+  ("attenuation_id_3d"   , "i" , "SFX {i} 3D attenutation id"),
+])
+SFX_AUX_PARAMS_LAYOUT = Layout("sfx aux params", [
+  ("aux_params" , "B" , "SFX {i} aux parameters (if 4rd bit is set, we have aux params)"),
+])
+SFX_AUX_LAYOUT = Layout("sfx aux", [
+  ("aux_id_1" , "i" , "SFX {i} aux 0 id"),
+  ("aux_id_2" , "i" , "SFX {i} aux 1 id"),
+  ("aux_id_3" , "i" , "SFX {i} aux 2 id"),
+  ("aux_id_4" , "i" , "SFX {i} aux 3 id"),
+])
+SFX_LIMITS_LAYOUT = Layout("sfx limits", [
+  ("priority_tiebreak"    , "B" , "SFX {i} priority tiebreaker + other bits"),
+  ("virt_queue_behavior"  , "B" , "SFX {i} virtual queue behavior (1 == use virtual voice)"),
+  ("max_sounds"           , "h" , "SFX {i} max sound limit (0 == no limit)"),
+  ("below_thres_behavior" , "B" , "SFX {i} below threshold behavior (0 == continue to play)"),
+  ("envelope"             , "B" , "SFX {i} envelope bits"),
+  ("num_state_props"      , "B" , "SFX {i} number of state props (needs to be 0)"  , 0),
+  ("num_state_groups"     , "B" , "SFX {i} number of state groups (needs to be 0)" , 0),
+  ("num_rtpcs"            , "h" , "SFX {i} num RTPCs"),
+])
+RTPC_LAYOUT = Layout("rtpc", [
+  ("x_axis"          , "I" , "SFX {i} RTPC {j} x-axis game parameter id"),
+  ("rtpc_type"       , "B" , "SFX {i} RTPC {j} type (0 == gameparameter)"                  , 0),
+  ("rtpc_accum"      , "B" , "SFX {i} RTPC {j} accum (2 == additive)"                      , 2),
+  ("rtpc_param"      , "B" , "SFX {i} RTPC {j} parameter id (0 == volume, 2 == pitch)"     , [0,2]),
+  ("rtpc_curve_id"   , "i" , "SFX {i} RTPC {j} curve id"),
+  ("rtpc_scaling"    , "B" , "SFX {i} RTPC {j} scaling (2 == decibels, 0 == none)"         , [0,2]),
+  ("num_rtpc_points" , "h" , "SFX {i} RTPC {j} num points"),
+])
+RTPC_POINT_LAYOUT = Layout("rtpc point", [
+  ("x"      , "f" , "SFX {i} RTPC {j} point {k} x coord"),
+  ("y"      , "f" , "SFX {i} RTPC {j} point {k} y coord"),
+  ("interp" , "i" , "SFX {i} RTPC {j} point {k} interpolation type (4 == linear)"),
+])
+ACTION_LAYOUT = Layout("action", [
+  ("action_id"       , "I" , "Action {i} ID"),
+  ("action_scope"    , "B" , "Action {i} action scope (byte 1/2) (3 == game object, 2 = global)"),
+  ("action_type"     , "B" , "Action {i} action type (byte 2/2) (1 == stop, 2 pause, 3 resume, 4 play, 18 setState, 14 SetLPF_O, 12 set bus volume)", [1,2,3,4,12,14,18]),
+  ("action_sfx_id"   , "I" , "Action {i} game object (SFX) id"),
+  ("action_bus_bits" , "B" , "Action {i} bus bits"),
+  ("action_props_1"  , "B" , "Action {i} props (usually 0)"),
+])
+ACTION_RANGE_PROPS_LAYOUT = Layout("action range props", [
+  ("action_props_2" , "B" , "Action {i} range props (needs to be 0)" , 0),
+])
+ACTION_PLAY_LAYOUT = Layout("play action", [
+  ("action_play_fade_curve" , "B" , "Action {i} play fade curve (4 == linear)"),
+  ("bank_id"                , "I" , "Action {i} bank id"),
+])
+ACTION_STOP_LAYOUT = Layout("stop action", [
+  ("action_stop_fade_curve"     , "B" , "Action {i} stop fade curve (4 == linear)"),
+  ("action_stop_flags"          , "B" , "Action {i} stop bit flags (6 == expected)"           , 6),
+  ("action_stop_num_exceptions" , "B" , "Action {i} stop exception list size (usually 0)"),
+])
+ACTION_PAUSE_LAYOUT = Layout("pause action", [
+  ("action_pause_fade_curve"     , "B" , "Action {i} pause / resume fade curve (4 == linear)"),
+  ("action_pause_flags"          , "B" , "Action {i} pause / resume bit flags (6 or 7 == expected)"           , [6,7]),
+  ("action_pause_num_exceptions" , "B" , "Action {i} pause / resume exception list size (needs to be 0)"    , 0),
+])
+ACTION_STATE_LAYOUT = Layout("set state action", [
+  ("action_state_group_id"  , "i" , "Action {i} state group id"),
+  ("action_state_target_id" , "i" , "Action {i} state target id"),
+])
+ACTION_LPF_LAYOUT = Layout("lpf action", [
+  ("action_lpf_bits"            , "B" , "Action {i} LPF bit vector"),
+  ("action_lpf_value_meaning"   , "B" , "Action {i} LPF value meaning"),
+  ("action_lpf_random_base"     , "f" , "Action {i} LPF randomizer base"),
+  ("action_lpf_random_min"      , "f" , "Action {i} LPF randomizer min"),
+  ("action_lpf_random_max"      , "f" , "Action {i} LPF randomizer max"),
+  ("action_stop_num_exceptions" , "B" , "Action {i} LPF exception list size (usually 0)"),
+])
+EXCEPTION_LAYOUT = Layout("action exception", [
+  ("id"     , "i" , "Action {i} exception {j} id"),
+  ("is_bus" , "B" , "Action {i} exception {j} is bus"),
+])
+EVENT_LAYOUT = Layout("event", [
+  ("event_id"   , "I" , "Event {i} id"),
+  ("num_events" , "B" , "Event {i} num actions"),
+])
+EVENT_ACTION_LAYOUT = Layout("event action", [
+  ("action_id" , "I" , "Event {i} action {j} id"),
+])
+
+#Convert nested dicts / lists of plain values into a Ref tree (for dumping records)
+def toRefTree(x):
+  if isinstance(x,dict):
+    return Ref({k : toRefTree(v) for k, v in x.items()})
+  if isinstance(x,list):
+    return Ref([toRefTree(v) for v in x])
+  return Ref(x)
+
+# Base class for HIRC object records
+#   HIRC records use __slots__ rather than Ref trees since banks can contain tens of thousands of them;
+#   toRef() builds an equivalent Ref tree for debug output
+class HircObject(abc.ABC):
+  __slots__ = ("type",)
+
+  #size of the object in bytes, excluding its type and subsection length
+  @abc.abstractmethod
+  def size(self): ...
+
+  #id of the object (the first field of every HIRC object)
+  @abc.abstractmethod
+  def objectId(self): ...
+
+  @abc.abstractmethod
+  def decode(self,bs,i,subseclen,checks): ...
+
+  @abc.abstractmethod
+  def encode(self,bs,i): ...
+
+  #dict of the object's fields, in the order they appear in the bank
+  @abc.abstractmethod
+  def fields(self): ...
+
+  def toRef(self):
+    return toRefTree({"type" : self.type, "subseclen" : self.size(), **self.fields()})
+
+  def dump(self,indent=0):
+    self.toRef().dump(indent)
+
+  def resetState(self):
+    pass
+
+# Generic HIRC object record, storing the raw bytes of object types we don't know how to parse
+class HircGeneric(HircObject):
+  __slots__ = ("data",)
+
+  def __init__(self,htype=None,data=b''):
+    self.type = htype
+    self.data = data
+
+  def size(self):
+    return len(self.data)
+
+  def objectId(self):
+    return struct.unpack_from('<I', self.data)[0] if len(self.data) >= 4 else None
+
+  def decode(self,bs,i,subseclen,checks):
+    self.data = bs.readBytes(subseclen, tag=f"Generic {i} data")
+    return self
+
+  def encode(self,bs,i):
+    bs.writeBytes(self.data, tag=f"Generic {i} data")
+
+  def fields(self):
+    return {"data" : self.data}
+
+# RTPC (real-time parameter control) curve attached to a sound effect
+class HircRTPC(object):
+  __slots__ = ("x_axis", "rtpc_type", "rtpc_accum", "rtpc_param", "rtpc_curve_id", "rtpc_scaling", "points")
+
+  def __init__(self,x_axis=0,rtpc_type=0,rtpc_accum=2,rtpc_param=0,rtpc_curve_id=0,rtpc_scaling=2,points=None):
+    self.x_axis        = x_axis
+    self.rtpc_type     = rtpc_type
+    self.rtpc_accum    = rtpc_accum
+    self.rtpc_param    = rtpc_param
+    self.rtpc_curve_id = rtpc_curve_id
+    self.rtpc_scaling  = rtpc_scaling
+    self.points        = [] if points is None else points #list of (x, y, interpolation type)
+
+  def size(self):
+    return RTPC_LAYOUT.size + RTPC_POINT_LAYOUT.size * len(self.points)
+
+  def decode(self,bs,i,j):
+    (self.x_axis, self.rtpc_type, self.rtpc_accum, self.rtpc_param,
+      self.rtpc_curve_id, self.rtpc_scaling, num_points) = bs.readLayout(RTPC_LAYOUT, i=i, j=j)
+    self.points = [bs.readLayout(RTPC_POINT_LAYOUT, i=i, j=j, k=k) for k in range(num_points)]
+    return self
+
+  def encode(self,bs,i,j):
+    bs.writeLayout(RTPC_LAYOUT, (self.x_axis, self.rtpc_type, self.rtpc_accum, self.rtpc_param,
+      self.rtpc_curve_id, self.rtpc_scaling, len(self.points)), i=i, j=j)
+    for k, p in enumerate(self.points):
+      bs.writeLayout(RTPC_POINT_LAYOUT, p, i=i, j=j, k=k)
+
+  def fields(self):
+    return {
+      "x_axis"          : self.x_axis,
+      "rtpc_type"       : self.rtpc_type,
+      "rtpc_accum"      : self.rtpc_accum,
+      "rtpc_param"      : self.rtpc_param,
+      "rtpc_curve_id"   : self.rtpc_curve_id,
+      "rtpc_scaling"    : self.rtpc_scaling,
+      "num_rtpc_points" : len(self.points),
+      "rtpc_points"     : [{"x" : x, "y" : y, "interp" : interp} for x, y, interp in self.points],
+    }
+
+# HIRC sound effect object
+class HircSound(HircObject):
+  __slots__ = ("sfx_id", "plugin_id", "external_state", "wem_file_id", "wem_file_num_bytes", "sfx_unknown",
+    "sfx_override_parent", "fx_bypass", "fx", "override_attachments", "bus_id", "parent_id", "misc_flags", "params",
+    "range_params", "positioning_data", "positioning_data_3d", "attenuation_id_3d", "aux_params", "aux_ids",
+    "priority_tiebreak", "virt_queue_behavior", "max_sounds", "below_thres_behavior", "envelope", "rtpcs")
+
+  def __init__(self):
+    self.type                 = HIRC_TYPE_SFX
+    self.sfx_id               = 0
+    self.plugin_id            = 65537
+    self.external_state       = 0 # 0 == embedded
+    self.wem_file_id          = 0
+    self.wem_file_num_bytes   = 0
+    self.sfx_unknown          = 0
+    self.sfx_override_parent  = 0
+    self.fx_bypass            = 0
+    self.fx                   = [] #list of 7-byte effect data
+    self.override_attachments = 0
+    self.bus_id               = 0
+    self.parent_id            = 0
+    self.misc_flags           = 0
+    self.params               = [] #list of [param type, value]
+    self.range_params         = [] #list of [param type, min value, max value]
+    self.positioning_data     = 7
+    self.positioning_data_3d  = 0
+    self.attenuation_id_3d    = 0
+    self.aux_params           = 0
+    self.aux_ids              = (0, 0, 0, 0)
+    self.priority_tiebreak    = 0
+    self.virt_queue_behavior  = 0
+    self.max_sounds           = 0
+    self.below_thres_behavior = 0
+    self.envelope             = 0
+    self.rtpcs                = [] #list of HircRTPC
+
+  def has3D(self):
+    return bool(self.positioning_data & 0b10000)
+
+  def hasAux(self):
+    return bool(self.aux_params & 0b1000)
+
+  def objectId(self):
+    return self.sfx_id
+
+  def size(self):
+    return (SFX_SOURCE_LAYOUT.size
+      + ((1 + 7 * len(self.fx)) if self.fx else 0)
+      + SFX_BUS_LAYOUT.size
+      + 5 * len(self.params)
+      + 1 + 9 * len(self.range_params)
+      + 1 + (SFX_POSITIONING_3D_LAYOUT.size if self.has3D() else 0)
+      + 1 + (SFX_AUX_LAYOUT.size if self.hasAux() else 0)
+      + SFX_LIMITS_LAYOUT.size
+      + sum(r.size() for r in self.rtpcs))
+
+  def decode(self,bs,i,subseclen,checks):
+    (self.sfx_id, self.plugin_id, self.external_state, self.wem_file_id, self.wem_file_num_bytes,
+      self.sfx_unknown, self.sfx_override_parent, num_fx) = bs.readLayout(SFX_SOURCE_LAYOUT, vals=checks.get(SFX_SOURCE_LAYOUT), i=i)
+    if num_fx > 0:
+      self.fx_bypass = bs.readLayout(SFX_FX_BYPASS_LAYOUT, i=i)[0]
+      self.fx        = [bytes(bs.readBytes(7, tag=f"SFX {i} FX {j} effect data")) for j in range(num_fx)]
+
+    (self.override_attachments, self.bus_id, self.parent_id, self.misc_flags,
+      num_params) = bs.readLayout(SFX_BUS_LAYOUT, i=i)
+    ptypes = [bs.readLayout(SFX_PARAM_TYPE_LAYOUT, i=i, j=j)[0] for j in range(num_params)]
+    self.params = [[t, bs.readLayout(SFX_PARAM_LAYOUTS.get(t, SFX_UNKNOWN_PARAM_LAYOUT), i=i, j=j)[0]] for j, t in enumerate(ptypes)]
+
+    num_range_mods = bs.readLayout(SFX_NUM_RANGE_PARAMS_LAYOUT, i=i)[0]
+    rtypes = [bs.readLayout(SFX_RANGE_PARAM_TYPE_LAYOUT, i=i, j=j)[0] for j in range(num_range_mods)]
+    self.range_params = [[t, *bs.readLayout(SFX_RANGE_PARAM_LAYOUT, i=i, j=j)] for j, t in enumerate(rtypes)]
+
+    self.positioning_data = bs.readLayout(SFX_POSITIONING_LAYOUT, i=i)[0]
+    if self.has3D():
+      self.positioning_data_3d, self.attenuation_id_3d = bs.readLayout(SFX_POSITIONING_3D_LAYOUT, i=i)
+
+    self.aux_params = bs.readLayout(SFX_AUX_PARAMS_LAYOUT, i=i)[0]
+    if self.hasAux(): # always exactly 4
+      self.aux_ids = bs.readLayout(SFX_AUX_LAYOUT, i=i)
+
+    (self.priority_tiebreak, self.virt_queue_behavior, self.max_sounds, self.below_thres_behavior,
+      self.envelope, _, _, num_rtpcs) = bs.readLayout(SFX_LIMITS_LAYOUT, i=i)
+    self.rtpcs = [HircRTPC().decode(bs, i, j) for j in range(num_rtpcs)]
+    return self
+
+  def encode(self,bs,i):
+    bs.writeLayout(SFX_SOURCE_LAYOUT, (self.sfx_id, self.plugin_id, self.external_state, self.wem_file_id,
+      self.wem_file_num_bytes, self.sfx_unknown, self.sfx_override_parent, len(self.fx)), i=i)
+    if self.fx:
+      bs.writeLayout(SFX_FX_BYPASS_LAYOUT, (self.fx_bypass,), i=i)
+      for j, fx in enumerate(self.fx):
+        bs.writeBytes(fx, tag=f"SFX {i} FX {j} effect data")
+
+    bs.writeLayout(SFX_BUS_LAYOUT, (self.override_attachments, self.bus_id, self.parent_id, self.misc_flags,
+      len(self.params)), i=i)
+    for j, (t, v) in enumerate(self.params):
+      bs.writeLayout(SFX_PARAM_TYPE_LAYOUT, (t,), i=i, j=j)
+    for j, (t, v) in enumerate(self.params):
+      bs.writeLayout(SFX_PARAM_LAYOUTS.get(t, SFX_UNKNOWN_PARAM_LAYOUT), (v,), i=i, j=j)
+
+    bs.writeLayout(SFX_NUM_RANGE_PARAMS_LAYOUT, (len(self.range_params),), i=i)
+    for j, (t, lo, hi) in enumerate(self.range_params):
+      bs.writeLayout(SFX_RANGE_PARAM_TYPE_LAYOUT, (t,), i=i, j=j)
+    for j, (t, lo, hi) in enumerate(self.range_params):
+      bs.writeLayout(SFX_RANGE_PARAM_LAYOUT, (lo, hi), i=i, j=j)
+
+    bs.writeLayout(SFX_POSITIONING_LAYOUT, (self.positioning_data,), i=i)
+    if self.has3D():
+      bs.writeLayout(SFX_POSITIONING_3D_LAYOUT, (self.positioning_data_3d, self.attenuation_id_3d), i=i)
+
+    bs.writeLayout(SFX_AUX_PARAMS_LAYOUT, (self.aux_params,), i=i)
+    if self.hasAux():
+      bs.writeLayout(SFX_AUX_LAYOUT, self.aux_ids, i=i)
+
+    bs.writeLayout(SFX_LIMITS_LAYOUT, (self.priority_tiebreak, self.virt_queue_behavior, self.max_sounds,
+      self.below_thres_behavior, self.envelope, 0, 0, len(self.rtpcs)), i=i)
+    for j, r in enumerate(self.rtpcs):
+      r.encode(bs, i, j)
+
+  def fields(self):
+    f = {
+      "sfx_id"               : self.sfx_id,
+      "plugin_id"            : self.plugin_id,
+      "external_state"       : self.external_state,
+      "wem_file_id"          : self.wem_file_id,
+      "wem_file_num_bytes"   : self.wem_file_num_bytes,
+      "sfx_unknown"          : self.sfx_unknown,
+      "sfx_override_parent"  : self.sfx_override_parent,
+      "num_fx"               : len(self.fx),
+    }
+    if self.fx:
+      f["fx_bypass"]         = self.fx_bypass
+      f["fx"]                = self.fx
+    f.update({
+      "override_attachments" : self.override_attachments,
+      "bus_id"               : self.bus_id,
+      "parent_id"            : self.parent_id,
+      "misc_flags"           : self.misc_flags,
+      "num_params"           : len(self.params),
+      "param_type_list"      : [t for t, v in self.params],
+      "param_list"           : [{SFX_PARAM_LAYOUTS.get(t, SFX_UNKNOWN_PARAM_LAYOUT).fields[0] : v} for t, v in self.params],
+      "num_range_modifiers"  : len(self.range_params),
+      "range_param_type_list": [t for t, lo, hi in self.range_params],
+      "range_param_list"     : [{"min_value" : lo, "max_value" : hi} for t, lo, hi in self.range_params],
+      "positioning_data"     : self.positioning_data,
+    })
+    if self.has3D():
+      f["positioning_data_3d"] = self.positioning_data_3d
+      f["attenuation_id_3d"]   = self.attenuation_id_3d
+    f["aux_params"]            = self.aux_params
+    if self.hasAux():
+      f["aux_ids"]             = list(self.aux_ids)
+    f.update({
+      "priority_tiebreak"    : self.priority_tiebreak,
+      "virt_queue_behavior"  : self.virt_queue_behavior,
+      "max_sounds"           : self.max_sounds,
+      "below_thres_behavior" : self.below_thres_behavior,
+      "envelope"             : self.envelope,
+      "num_state_props"      : 0,
+      "num_state_groups"     : 0,
+      "num_rtpcs"            : len(self.rtpcs),
+      "rtpcs"                : [r.fields() for r in self.rtpcs],
+    })
+    return f
+
+# HIRC action object (play, pause, resume, stop, set state, set LPF / bus volume)
+class HircAction(HircObject):
+  __slots__ = ("action_id", "action_scope", "action_type", "action_sfx_id", "action_bus_bits", "props", "range_props",
+    "fade_curve", "flags", "exceptions", "bank_id", "state_group_id", "state_target_id",
+    "lpf_bits", "lpf_value_meaning", "lpf_random_base", "lpf_random_min", "lpf_random_max")
+
+  def __init__(self,action_type=4):
+    self.type              = HIRC_TYPE_ACTION
+    self.action_id         = 0
+    self.action_scope      = 3 # 3 == game object, 2 == global
+    self.action_type       = action_type
+    self.action_sfx_id     = 0
+    self.action_bus_bits   = 0
+    self.props             = [] #list of raw 5-byte props (1 byte type + 4 byte value)
+    self.range_props       = [] #list of raw 5-byte range props
+    self.fade_curve        = 4 # 4 == linear
+    self.flags             = 0
+    self.exceptions        = [] #list of (id, is bus)
+    self.bank_id           = 0
+    self.state_group_id    = 0
+    self.state_target_id   = 0
+    self.lpf_bits          = 0
+    self.lpf_value_meaning = 0
+    self.lpf_random_base   = 0.0
+    self.lpf_random_min    = 0.0
+    self.lpf_random_max    = 0.0
+
+  def objectId(self):
+    return self.action_id
+
+  def size(self):
+    n = ACTION_LAYOUT.size + 5 * len(self.props) + 1 + 5 * len(self.range_props)
+    t = self.action_type
+    if t == 4:
+      n += ACTION_PLAY_LAYOUT.size
+    elif t == 1:
+      n += ACTION_STOP_LAYOUT.size + EXCEPTION_LAYOUT.size * len(self.exceptions)
+    elif t in [2,3]:
+      n += ACTION_PAUSE_LAYOUT.size
+    elif t in [18]:
+      n += ACTION_STATE_LAYOUT.size
+    elif t in [14, 12]:
+      n += ACTION_LPF_LAYOUT.size + EXCEPTION_LAYOUT.size * len(self.exceptions)
+    return n
+
+  def decode(self,bs,i,subseclen,checks):
+    (self.action_id, self.action_scope, self.action_type, self.action_sfx_id, self.action_bus_bits,
+      action_props) = bs.readLayout(ACTION_LAYOUT, i=i)
+    self.props = [bytes(bs.readBytes(5, tag=f"Action {i} prop {j} type + value")) for j in range(action_props)]
+    range_props = bs.readLayout(ACTION_RANGE_PROPS_LAYOUT, i=i)[0]
+    self.range_props = [bytes(bs.readBytes(5, tag=f"Action {i} range prop {j} type + value")) for j in range(range_props)]
+
+    t = self.action_type
+    if t == 4: #play
+      self.fade_curve, self.bank_id = bs.readLayout(ACTION_PLAY_LAYOUT, vals=checks.get(ACTION_PLAY_LAYOUT), i=i)
+    elif t == 1: #stop
+      self.fade_curve, self.flags, exceptions = bs.readLayout(ACTION_STOP_LAYOUT, i=i)
+      self.exceptions = [bs.readLayout(EXCEPTION_LAYOUT, i=i, j=j) for j in range(exceptions)]
+    elif t in [2,3]: #pause / resume
+      self.fade_curve, self.flags, _ = bs.readLayout(ACTION_PAUSE_LAYOUT, i=i)
+    elif t in [18]: #setState
+      self.state_group_id, self.state_target_id = bs.readLayout(ACTION_STATE_LAYOUT, i=i)
+    elif t in [14, 12]: #SetLPF_O, set bus volume
+      (self.lpf_bits, self.lpf_value_meaning, self.lpf_random_base, self.lpf_random_min, self.lpf_random_max,
+        exceptions) = bs.readLayout(ACTION_LPF_LAYOUT, i=i)
+      self.exceptions = [bs.readLayout(EXCEPTION_LAYOUT, i=i, j=j) for j in range(exceptions)]
+    else:
+      raise Exception("don't know how to handle this event type")
+    return self
+
+  def encode(self,bs,i):
+    bs.writeLayout(ACTION_LAYOUT, (self.action_id, self.action_scope, self.action_type, self.action_sfx_id,
+      self.action_bus_bits, len(self.props)), i=i)
+    for j, prop in enumerate(self.props):
+      bs.writeBytes(prop, tag=f"Action {i} prop {j} type + value")
+    bs.writeLayout(ACTION_RANGE_PROPS_LAYOUT, (len(self.range_props),), i=i)
+    for j, prop in enumerate(self.range_props):
+      bs.writeBytes(prop, tag=f"Action {i} range prop {j} type + value")
+
+    t = self.action_type
+    if t == 4: #play
+      bs.writeLayout(ACTION_PLAY_LAYOUT, (self.fade_curve, self.bank_id), i=i)
+    elif t == 1: #stop
+      bs.writeLayout(ACTION_STOP_LAYOUT, (self.fade_curve, self.flags, len(self.exceptions)), i=i)
+      for j, e in enumerate(self.exceptions):
+        bs.writeLayout(EXCEPTION_LAYOUT, e, i=i, j=j)
+    elif t in [2,3]: #pause / resume
+      bs.writeLayout(ACTION_PAUSE_LAYOUT, (self.fade_curve, self.flags, 0), i=i)
+    elif t in [18]: #setState
+      bs.writeLayout(ACTION_STATE_LAYOUT, (self.state_group_id, self.state_target_id), i=i)
+    elif t in [14, 12]: #SetLPF_O, set bus volume
+      bs.writeLayout(ACTION_LPF_LAYOUT, (self.lpf_bits, self.lpf_value_meaning, self.lpf_random_base,
+        self.lpf_random_min, self.lpf_random_max, len(self.exceptions)), i=i)
+      for j, e in enumerate(self.exceptions):
+        bs.writeLayout(EXCEPTION_LAYOUT, e, i=i, j=j)
+    else:
+      raise Exception("don't know how to handle this event type")
+
+  def fields(self):
+    f = {
+      "action_id"       : self.action_id,
+      "action_scope"    : self.action_scope,
+      "action_type"     : self.action_type,
+      "action_sfx_id"   : self.action_sfx_id,
+      "action_bus_bits" : self.action_bus_bits,
+      "action_props_1"  : len(self.props),
+      "props"           : self.props,
+      "action_props_2"  : len(self.range_props),
+      "range_props"     : self.range_props,
+    }
+    t = self.action_type
+    exceptions = [{"id" : eid, "is_bus" : is_bus} for eid, is_bus in self.exceptions]
+    if t == 4:
+      f.update({"action_play_fade_curve" : self.fade_curve, "bank_id" : self.bank_id})
+    elif t == 1:
+      f.update({"action_stop_fade_curve" : self.fade_curve, "action_stop_flags" : self.flags,
+        "action_stop_num_exceptions" : len(self.exceptions), "action_exceptions" : exceptions})
+    elif t in [2,3]:
+      f.update({"action_pause_fade_curve" : self.fade_curve, "action_pause_flags" : self.flags,
+        "action_pause_num_exceptions" : 0})
+    elif t in [18]:
+      f.update({"action_state_group_id" : self.state_group_id, "action_state_target_id" : self.state_target_id})
+    elif t in [14, 12]:
+      f.update({"action_lpf_bits" : self.lpf_bits, "action_lpf_value_meaning" : self.lpf_value_meaning,
+        "action_lpf_random_base" : self.lpf_random_base, "action_lpf_random_min" : self.lpf_random_min,
+        "action_lpf_random_max" : self.lpf_random_max, "action_stop_num_exceptions" : len(self.exceptions),
+        "action_exceptions" : exceptions})
+    return f
+
+# HIRC event object, which triggers a list of actions
+class HircEvent(HircObject):
+  __slots__ = ("event_id", "actions")
+
+  def __init__(self,event_id=0):
+    self.type     = HIRC_TYPE_EVENT
+    self.event_id = event_id
+    self.actions  = [] #list of action ids
+
+  def size(self):
+    return EVENT_LAYOUT.size + 4 * len(self.actions)
+
+  def objectId(self):
+    return self.event_id
+
+  def decode(self,bs,i,subseclen,checks):
+    self.event_id, num_events = bs.readLayout(EVENT_LAYOUT, i=i)
+    self.actions = [bs.readLayout(EVENT_ACTION_LAYOUT, i=i, j=j)[0] for j in range(num_events)]
+    return self
+
+  def encode(self,bs,i):
+    bs.writeLayout(EVENT_LAYOUT, (self.event_id, len(self.actions)), i=i)
+    for j, action_id in enumerate(self.actions):
+      bs.writeLayout(EVENT_ACTION_LAYOUT, (action_id,), i=i, j=j)
+
+  def fields(self):
+    return {"event_id" : self.event_id, "num_events" : len(self.actions), "events" : self.actions}
+
+# Record classes for each HIRC object type we know how to parse
+HIRC_RECORD_TYPES = {
+  HIRC_TYPE_SFX    : HircSound,
+  HIRC_TYPE_ACTION : HircAction,
+  HIRC_TYPE_EVENT  : HircEvent,
+}
+
 # Generic Parser class
 class Parser(object):
   def __init__(self):
@@ -546,33 +2390,70 @@ class Parser(object):
   def valid(self):
     return self._valid
 
+  #the file is memory-mapped rather than read, so large payloads are only paged in from disk when they're actually used
   def loadFrom(self,file):
     self.filename = file
-    self.root = Ref()
+    self.root = Ref({})
     with open(file,'rb') as fin:
-      data = fin.read()
+      try:
+        data = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+      except ValueError: # empty files can't be mapped
+        data = b''
+    self._mmap = data # parsed payloads are views into the map, so keep it alive as long as we are
+    return self.loadFromBuffer(data)
 
-    decoder = Decoder(data,"read")
+  #parse data that's already in memory (e.g., a slice of a memory-mapped bank)
+  def loadFromBuffer(self,data):
+    self.root = Ref({})
+    decoder   = Decoder(data,"read")
 
     if not args.showparse:
       decoder.printmode = decoder.noprint
 
     self.parse(decoder,self.root,"read")
+    decoder.release()
     return self
 
-  def saveTo(self,file):
+  #if stream is True, data is written straight to the file as it is serialized instead of being assembled in memory first
+  #  data is written to a temporary file that replaces the original only once it's complete, so the original can be read while saving
+  def saveTo(self,file,stream=False):
     self.filename = file
-    if os.path.exists(file):
-      os.remove(file)
+    tmpfile = file + ".tmp"
     self.root.resetState()
 
-    decoder = Decoder(None,"write")
-    if not args.showparse:
-      decoder.printmode = decoder.noprint
-
-    data = self.parse(decoder,self.root,"write")
-    with open(file,'wb') as fout:
-      fout.write(data)
+    try:
+      if stream:
+        with open(tmpfile,'wb') as fout, PROFILER.phase("serialize + write"):
+          decoder = Decoder(None,"write",stream=fout)
+          if not args.showparse:
+            decoder.printmode = decoder.noprint
+          self.parse(decoder,self.root,"write")
+        PROFILER.addBytes("serialize + write", os.path.getsize(tmpfile))
+      else:
+        with PROFILER.phase("serialize"):
+          decoder = Decoder(None,"write")
+          if not args.showparse:
+            decoder.printmode = decoder.noprint
+
+          data = self.parse(decoder,self.root,"write")
+        with PROFILER.phase("write", len(data)):
+          with open(tmpfile,'wb') as fout:
+            fout.write(data)
+        PROFILER.addBytes("serialize", len(data))
+    except BaseException:
+      if os.path.exists(tmpfile):
+        os.remove(tmpfile)
+      raise
+    os.replace(tmpfile, file)
+
+  #release the memory-mapped file we were loaded from (any views into it should have been released first)
+  def close(self):
+    if isinstance(getattr(self, "_mmap", None), mmap.mmap):
+      try:
+        self._mmap.close()
+      except BufferError: # something still holds a view into the map (e.g., the traceback of a parse error), so it's closed once that's gone
+        pass
+    self._mmap = None
 
   def parse(self,decoder,root,mode):
     if root.val is None:
@@ -594,58 +2475,14 @@ class WEMParser(Parser):
 
 
     bs = decoder
-    start_bytes = bs.bytes_read
-    bs.asConst(root["wem_header"],  val=b"RIFF",  tag="'RIFF'")
-    bs.asSigned(root["wem_length"], tag="bytes remaining")
-    bs.asConst(root["wem_wave"],    val=b"WAVE",  tag="'WAVE'")
-
-    bs.asConst(root["fmt_header"], val=b"fmt ",tag="format chunk")
-    fmt_size = bs.asShort(root["fmt_size"], val=[24,66], tag="????? always 24 [wav i think?] or 66 [vorbis i think?]")
-
-    bs.asShort(root[""],val=0, tag="????? always 0")
-    cc = bs.asShort(root["compression_code"],val=[-2,-1, 2], tag="compression code, always -2 for flat bitrate / no compression, -1 = ogg compression?, 2 = wav compression?")
-
-    bs.asShort(root["channels"],val=[1,2], tag="number of audio channels (1-2)")
-    bs.asSigned(root["sample_rate"], tag="samples / second")
-    bs.asSigned(root["avg_byte_rate"],tag="avg. bytes / second")
-
-    blockalignbytes = bs.asShort(root["block_align"], tag="block align? (2 or 4 for our purposes, 36 and 72 also seen)")
-    if cc == -2: # no compression
-      sample_width = int(root["avg_byte_rate"]) / int(root["sample_rate"]) / int(root["channels"]) * 8
-      # bs.asShort(root["sample_width"],val=sample_width, tag="bits per sample")
-      bs.asShort(root["sample_width"],tag="bits per sample")
-    elif cc == -1: # unknown
-      bs.asShort(root["sample_width"],tag="bits per sample")
-    elif cc == 2: # ogg???
-      bs.asShort(root["sample_width"],tag="bits per sample")
-    else:
-      raise Exception("unrecognized compression format")
-
-    extra_bytes = bs.asShort(root["extra_bytes"],val=fmt_size-18, tag="extra byte count == fmt_size - 18 (always 6 for WAVs and 48 for oggs)")
-    bs.asShort(root["extra_unk"], tag="2 unknown extra bytes")
+    bs.asLayout(root, WEM_FMT_LAYOUT)
+    fmt_size    = int(root["fmt_size"])
+    extra_bytes = int(root["extra_bytes"])
+    bs.expect(extra_bytes, fmt_size-18, "extra byte count")
     true_extra_bytes = extra_bytes - 4 # discount header
 
     if true_extra_bytes == 44: #extra ogg data
-      bs.asSigned(root["ogg_subtype"], tag="ogg subtype") # same as valid bits
-      #Begin Vorbis header 0x00
-      bs.asSigned(root["ogg_sample_count"], tag="ogg sample count")
-      #0x04
-      bs.asUnsigned(root["ogg_mod_signal"], tag="ogg mod signal")
-      #0x08
-      bs.asAny(root["ogg_unknown_1"], 8, tag="unknown ogg bytes")
-      #0x10
-      bs.asUnsigned(root["ogg_setup_packet_offset"], tag="ogg setup packet offset")
-      #0x14
-      bs.asUnsigned(root["ogg_first_audio_packet_offset"], tag="ogg first audio packet offset")
-      #0x18
-      bs.asAny(root["ogg_unknown_2"], 12, tag="unknown ogg bytes")
-      #0x24
-      bs.asUnsigned(root["ogg_uid"], tag="ogg uid")
-      #0x28
-      bs.asByte(root["ogg_blocksize_0_pow"], tag="ogg blocksize 0 pow")
-      #0x29
-      bs.asByte(root["ogg_blocksize_1_pow"], tag="ogg blocksize 1 pow")
-      #0x2A
+      bs.asLayout(root, WEM_OGG_LAYOUT)
     elif true_extra_bytes in [4,2]:
       bs.asSigned(root["valid_bits"],val=[12546,16641], tag="valid bits per sample? always 12546 or 16641")
       # bs.asShort(root["valid_bits"],val=[12546,16641], tag="valid bits per sample? always 12546 or 16641")
@@ -692,7 +2529,7 @@ class WEMParser(Parser):
           bs.asAny(root[""], 1, tag="???")
           break
 
-    wemdata = bs.iostream.getvalue()
+    wemdata = bs.getvalue()
     return wemdata
 
   def createMinimal(self, isOgg):
@@ -702,7 +2539,7 @@ class WEMParser(Parser):
     root["wem_wave"]         = b"WAVE"
     root["fmt_header"]       = b"fmt "
     root["fmt_size"]         = 66 if isOgg else 24
-    root[""]                 = 0
+    root["fmt_size_high"]    = 0
     root["compression_code"] = -1 if isOgg else -2 # -2 == no compression
     root["channels"]         = None
     root["sample_rate"]      = None
@@ -711,74 +2548,117 @@ class WEMParser(Parser):
     root["sample_width"]     = 0 if isOgg else None
     root["extra_bytes"]      = int(root["fmt_size"]) - 18
     root["extra_unk"]        = 0
-    if isOgg:
-      root["ogg_subtype"]                   = 12546
+    if isOgg: # filled in by loadFromOggFile()
+      root["ogg_subtype"]                   = None # channel config
       root["ogg_sample_count"]              = None
-      root["ogg_mod_signal"]                = 186 # unknown if this affects codebooks
-      root["ogg_unknown_1"]                 = b'\x14\xfb\x16\x00\x00\x00@\x00' #b'\0'*8 # need to edit?
-      root["ogg_setup_packet_offset"]       = 6016 # hardcode for beholster, need to edit
-      root["ogg_first_audio_packet_offset"] = int(root["ogg_mod_signal"]) + int(root["ogg_setup_packet_offset"])
-      root["ogg_unknown_2"]                 = b'\x05\x01@\x00\xf43\x00\x00\x945\x00\x00' #b'\0'*12 # need to edit?
-      root["ogg_uid"]                       = 2840645231 # hardcode for beholster, need to edit?
-      root["ogg_blocksize_0_pow"]           = 8
-      root["ogg_blocksize_1_pow"]           = 11
+      root["ogg_mod_signal"]                = None
+      root["ogg_loop_end_offset"]           = None
+      root["ogg_loop_begin_extra"]          = 0
+      root["ogg_loop_end_extra"]            = None
+      root["ogg_setup_packet_offset"]       = 0 # no seek table
+      root["ogg_first_audio_packet_offset"] = None
+      root["ogg_max_packet_size"]           = None
+      root["ogg_last_granule_extra"]        = None
+      root["ogg_decode_alloc_size"]         = WWISE_VORBIS_DECODE_ALLOC
+      root["ogg_decode_x64_alloc_size"]     = WWISE_VORBIS_DECODE_ALLOC64
+      root["ogg_uid"]                       = WWISE_VORBIS_CODEBOOK_HASH
+      root["ogg_blocksize_0_pow"]           = None
+      root["ogg_blocksize_1_pow"]           = None
     else:
       root["valid_bits"]       = 12546
-    root["junk_header"]      = b"JUNK"
-    root["junk_size"]        = 4
-    root["junk_data"]        = b'\0\0\0\0'
+      root["junk_header"]      = b"JUNK"
+      root["junk_size"]        = 4
+      root["junk_data"]        = b'\0\0\0\0'
     root["data_header"]      = b"data"
     root["data_chunk_size"]  = None
     root["wav_data"]         = None
     return self
 
-  def loadFromOggFile(self, file):
-    isOgg = True
-    self.createMinimal(isOgg = isOgg)
+  #Convert an Ogg Vorbis file to a Vorbis-encoded WEM, computing every header field from the stream
+  #  the setup header and audio packets are rewritten to Wwise's format (see convertVorbisSetup() and convertVorbisAudioPacket()),
+  #  each packet is stored with a 2-byte size header and no granule position, and there's no seek table, so the setup packet comes first
+  #  codebooks is the path of the codebook library the setup header's codebooks are looked up in
+  def loadFromOggFile(self,file,codebooks=None):
+    self.createMinimal(isOgg = True)
     root = self.root
 
-    wf        = SoundFile(file, 'r') # open any other audio file
-    rate      = wf.samplerate
-    total     = wf.frames
-    channels  = wf.channels
-    samples   = wf.frames
-
-    with open(file, 'rb') as fin:
-      wavdata = fin.read()[3675:] #[58:] # skip first 58 bytes
-    # wavdata = wf.read(dtype="int32")
-    # wavdata = wf.read(dtype="int32")
-    # wavdata = wf.read(dtype="float64")
-    print(f"ogg data: rate: {rate}, total: {total}, channels {channels}, data: {len(wavdata)} frames")
-
-    root["channels"]        = channels
-    root["sample_rate"]     = rate
-
-    root["avg_byte_rate"]   = 10458 # 0 # don't know how to compute
-    root["ogg_sample_count"] = 6350400 # samples
-
-    root["data_chunk_size"] = len(wavdata) #* 2#4#8
-    root["wav_data"]        = wavdata
-
-    root["wem_length"]      = root["data_chunk_size"] + 56
+    with open(file,'rb') as fin:
+      packets, samples = readOggPackets(fin.read())
+    if len(packets) < 3:
+      raise Exception(f"{file} is missing Vorbis headers")
+    channels, rate, _, bs0, bs1 = readVorbisIdHeader(packets[0])
+    if channels not in WWISE_CHANNEL_CONFIGS:
+      raise Exception(f"{file} has {channels} channels, only mono and stereo Ogg files are supported")
+    if (bs0, bs1) != WWISE_VORBIS_BLOCKSIZES:
+      warn(f"WARNING: {file} uses blocksizes {1 << bs0} / {1 << bs1}, which may not decode in game (only {' / '.join(str(1 << b) for b in WWISE_VORBIS_BLOCKSIZES)} have been tested)")
+    setup, blockflags = convertVorbisSetup(packets[2], channels, loadCodebookLibrary(codebooks or DEFAULT_CODEBOOKS_FILE))
+    mode_bits         = ilog(len(blockflags) - 1)
+
+    data        = bytearray(struct.pack('<H', len(setup)))
+    data       += setup
+    first_audio = len(data)
+    max_packet  = 0
+    decoded     = 0    # samples the decoder will produce, which can be a little more than the stream's length
+    prev        = None # blocksize of the previous audio packet
+    for packet in packets[3:]:
+      packet, mode = convertVorbisAudioPacket(packet, mode_bits, blockflags)
+      if len(packet) > 0xFFFF:
+        raise Exception(f"{file} has a Vorbis packet too large for Wwise ({len(packet)} bytes)")
+      data       += struct.pack('<H', len(packet))
+      data       += packet
+      max_packet  = max(max_packet, len(packet))
+      if mode is not None:
+        cur = 1 << (bs1 if blockflags[mode] else bs0)
+        if prev is not None:
+          decoded += prev // 4 + cur // 4
+        prev = cur
+    extra = min(0xFFFF, max(0, decoded - samples))
+    vprint(f"      >> ogg data: rate: {rate}, channels {channels}, samples: {samples}, packets: {len(packets) - 3}, data: {len(data)} bytes")
+
+    root["channels"]                      = channels
+    root["sample_rate"]                   = rate
+    root["avg_byte_rate"]                 = (len(data) * rate) // samples if samples > 0 else 0
+    root["ogg_subtype"]                   = WWISE_CHANNEL_CONFIGS[channels]
+    root["ogg_sample_count"]              = samples
+    root["ogg_mod_signal"]                = first_audio # loop the whole sound
+    root["ogg_loop_end_offset"]           = len(data)
+    root["ogg_loop_end_extra"]            = extra
+    root["ogg_first_audio_packet_offset"] = first_audio
+    root["ogg_max_packet_size"]           = max_packet
+    root["ogg_last_granule_extra"]        = extra
+    root["ogg_blocksize_0_pow"]           = bs0
+    root["ogg_blocksize_1_pow"]           = bs1
+
+    root["data_chunk_size"] = len(data)
+    root["wav_data"]        = bytes(data)
+
+    root["wem_length"]      = root["data_chunk_size"] + 86 # WAVE + fmt chunk + data header
 
     return self
 
-  def loadFromWavFile(self,file):
+  #if stream is True, only the wav header is read and the audio data is copied from the file when saving
+  #  manifest may be a WavManifest already read for file, so the header isn't parsed again
+  def loadFromWavFile(self,file,stream=False,manifest=None):
     self.createMinimal(isOgg = False)
     root = self.root
 
-    wf        = wave.open(file, 'rb')
-    rate      = wf.getframerate()
-    total     = wf.getnframes()
-    channels  = wf.getnchannels()
-    sampwidth = wf.getsampwidth()
+    m = manifest if manifest is not None else readWavManifest(file)
+    if m is None:
+      raise Exception(f"{file} is not a valid wave file")
+    if m.format_tag != WAVE_FORMAT_PCM:
+      raise Exception(f"{file} has unsupported format {m.format_tag}, only PCM wave files are supported")
+    rate      = m.rate
+    channels  = m.channels
+    sampwidth = m.sampwidth
 
-    wavdata   = wf.readframes(total)
+    wavdata = FileSlice(m.path, m.data_offset, m.data_size)
+    if not stream:
+      wavdata = wavdata.read()
 
     root["channels"]        = 2 #hack: all sound must be stereo
     root["sample_width"]    = sampwidth*8
     root["sample_rate"]     = channels*rate//2 #hack: halve sample rate for mono files to compensate
-    if rate < 16000 and channels == 1: #mono tracks with low sample rates have been known to be pitch shiften in game, so issue a warning here
+    if rate < MIN_MONO_RATE and channels == 1: #mono tracks with low sample rates have been known to be pitch shiften in game, so issue a warning here
       warn(f"WARNING: mono sound {file} is {rate}hz, less than minimum supported 16000hz.")
 
     # vprint(f"Data: rate={rate}, channels={channels}, frames={total}, width={sampwidth}")
@@ -794,13 +2674,16 @@ class WEMParser(Parser):
 
   def saveToWavFile(self,file):
     root = self.root
-    wf = wave.open(file, 'wb')
+    with wave.open(file, 'wb') as wf:
+      wf.setframerate(int(root["sample_rate"]))
+      wf.setnchannels(int(root["channels"]))
+      wf.setsampwidth(int(root["sample_width"]//8))
 
-    wf.setframerate(int(root["sample_rate"]))
-    wf.setnchannels(int(root["channels"]))
-    wf.setsampwidth(int(root["sample_width"]//8))
+      wf.writeframes(root["wav_data"].val)
 
-    wf.writeframes(root["wav_data"].val)
+  #whether our WEM data is uncompressed PCM (which can be saved straight to a .wav file)
+  def isPCM(self):
+    return int(self.root["compression_code"]) == -2
 
 # Parser for Gungeon BNK Data
 class BNKParser(Parser):
@@ -814,211 +2697,150 @@ class BNKParser(Parser):
   def __init__(self):
     super(BNKParser, self).__init__()
     self.n_embeds        = 0     #number of files currently embedded for wave export purposes
+    self.next_curve_id   = 900001 #RTPC curve id for the next embedded sound (non-magic, needs to be unique within the bank)
     self.next_wem_offset = 0     #byte offset within data section of next embedded WEM
     self.sound_params    = {}    #sound parameters
     self.embedded_files  = []    #list of filenames for embedded waves
     self.is_music        = False #whether we're currently parsing music
+    self.headers_only    = False #whether to skip over the DATA section when parsing
+    self.ids             = BnkIdRegistry() #all ids used by embedded sounds
+    self.data_offset     = 0     #byte offset of the DATA section's contents within the bank
+    self.dedupe          = False #whether to store identical WEM data only once
+    self.wem_digests     = {}    #WEM data hash -> wem file info of the first embedded copy, when deduplicating
+    self.deduped         = []    #(name, wem length) of each sound whose WEM data was shared with an earlier sound
 
   def parse(self,decoder,root,mode):
     super(BNKParser, self).parse(decoder,root,mode)
 
     bs = decoder
 
-    bs.asConst(root["bnk_head"] ,val=b'BKHD',tag="bkhd header")
-    bs.asSigned(root["seclen"]  ,val=[24,28],tag="section length")
-    bs.asSigned(root["version"]  ,tag="bank version")
-    bs.asUnsigned(root["bankid"] ,tag="bank id")
-    bs.asUnsigned(root[""]       ,tag="?????") # language id
-    bs.asSigned(root[""]         ,tag="?????")
-    bs.asSigned(root[""]         ,tag="?????")
-    bs.asSigned(root[""]         ,tag="padding")
+    bs.asLayout(root, BKHD_LAYOUT)
     if root["seclen"] == 28:
-      bs.asSigned(root[""]         ,tag="extra padding")
+      bs.asSigned(root["extra_padding"] ,tag="extra padding")
 
-    bs.asConst(root["didx_head"],val=b'DIDX',tag="didx header")
-    bs.asSigned(root["didx_seclen"],tag="section length")
+    bs.asLayout(root, DIDX_HEAD_LAYOUT)
     wemfiles            = root["didx_seclen"] // 12
     wemids              = []
     wemlengths          = []
     wemoffs             = []
-    # root["wemfileinfo"] = []
     for i in range(wemfiles):
       w = root["wemfileinfo"].next()
-      bs.asUnsigned(w["wemid"],tag=f"wem {i} id")
-      bs.asSigned(w["wemoff"],tag=f"wem {i} offset")
-      bs.asSigned(w["wemlen"],tag=f"wem {i} length")
-      wemids.append(w["wemid"])
-      wemoffs.append(w["wemoff"])
-      wemlengths.append(w["wemlen"])
-
-    bs.asConst(root["data_head"],val=b'DATA',tag="data header")
-    bs.asSigned(root["data_seclen"],tag="section length")
+      wemid, wemoff, wemlen = bs.asLayout(w, WEM_INFO_LAYOUT, i=i)
+      wemids.append(wemid)
+      wemoffs.append(wemoff)
+      wemlengths.append(wemlen)
+
+    bs.asLayout(root, DATA_HEAD_LAYOUT)
     wem_start = bs.bytes_read
+    self.data_offset = wem_start
+    if self.headers_only:
+      if mode == "write":
+        raise Exception("can't save a bank that was loaded with headers only")
+      bs.skip(int(root["data_seclen"]))
+      wemfiles = 0 # jump straight to the HIRC section
     for i in range(wemfiles):
       w     = root["wemfiledata"].next()
       extra = wemoffs[i]+wem_start-bs.bytes_read
       if extra > 0:
-        bs.asAny(w["extra_bytes"],extra)
+        bs.asAny(w["padding"],extra,tag=f"wem {i} padding")
+
+      if mode == "write" and w.checkKey("raw_wem"): # prebuilt WEM data (e.g., from a build cache)
+        bs.asAny(w["raw_wem"], len(w["raw_wem"].val), tag=f"wem {i} prebuilt data")
+        continue
 
       WEMParser().parse(bs,w,mode) # parse WEM substructure
       if DUMP_WAV_FILES:
         saveWAVData(f"/home/pretzel/downloads/{int(wemids[i])}.wav", w["wav_data"].val, int(w["channels"]), int(w["sample_rate"]), int(w["sample_width"]) // 8)
       # playWEMData(w["wem-data"])
 
-    bs.asConst(root["hirc_head"],val=b'HIRC',tag="hirc header")
-    bs.asSigned(root["hirc_seclen"],tag="section length")
-    bs.asSigned(root["hirc_numobjects"],tag="number of objects")
-    for i in range(int(root["hirc_numobjects"])):
-      h         = root["hircobjects"].next()
-      bs.asByte(h["type"],tag=f"obj {i} type")
-
-      if h["type"] == 2: #sound effect
-        bs.asSigned(h["subseclen"]      ,tag=f"SFX {i} subsection length")
-        bs.asUnsigned(h["sfx_id"]       ,tag=f"SFX {i} ID")
-        bs.asSigned(h["plugin_id"]      ,val=[65537,262145,131073],tag=f"SFX {i} PluginID (65537 = PCM, 131073 = ADPCM, 262145 = VORBIS)")
-        bs.asByte(h["external_state"] ,val=0,tag=f"SFX {i} external state (should be 0 == embedded)")
-        if h["external_state"] == 0:
-          bs.asUnsigned(h["wem_file_id"]      ,val=wemids,tag=f"SFX {i} WEM file id")
-          bs.asSigned(h["wem_file_num_bytes"] ,val=wemlengths,tag=f"SFX {i} in-memory byte length")
-        else:
-          raise Exception("don't know how to handle this event type")
-        bs.asByte(h["sfx_unknown"] ,val=0,tag=f"SFX {i} source bits (usually 0, see uSourceBits in XML)")
-
-        #begin sound structure section
-        bs.asByte(h["sfx_override_parent"]  ,val=[0,1],tag=f"SFX {i} override parent")
-        num_fx = bs.asByte(h["num_fx"]               ,tag=f"SFX {i} number of effects")
-        if num_fx > 0:
-          bs.asByte(h["fx_bypass"]               ,tag=f"SFX {i} bits effects bypass?")
-          for j in range(num_fx):
-            bs.asAny(h[""], 7, tag=f"SFX {i} FX {j} effect data")
-            # raise Exception("don't know how to handle this event type")
-
-        bs.asByte(h["override_attachments"] ,tag=f"SFX {i} override attachments")
-        bs.asUnsigned(h["bus_id"]               ,tag=f"SFX {i} bus id")
-        bs.asSigned(h["parent_id"]            ,tag=f"SFX {i} parent object id")
-        bs.asByte(h["misc_flags"]           ,tag=f"SFX {i} misc. flags")
-        bs.asByte(h["num_params"]           ,tag=f"SFX {i} num additional parameters")
-        for j in range(int(h["num_params"])):
-          p = h["param_type_list"].next()
-          bs.asByte(p,tag=f"SFX {i} param {j} type")
-        for j in range(int(h["num_params"])):
-          p = h["param_list"].next()
-          t = h["param_type_list"][j]
-          if t == 0: #volume
-            bs.asFloat(p["volume"],tag=f"SFX {i} param {j} volume (float)")
-          elif t == 58: #loop
-            bs.asSigned(p["num_loops"],tag=f"SFX {i} param {j} num loops (float, 0 == inf)")
-          else:
-            bs.asAny(p["param_value"], 4, tag=f"SFX {i} unknown param {j} value")
-
-        num_range_mods = bs.asByte(h["num_range_modifiers"], tag=f"SFX {i} num additional range paramters")
-        for j in range(num_range_mods):
-          p = h["range_param_type_list"].next()
-          bs.asByte(p,tag=f"SFX {i} range param {j} type")
-        for j in range(num_range_mods):
-          p = h["range_param_list"].next()
-          bs.asFloat(p["min_value"],tag=f"SFX {i} range param {j} min value (float)")
-          bs.asFloat(p["min_value"],tag=f"SFX {i} range param {j} max value (float)")
-
-        pos_data = bs.asByte(h["positioning_data"] ,tag=f"SFX {i} positioning data (7 is normal)")
-        if pos_data & 0b10000: # 3D bit is set
-          bs.asByte(h["positioning_data_3d"] ,tag=f"SFX {i} 3D positioning data")
-          bs.asSigned(p["3d_attenuation_id"],tag=f"SFX {i} param {j} 3D attenutation id")
-
-        aux = bs.asByte(h["aux_params"]           ,tag=f"SFX {i} aux parameters (if 4rd bit is set, we have aux params)")
-        if aux & 0b1000:
-          for j in range(4): # always exactly 4
-            auxid = bs.asSigned(h[""]   ,tag=f"SFX {i} aux {j} id")
-
-        bs.asByte(h["priority_tiebreak"]    ,tag=f"SFX {i} priority tiebreaker + other bits")
-        bs.asByte(h["virt_queue_behavior"]  ,tag=f"SFX {i} virtual queue behavior (1 == use virtual voice)")
-        bs.asShort(h["max_sounds"]           ,tag=f"SFX {i} max sound limit (0 == no limit)")
-        bs.asByte(h["below_thres_behavior"] ,tag=f"SFX {i} below threshold behavior (0 == continue to play)")
-        bs.asByte(h["envelope"]             ,tag=f"SFX {i} envelope bits")
-        bs.asByte(h["num_state_props"]      ,val=0,tag=f"SFX {i} number of state props (needs to be 0)")
-        bs.asByte(h["num_state_groups"]     ,val=0,tag=f"SFX {i} number of state groups (needs to be 0)")
-        bs.asShort(h["num_rtpcs"]            ,tag=f"SFX {i} num RTPCs")
-        for j in range(int(h["num_rtpcs"])):
-          r                    = h["rtpcs"].next()
-          bs.asUnsigned(r["x_axis"]          ,tag=f"SFX {i} RTPC {j} x-axis game parameter id")
-          bs.asByte(r["rtpc_type"]       ,val=0,tag=f"SFX {i} RTPC {j} type (0 == gameparameter)")
-          bs.asByte(r["rtpc_accum"]      ,val=2,tag=f"SFX {i} RTPC {j} accum (2 == additive)")
-          bs.asByte(r["rtpc_param"]      ,val=[0,2],tag=f"SFX {i} RTPC {j} parameter id (0 == volume, 2 == pitch)")
-          bs.asSigned(r["rtpc_curve_id"]   ,tag=f"SFX {i} RTPC {j} curve id")
-          bs.asByte(r["rtpc_scaling"]    ,val=[0,2],tag=f"SFX {i} RTPC {j} scaling (2 == decibels, 0 == none)")
-          bs.asShort(r["num_rtpc_points"] ,tag=f"SFX {i} RTPC {j} num points")
-          for k in range(int(r["num_rtpc_points"])):
-            p           = r["rtpc_points"].next()
-            bs.asFloat(p["x"]      , tag=f"SFX {i} RTPC {j} point {k} x coord")
-            bs.asFloat(p["y"]      , tag=f"SFX {i} RTPC {j} point {k} y coord")
-            bs.asSigned(p["interp"] , tag=f"SFX {i} RTPC {j} point {k} interpolation type (4 == linear)")
-
-      elif h["type"] == 3: #action
-        action_len = bs.asSigned(h["subseclen"]       ,tag=f"Action {i} subsection length")
-        bs.asUnsigned(h["action_id"]       ,tag=f"Action {i} ID")
-        bs.asByte(h["action_scope"]    ,tag=f"Action {i} action scope (byte 1/2) (3 == game object, 2 = global)")
-        bs.asByte(h["action_type"]     ,val=[1,2,3,4,12,14,18],tag=f"Action {i} action type (byte 2/2) (1 == stop, 2 pause, 3 resume, 4 play, 18 setState, 14 SetLPF_O, 12 set bus volume)")
-        bs.asUnsigned(h["action_sfx_id"],tag=f"Action {i} game object (SFX) id")
-        bs.asByte(h["action_bus_bits"] ,tag=f"Action {i} bus bits")
-        action_props = bs.asByte(h["action_props_1"], tag=f"Action {i} props (usually 0)")
-        for j in range(action_props):
-            bs.asAny(h[""], 1, tag=f"Action {i} prop {j} type")
-            bs.asAny(h[""], 4, tag=f"Action {i} prop {j} value")
-
-        range_props = bs.asByte(h["action_props_2"]  ,val=0,tag=f"Action {i} range props (needs to be 0)")
-        for j in range(range_props):
-            bs.asAny(h[""], 1, tag=f"Action {i} range prop {j} type")
-            bs.asAny(h[""], 4, tag=f"Action {i} range prop {j} value")
-
-        if int(h["action_type"]) == 4: #play
-          bs.asByte(h["action_play_fade_curve"] ,tag=f"Action {i} play fade curve (4 == linear)")
-          bs.asUnsigned(h["bank_id"] ,val=root["bankid"],tag=f"Action {i} bank id")
-        elif int(h["action_type"]) == 1: #stop
-          bs.asByte(h["action_stop_fade_curve"]     ,tag=f"Action {i} stop fade curve (4 == linear)")
-          bs.asByte(h["action_stop_flags"]          ,val=6,tag=f"Action {i} stop bit flags (6 == expected)")
-          exceptions = bs.asByte(h["action_stop_num_exceptions"], tag=f"Action {i} stop exception list size (usually 0)")
-          for j in range(exceptions):
-            bs.asSigned(h[""], tag=f"Action {i} exception {j} id")
-            bs.asByte(h[""], tag=f"Action {i} exception {j} is bus")
-
-        elif int(h["action_type"]) in [2,3]: #pause / resume
-          resume = int(h["action_type"]) == 3
-          flags = 6 if resume else 7
-          name = "resume" if resume else "pause"
-          bs.asByte(h["action_pause_fade_curve"]     ,tag=f"Action {i} {name} fade curve (4 == linear)")
-          bs.asByte(h["action_pause_flags"]          ,val=[6,7],tag=f"Action {i} {name} bit flags (6 or 7 == expected)")
-          bs.asByte(h["action_pause_num_exceptions"] ,val=0,tag=f"Action {i} {name} exception list size (needs to be 0)")
-        elif int(h["action_type"]) in [18]: #setState
-          bs.asSigned(h["action_state_group_id"], tag=f"Action {i} state group id")
-          bs.asSigned(h["action_state_target_id"], tag=f"Action {i} state target id")
-        elif int(h["action_type"]) in [14, 12]: #SetLPF_O, set bus volume
-          bs.asByte(h["action_lpf_bits"] , tag=f"Action {i} LPF bit vector")
-          bs.asByte(h["action_lpf_value_meaning"] , tag=f"Action {i} LPF value meaning")
-          bs.asFloat(h["action_lpf_random_base"] , tag=f"Action {i} LPF randomizer base")
-          bs.asFloat(h["action_lpf_random_min"] , tag=f"Action {i} LPF randomizer min")
-          bs.asFloat(h["action_lpf_random_max"] , tag=f"Action {i} LPF randomizer max")
-          exceptions = bs.asByte(h["action_stop_num_exceptions"], tag=f"Action {i} LPF exception list size (usually 0)")
-          for j in range(exceptions):
-            bs.asSigned(h[""], tag=f"Action {i} LPF exception {j} id")
-            bs.asByte(h[""], tag=f"Action {i} LPF exception {j} is bus")
-        else:
-          raise Exception("don't know how to handle this event type")
-
-      elif h["type"] == 4: #event
-        bs.asSigned(h["subseclen"] ,tag=f"Event {i} subsection length")
-        bs.asUnsigned(h["event_id"] ,tag=f"Event {i} id")
-        bs.asByte(h["num_events"] ,tag=f"Event {i} num actions")
-        for j in range(int(h["num_events"])):
-          e = h["events"].next()
-          bs.asUnsigned(e,tag=f"Event {i} action {j} id")
-
-      else:
-        sslen = bs.asSigned(h["subseclen"]      ,tag=f"Generic {i} subsection length")
-        bs.asAny(h[""], sslen)
-        # raise Exception(f"""unhandled HIRC event {int(h["type"])}""")
+    bs.asLayout(root, HIRC_HEAD_LAYOUT)
+    checks = { # use sets for WEM lookups so checking every sound is linear in the size of the bank
+      SFX_SOURCE_LAYOUT  : {"wem_file_id" : set(wemids), "wem_file_num_bytes" : set(wemlengths)},
+      ACTION_PLAY_LAYOUT : {"bank_id" : int(root["bankid"])},
+    }
+    if mode == "read":
+      objects = root["hircobjects"].val = []
+      for i in range(int(root["hirc_numobjects"])):
+        htype, subseclen = bs.readLayout(HIRC_OBJ_LAYOUT, i=i)
+        start = bs.bytes_read
+        h = HIRC_RECORD_TYPES.get(htype, HircGeneric)()
+        h.type = htype
+        h.decode(bs, i, subseclen, checks)
+        bs.expect(bs.bytes_read - start, subseclen, f"HIRC object {i} length")
+        objects.append(h)
+      if not args.skipchecks:
+        self.checkReferences()
+    else:
+      for i, h in enumerate(root["hircobjects"].val):
+        bs.writeLayout(HIRC_OBJ_LAYOUT, (h.type, h.size()), i=i)
+        h.encode(bs, i)
 
     self._valid = not bs.failed
-    return bs.iostream.getvalue()
+    return bs.getvalue()
+
+  #make sure every event's actions, every play action targeting this bank, and every embedded sound's WEM file refer to things in the bank
+  def checkReferences(self):
+    objects = self.root["hircobjects"].val
+    ids     = {h.objectId() for h in objects}
+    wems    = {int(w["wemid"]) : int(w["wemlen"]) for w in self.root["wemfileinfo"].val or []}
+    bank_id = int(self.root["bankid"])
+    for h in objects:
+      if isinstance(h, HircEvent):
+        for action_id in h.actions:
+          if action_id not in ids:
+            raise Exception(f"event {col.CRT}{h.event_id}{col.BLN} refers to action {col.CRT}{action_id}{col.BLN}, which isn't in the bank")
+      elif isinstance(h, HircAction) and h.action_type == 4 and h.bank_id == bank_id:
+        if h.action_sfx_id not in ids:
+          raise Exception(f"play action {col.CRT}{h.action_id}{col.BLN} refers to object {col.CRT}{h.action_sfx_id}{col.BLN}, which isn't in the bank")
+      elif isinstance(h, HircSound) and h.external_state == 0: # embedded
+        if h.wem_file_id not in wems:
+          raise Exception(f"sound {col.CRT}{h.sfx_id}{col.BLN} refers to WEM file {col.CRT}{h.wem_file_id}{col.BLN}, which isn't in the bank")
+        if wems[h.wem_file_id] != h.wem_file_num_bytes:
+          raise Exception(f"sound {col.CRT}{h.sfx_id}{col.BLN} expects WEM file {col.CRT}{h.wem_file_id}{col.BLN} to be {h.wem_file_num_bytes} bytes, but it's {wems[h.wem_file_id]} bytes")
+
+  #find RTPC curve ids used by more than one sound in the bank, returning a dict of {curve id : [sfx ids]}
+  def duplicateCurveIds(self):
+    users = {}
+    for h in self.root["hircobjects"].val or []:
+      if isinstance(h, HircSound):
+        for r in h.rtpcs:
+          users.setdefault(r.rtpc_curve_id, []).append(h.sfx_id)
+    return {curve_id : sfx_ids for curve_id, sfx_ids in users.items() if len(sfx_ids) > 1}
+
+  #load everything but the embedded WEM data from a bank (much faster when only the bank's structure is needed)
+  def loadHeadersFrom(self,file):
+    self.headers_only = True
+    return self.loadFrom(file)
+
+  #split the bank we were loaded from into its sections (BKHD, DIDX, DATA, HIRC, ...), returning a list of (name, start, end) byte ranges
+  def sections(self):
+    data     = self._mmap
+    sections = []
+    pos      = 0
+    while pos + 8 <= len(data):
+      tag, seclen = struct.unpack_from("<4sI", data, pos)
+      end         = min(len(data), pos + 8 + seclen)
+      sections.append((tag.decode("ascii", errors="replace"), pos, end))
+      pos = end
+    if pos < len(data):
+      sections.append(("trailing bytes", pos, len(data)))
+    return sections
+
+  #build an index of all events, actions, sounds, and WEM files in a loaded bank
+  #  wem offsets are relative to the start of the bank file
+  def buildIndex(self):
+    root  = self.root
+    index = {"events" : {}, "actions" : {}, "sfx" : {}, "wems" : {}}
+    for w in root["wemfileinfo"].val or []:
+      index["wems"][int(w["wemid"])] = (self.data_offset + int(w["wemoff"]), int(w["wemlen"]))
+    for h in root["hircobjects"].val or []:
+      if isinstance(h, HircSound):
+        index["sfx"][h.sfx_id] = h.wem_file_id
+      elif isinstance(h, HircAction):
+        index["actions"][h.action_id] = (h.action_type, h.action_sfx_id)
+      elif isinstance(h, HircEvent):
+        index["events"][h.event_id] = list(h.actions)
+    return index
 
   def createMinimal(self,bankid):
     root                    = self.root
@@ -1026,11 +2848,11 @@ class BNKParser(Parser):
     root["seclen"]          = 24
     root["version"]         = 128
     root["bankid"]          = bankid
-    root[""]                = bankid
-    # root[""]                = 393239870 # stringToBnkID("SFX") [marked internally as "dwLanguageID", should maybe also be bankid?]
-    root[""]                = 0
-    root[""]                = 0
-    root[""]                = 0
+    root["language_id"]     = bankid
+    # root["language_id"]     = 393239870 # stringToBnkID("SFX") [marked internally as "dwLanguageID", should maybe also be bankid?]
+    root["alt_values"]      = 0
+    root["project_id"]      = 0
+    root["padding"]         = 0
 
     root["didx_head"]       = b'DIDX'
     root["didx_seclen"]     = 0
@@ -1047,11 +2869,87 @@ class BNKParser(Parser):
 
     return self
 
-  def createExampleSpreadsheet(self,fname):
+  #append a WEM file's raw bytes (e.g., a FileSlice of another bank) to the DIDX and DATA sections
+  #  align pads the WEM's offset within the DATA section to a multiple of align bytes
+  def appendRawWem(self,wemid,data,align=1):
+    root = self.root
+    pad  = (-self.next_wem_offset) % align
+
+    root["didx_seclen"]  += 12
+    wfi                   = Ref({})
+    wfi["wemid"]          = wemid
+    wfi["wemoff"]         = self.next_wem_offset + pad
+    wfi["wemlen"]         = len(data)
+    self.next_wem_offset += pad + len(data)
+    root["wemfileinfo"].append(wfi.val)
+
+    root["data_seclen"]  += pad + len(data)
+    w                     = Ref({})
+    if pad > 0:
+      w["padding"]        = b'\0' * pad
+    w["raw_wem"]          = data
+    root["wemfiledata"].append(w.val)
+    return wfi
+
+  #merge every WEM file and HIRC object of an existing bank into this one without decoding any audio
+  #  WEM data is copied byte-for-byte from the original file when saving, and play actions for the old bank are retargeted to this one
+  #  objects and WEM files whose ids are in replace_ids are left out so they can be replaced by newly embedded sounds
+  def mergeBank(self,file,replace_ids=()):
+    other       = BNKParser().loadHeadersFrom(file)
+    oroot       = other.root
+    old_bank_id = int(oroot["bankid"])
+    new_bank_id = int(self.root["bankid"])
+    source      = os.path.basename(file)
+
+    # sounds we keep may share WEM data with a sound being replaced (in banks built with --dedupe), so keep that data under a new id
+    kept   = [h for h in oroot["hircobjects"].val or [] if isinstance(h, HircSound) and h.sfx_id not in replace_ids]
+    rehome = {}
+    for h in kept:
+      if h.wem_file_id in replace_ids:
+        h.wem_file_id = rehome.setdefault(h.wem_file_id, stringToBnkID(str(h.sfx_id))) # non-magic, needs to be unique
+
+    wems  = oroot["wemfileinfo"].val or []
+    align = 16 if all(int(w["wemoff"]) % 16 == 0 for w in wems) else 1 # keep WEM files aligned if they were originally
+    for w in wems:
+      wemid, wemoff, wemlen = int(w["wemid"]), int(w["wemoff"]), int(w["wemlen"])
+      if wemid in replace_ids and wemid not in rehome:
+        continue
+      wemid = rehome.get(wemid, wemid)
+      self.ids.register(wemid, f"wem {labelId(wemid)}", source)
+      self.appendRawWem(wemid, FileSlice(file, other.data_offset + wemoff, wemlen), align=align)
+
+    nobjects = 0
+    for h in oroot["hircobjects"].val or []:
+      if h.objectId() in replace_ids:
+        continue
+      self.ids.register(h.objectId(), f"object {labelId(h.objectId())}", source)
+      if isinstance(h, HircGeneric):
+        h.data = bytes(h.data) # don't hold on to views of the other bank's memory map
+      elif isinstance(h, HircAction) and h.action_type == 4 and h.bank_id == old_bank_id:
+        h.bank_id = new_bank_id
+      elif isinstance(h, HircSound) and h.rtpcs: # allocate curve ids for new sounds past any the merged sounds use
+        self.next_curve_id = max(self.next_curve_id, max(r.rtpc_curve_id for r in h.rtpcs) + 1)
+      self.updateHircMetadata(h)
+      nobjects += 1
+
+    other.close()
+    vprint(f"    >> merged {len(wems)} WEM files and {nobjects} HIRC objects from {file}")
+    return self
+
+  #analysis is an optional {sound name : analysis} dict from analyzeWavs(), used to fill in loudness columns and suggested volumes
+  #  names defaults to the sounds embedded in this bank
+  def createExampleSpreadsheet(self,fname,names=None,analysis=None,target_db=-20.0):
     keys = ["name"] + [k for k in self.default_sound_params.keys()]
+    if analysis is not None:
+      keys += ANALYSIS_COLUMNS
     rows = [keys]
-    for f in self.embedded_files:
-      rows.append([f] + [v for k,v in self.default_sound_params.items()])
+    for f in (self.embedded_files if names is None else names):
+      row = [f] + [v for k,v in self.default_sound_params.items()]
+      if analysis is not None and f in analysis:
+        a                         = analysis[f]
+        row[keys.index("volume")] = suggestVolume(a, target_db)
+        row                      += [a["rms_db"], a["peak_db"], suggestVolume(a, target_db)]
+      rows.append(row)
     with open(fname,'w') as fout:
       writer = csv.writer(fout)
       for row in rows:
@@ -1060,153 +2958,90 @@ class BNKParser(Parser):
   def setSoundParams(self,sound_params):
     self.sound_params = sound_params
 
-  def addDefaultVolumeRTPCToSFX(self,hirc_root):
-    h = hirc_root
-    rtpc_curve_id        = self.n_embeds+900000 # non-magic, needs to be unique
-
-    h["num_rtpcs"]      += 1
-    r                    = h["rtpcs"].next()
-    r["x_axis"]          = GUNGEON_RTPC_ID_MUSIC if self.is_music else GUNGEON_RTPC_ID_SFX
-    r["rtpc_type"]       = 0 # 0 == volume
-    r["rtpc_accum"]      = 2 # 2 == additive
-    r["rtpc_param"]      = 0
-    r["rtpc_curve_id"]   = rtpc_curve_id
-    r["rtpc_scaling"]    = 2
-    r["num_rtpc_points"] = 2
-
-    r1                   = r["rtpc_points"].next()
-    r1["x"]              = 0.0
-    r1["y"]              = -1.0
-    r1["interp"]         = 4 #linear
-
-    r2                   = r["rtpc_points"].next()
-    r2["x"]              = 100.0
-    r2["y"]              = 0.0
-    r2["interp"]         = 4 #linear
-
-    h["subseclen"]      += 39
-
-  def updateHircMetadataFromRef(self,h):
-    self.root["hirc_seclen"]     += 1                   #size of hircobject->type
-    self.root["hirc_seclen"]     += 4                   #size of hircobject->subseclen
-    self.root["hirc_seclen"]     += int(h["subseclen"]) #total length of fields added above
+  def addDefaultVolumeRTPCToSFX(self,sfx):
+    rtpc_curve_id       = self.next_curve_id
+    self.next_curve_id += 1
+    sfx.rtpcs.append(HircRTPC(
+      x_axis        = GUNGEON_RTPC_ID_MUSIC if self.is_music else GUNGEON_RTPC_ID_SFX,
+      rtpc_type     = 0, # 0 == volume
+      rtpc_accum    = 2, # 2 == additive
+      rtpc_param    = 0,
+      rtpc_curve_id = rtpc_curve_id,
+      rtpc_scaling  = 2,
+      points        = [
+        (  0.0, -1.0, 4), # (x, y, 4 == linear)
+        (100.0,  0.0, 4), # (x, y, 4 == linear)
+      ]))
+
+  def updateHircMetadata(self,h):
+    self.root["hirc_seclen"]     += HIRC_OBJ_LAYOUT.size #size of hircobject->type and hircobject->subseclen
+    self.root["hirc_seclen"]     += h.size()             #total length of the object's fields
     self.root["hirc_numobjects"] += 1
-    self.root["hircobjects"].append(h.val)
-
-  def addDefaultVolumeParamToSFX(self,h,volume=1.0):
-    h["num_params"] += 1
-    h["param_type_list"].append(0) #volume type
-    vol = h["param_list"].next()
-    vol["volume"] = volume #volume value
-    h["subseclen"] += 5
-
-  def addDefaultLoopParamToSFX(self,h,num_loops=1):
-    h["num_params"] += 1
-    h["param_type_list"].append(58) #loop type
-    loop = h["param_list"].next()
-    loop["num_loops"] = num_loops #number of loops (0 == infinite)
-    h["subseclen"] += 5
+    self.root["hircobjects"].val.append(h)
+
+  def addDefaultVolumeParamToSFX(self,sfx,volume=1.0):
+    sfx.params.append([0, float(volume)]) #volume type, volume value
+
+  def addDefaultLoopParamToSFX(self,sfx,num_loops=1):
+    sfx.params.append([58, int(num_loops)]) #loop type, number of loops (0 == infinite)
 
   def addHircSFX(self,sfx_id,wfi,isOgg,limit):
-    h                         = Ref({})
-    h["type"]                 = HIRC_TYPE_SFX
-    h["subseclen"]            = 43 #minimum length of subsection
-      # + (5 * num_params)
-      # + (1 if num_effects > 0)
-      # + (7 * num_effects)
-      # + (total size of rtpcs)
-      #     (each rtpc is 15 + 12*num_points bytes)
-    h["sfx_id"]               = sfx_id
-    h["plugin_id"]            = 262145 if isOgg else 65537
-    h["external_state"]       = 0 # 0 == embedded
-    h["wem_file_id"]          = int(wfi["wemid"])
-    h["wem_file_num_bytes"]   = int(wfi["wemlen"])
-    h["sfx_unknown"]          = 0
-    h["sfx_override_parent"]  = 0
-    h["num_fx"]               = 0
-    h["override_attachments"] = 0
-    h["bus_id"]               = GUNGEON_BUS_ID
-    h["parent_id"]            = 0 # 90804066 for music???
-    h["misc_flags"]           = 0
-    h["num_params"]           = 0
-    h["num_range_modifiers"]  = 0
-    h["positioning_data"]     = 7
-    h["aux_params"]           = 0
-    h["priority_tiebreak"]    = 8 # 0 == follow parent, 8 == ignore parent, destroy oldest, 9 == ignore parent, destroy newest
-    h["virt_queue_behavior"]  = 1
-    h["max_sounds"]           = limit # 0
-    h["below_thres_behavior"] = 0
-    h["envelope"]             = 0
-    h["num_state_props"]      = 0
-    h["num_state_groups"]     = 0
-    h["num_rtpcs"]            = 0
+    h                      = HircSound()
+    h.sfx_id               = sfx_id
+    h.plugin_id            = 262145 if isOgg else 65537
+    h.external_state       = 0 # 0 == embedded
+    h.wem_file_id          = int(wfi["wemid"])
+    h.wem_file_num_bytes   = int(wfi["wemlen"])
+    h.bus_id               = GUNGEON_BUS_ID
+    h.parent_id            = 0 # 90804066 for music???
+    h.positioning_data     = 7
+    h.aux_params           = 0
+    h.priority_tiebreak    = 8 # 0 == follow parent, 8 == ignore parent, destroy oldest, 9 == ignore parent, destroy newest
+    h.virt_queue_behavior  = 1
+    h.max_sounds           = int(limit) # 0
     return h
 
   def addHircPlayAction(self,action_id,sfx_id):
-    h                           = Ref({})
-    h["type"]                   = HIRC_TYPE_ACTION
-    h["subseclen"]              = 18 #always 18 for play events?
-    h["action_id"]              = action_id
-    h["action_scope"]           = 3 # 3 == game object, 2 == global
-    h["action_type"]            = 4 # 4 == play, 1 == stop
-    h["action_sfx_id"]          = sfx_id
-    h["action_bus_bits"]        = 0
-    h["action_props_1"]         = 0
-    h["action_props_2"]         = 0
-    h["action_play_fade_curve"] = 4 # 4 == linear
-    h["bank_id"]                = int(self.root["bankid"])
+    h                 = HircAction(4) # 4 == play, 1 == stop
+    h.action_id       = action_id
+    h.action_scope    = 3 # 3 == game object, 2 == global
+    h.action_sfx_id   = sfx_id
+    h.fade_curve      = 4 # 4 == linear
+    h.bank_id         = int(self.root["bankid"])
     return h
 
   def addHircPauseAction(self,action_id,sfx_id,resume=False):
-    h                                = Ref({})
-    h["type"]                        = HIRC_TYPE_ACTION
-    h["subseclen"]                   = 16 #always 16 for pause events?
-    h["action_id"]                   = action_id
-    h["action_scope"]                = 4 if self.is_music else 3 # 3 == game object, 2 == global, 4 == also global???
-    h["action_type"]                 = 3 if resume else 2 # 2 == pause, 3 = resume
-    h["action_sfx_id"]               = sfx_id
-    h["action_bus_bits"]             = 0
-    h["action_props_1"]              = 0
-    h["action_props_2"]              = 0
-    h["action_pause_fade_curve"]     = 4 # 4 == linear
-    h["action_pause_flags"]          = 7 # magic numbers (7 allows a master pause / resume)
-    h["action_pause_num_exceptions"] = 0
-    h["bank_id"]                     = int(self.root["bankid"])
+    h                 = HircAction(3 if resume else 2) # 2 == pause, 3 = resume
+    h.action_id       = action_id
+    h.action_scope    = 4 if self.is_music else 3 # 3 == game object, 2 == global, 4 == also global???
+    h.action_sfx_id   = sfx_id
+    h.fade_curve      = 4 # 4 == linear
+    h.flags           = 7 # magic numbers (7 allows a master pause / resume)
     return h
 
   def addHircStopAction(self,action_id,sfx_id,stop_all=False):
-    h                               = Ref({})
-    h["type"]                       = HIRC_TYPE_ACTION
-    h["subseclen"]                  = 16 #always 16 for stop events?
-    h["action_id"]                  = action_id
-    h["action_scope"]               = 2 if (stop_all or self.is_music) else 3 # 3 == game object, 2 == global
-    h["action_type"]                = 1 # 4 == play, 1 == stop
-    h["action_sfx_id"]              = sfx_id
-    h["action_bus_bits"]            = 0
-    h["action_props_1"]             = 0
-    h["action_props_2"]             = 0
-    h["action_stop_fade_curve"]     = 4 # 4 == linear
-    h["action_stop_flags"]          = 6 # 6 == magic number
-    h["action_stop_num_exceptions"] = 0
-    h["bank_id"]                    = int(self.root["bankid"])
+    h                 = HircAction(1) # 4 == play, 1 == stop
+    h.action_id       = action_id
+    h.action_scope    = 2 if (stop_all or self.is_music) else 3 # 3 == game object, 2 == global
+    h.action_sfx_id   = sfx_id
+    h.fade_curve      = 4 # 4 == linear
+    h.flags           = 6 # 6 == magic number
     return h
 
   def addHircEvent(self,event_id):
-    h               = Ref({})
-    h["type"]       = HIRC_TYPE_EVENT
-    h["subseclen"]  = 5
-    h["event_id"]   = event_id
-    h["num_events"] = 0
-    return h
+    return HircEvent(event_id)
 
   def addHircActionToHircEvent(self,action_id,hirc_event):
-    h = hirc_event
-    h["num_events"] += 1
-    h["subseclen"]  += 4
-    h["events"].append(action_id)
+    hirc_event.actions.append(action_id)
 
-  def embedFromWav(self, wavfile, isOgg):
-    base_fname   = os.path.splitext(os.path.basename(wavfile))[0]
+  def embedFromWav(self, wavfile, isOgg, stream=False):
+    return self.embedPrepared(prepareEmbed(wavfile, isOgg, stream=stream))
+
+  #embed a wav file that has already been loaded by prepareEmbed()
+  def embedPrepared(self, prepared):
+    base_fname   = prepared["name"]
+    ids          = prepared["ids"]
+    isOgg        = prepared["isOgg"]
     self.embedded_files.append(base_fname)
     sound_params = None
 
@@ -1222,105 +3057,341 @@ class BNKParser(Parser):
     root           = self.root
     self.n_embeds += 1
 
-    # Set up unique generated ids
-    play_event_id      = stringToBnkID(base_fname)
-    pause_event_id     = stringToBnkID(base_fname+"_pause")
-    resume_event_id    = stringToBnkID(base_fname+"_resume")
-    stop_event_id      = stringToBnkID(base_fname+"_stop")
-    stop_all_event_id  = stringToBnkID(base_fname+"_stop_all")
-    wemid              = stringToBnkID(base_fname+"_wem_id")   #non-magic, needs to be unique
-    sfx_id             = stringToBnkID(base_fname+"_sfx_id")   #non-magic, needs to be unique
-    play_action_id     = stringToBnkID(str(play_event_id))     #non-magic, needs to be unique
-    pause_action_id    = stringToBnkID(str(pause_event_id))    #non-magic, needs to be unique
-    resume_action_id   = stringToBnkID(str(resume_event_id))   #non-magic, needs to be unique
-    stop_action_id     = stringToBnkID(str(stop_event_id))     #non-magic, needs to be unique
-    stop_all_action_id = stringToBnkID(str(stop_all_event_id)) #non-magic, needs to be unique
+    # Make sure none of our ids clash with ids already in the bank
+    self.ids.registerAll(ids, embedIdNames(base_fname, ids), prepared["file"])
+
+    # Unpack unique generated ids
+    play_event_id      = ids["play_event_id"]
+    pause_event_id     = ids["pause_event_id"]
+    resume_event_id    = ids["resume_event_id"]
+    stop_event_id      = ids["stop_event_id"]
+    stop_all_event_id  = ids["stop_all_event_id"]
+    wemid              = ids["wemid"]
+    sfx_id             = ids["sfx_id"]
+    play_action_id     = ids["play_action_id"]
+    pause_action_id    = ids["pause_action_id"]
+    resume_action_id   = ids["resume_action_id"]
+    stop_action_id     = ids["stop_action_id"]
+    stop_all_action_id = ids["stop_all_action_id"]
     vprint(f"      >> event id for playing      '{base_fname            }' -> {play_event_id}")
     vprint(f"      >> event id for pausing      '{base_fname+'_pause'   }' -> {pause_event_id}")
     vprint(f"      >> event id for resuming     '{base_fname+'_resume'  }' -> {resume_event_id}")
     vprint(f"      >> event id for stopping     '{base_fname+'_stop'    }' -> {stop_event_id}")
     vprint(f"      >> event id for stopping all '{base_fname+'_stop_all'}' -> {stop_all_event_id}")
 
-    # Load the wavfile as a WEM
-    if isOgg:
-      wp = WEMParser().loadFromOggFile(wavfile)
-    else:
-      wp = WEMParser().loadFromWavFile(wavfile)
-
-    # Create the wem info header
-    root["didx_seclen"]  += 12
-    wfi                   = Ref({})
-    wfi["wemid"]          = wemid
-    wfi["wemoff"]         = self.next_wem_offset # needs to be updated for each wem
-    wfi["wemlen"]         = int(wp.root["wem_length"])+8
-    self.next_wem_offset += int(wfi["wemlen"])
-    root["wemfileinfo"].append(wfi.val)
-
-    # Create the wem data
-    root["data_seclen"] += int(wfi["wemlen"]) #todo: might need padding
-    root["wemfiledata"].append(wp.root.val)
+    wem = prepared["wem"]
+
+    # Reuse the WEM data of an earlier sound if it's identical
+    wfi = None
+    if self.dedupe:
+      if prepared.get("wem_sha1", None) is None:
+        prepared["wem_sha1"] = wemDigest(wem)
+      wfi = self.wem_digests.get(prepared["wem_sha1"], None)
+      if wfi is not None:
+        vprint(f"      >> WEM data is identical to {wfi['wemid']}, sharing it")
+        self.deduped.append((base_fname, prepared["wemlen"]))
+
+    if wfi is None:
+      # Create the wem info header
+      root["didx_seclen"]  += 12
+      wfi                   = Ref({})
+      wfi["wemid"]          = wemid
+      wfi["wemoff"]         = self.next_wem_offset # needs to be updated for each wem
+      wfi["wemlen"]         = prepared["wemlen"]
+      self.next_wem_offset += int(wfi["wemlen"])
+      root["wemfileinfo"].append(wfi.val)
+
+      # Create the wem data
+      root["data_seclen"] += int(wfi["wemlen"]) #todo: might need padding
+      root["wemfiledata"].append(wem.val)
+      if self.dedupe:
+        self.wem_digests[prepared["wem_sha1"]] = wfi
+    prepared["wem_file_id"] = int(wfi["wemid"])
 
     # Create the hirc SFX data
     sfx = self.addHircSFX(sfx_id,wfi,isOgg=isOgg,limit=sound_params.get("limit",0))
     self.addDefaultVolumeParamToSFX(sfx,volume=sound_params.get("volume",1.0))
     self.addDefaultLoopParamToSFX(sfx,num_loops=sound_params.get("loops",1))
     self.addDefaultVolumeRTPCToSFX(sfx)
-    self.updateHircMetadataFromRef(sfx)
+    self.updateHircMetadata(sfx)
 
     # Create the play action
     play_action = self.addHircPlayAction(play_action_id,sfx_id)
-    self.updateHircMetadataFromRef(play_action)
+    self.updateHircMetadata(play_action)
 
     # Create the play event
     play_event = self.addHircEvent(play_event_id)
     self.addHircActionToHircEvent(play_action_id,play_event)
-    self.updateHircMetadataFromRef(play_event)
+    self.updateHircMetadata(play_event)
 
     # Create the pause action
     pause_action = self.addHircPauseAction(pause_action_id,sfx_id,resume=False)
-    self.updateHircMetadataFromRef(pause_action)
+    self.updateHircMetadata(pause_action)
 
     # Create the pause event
     pause_event = self.addHircEvent(pause_event_id)
     self.addHircActionToHircEvent(pause_action_id,pause_event)
-    self.updateHircMetadataFromRef(pause_event)
+    self.updateHircMetadata(pause_event)
 
     # Create the resume action
     resume_action = self.addHircPauseAction(resume_action_id,sfx_id,resume=True)
-    self.updateHircMetadataFromRef(resume_action)
+    self.updateHircMetadata(resume_action)
 
     # Create the resume event
     resume_event = self.addHircEvent(resume_event_id)
     self.addHircActionToHircEvent(resume_action_id,resume_event)
-    self.updateHircMetadataFromRef(resume_event)
+    self.updateHircMetadata(resume_event)
 
     # Create the stop action
     stop_action = self.addHircStopAction(stop_action_id,sfx_id,stop_all=False)
-    self.updateHircMetadataFromRef(stop_action)
+    self.updateHircMetadata(stop_action)
 
     # Create the stop event
     stop_event = self.addHircEvent(stop_event_id)
     self.addHircActionToHircEvent(stop_action_id,stop_event)
-    self.updateHircMetadataFromRef(stop_event)
+    self.updateHircMetadata(stop_event)
 
     # Create the stop all action
     stop_all_action = self.addHircStopAction(stop_all_action_id,sfx_id,stop_all=True)
-    self.updateHircMetadataFromRef(stop_all_action)
+    self.updateHircMetadata(stop_all_action)
 
     # Create the stop all event
     stop_all_event = self.addHircEvent(stop_all_event_id)
     self.addHircActionToHircEvent(stop_all_action_id,stop_all_event)
-    self.updateHircMetadataFromRef(stop_all_event)
+    self.updateHircMetadata(stop_all_event)
 
     return self
 
+# Hash the bytes a prepared WEM (either a parsed WEM or prebuilt raw_wem data) is saved as, without keeping them in memory
+def wemDigest(wem):
+  sink = HashSink()
+  if wem.checkKey("raw_wem"):
+    data = wem["raw_wem"].val
+    if isinstance(data,FileSlice):
+      data.copyTo(sink)
+    else:
+      sink.write(data)
+  else:
+    decoder = Decoder(None,"write",stream=sink)
+    decoder.dontPrint()
+    WEMParser().parse(decoder,wem,"write")
+    wem.resetState()
+  return sink.hexdigest()
+
+# Suffixes appended to a sound's name to generate each of its name-based ids
+EMBED_ID_SUFFIXES = {
+  "play_event_id"     : "",
+  "pause_event_id"    : "_pause",
+  "resume_event_id"   : "_resume",
+  "stop_event_id"     : "_stop",
+  "stop_all_event_id" : "_stop_all",
+  "wemid"             : "_wem_id", #non-magic, needs to be unique
+  "sfx_id"            : "_sfx_id", #non-magic, needs to be unique
+}
+
+# Get the names used to generate each id for a sound (for error messages)
+def embedIdNames(base_fname, ids):
+  names = {k : base_fname + suffix for k, suffix in EMBED_ID_SUFFIXES.items()}
+  for event in ["play", "pause", "resume", "stop", "stop_all"]:
+    names[f"{event}_action_id"] = f"{names[event+'_event_id']} action ({ids[event+'_event_id']})"
+  return names
+
+# Generate all of the ids used for embedding a sound in a bank
+def embedIds(base_fname):
+  # all names share base_fname as a prefix, so hash it only once
+  ids = dict(zip(EMBED_ID_SUFFIXES.keys(), stringsToBnkIDs(base_fname, EMBED_ID_SUFFIXES.values())))
+  ids["play_action_id"]     = stringToBnkID(str(ids["play_event_id"]))     #non-magic, needs to be unique
+  ids["pause_action_id"]    = stringToBnkID(str(ids["pause_event_id"]))    #non-magic, needs to be unique
+  ids["resume_action_id"]   = stringToBnkID(str(ids["resume_event_id"]))   #non-magic, needs to be unique
+  ids["stop_action_id"]     = stringToBnkID(str(ids["stop_event_id"]))     #non-magic, needs to be unique
+  ids["stop_all_action_id"] = stringToBnkID(str(ids["stop_all_event_id"])) #non-magic, needs to be unique
+  return ids
+
+# Load a wav file and generate all of its ids for embedding in a sound bank
+#   Independent of any BNKParser state so it can run in a worker process; results are passed to BNKParser.embedPrepared()
+#   If hash_file is True, also record the file's size, mtime, and hash for BankCache
+#  wav may be either a path or a WavManifest
+#  If normalize is given (a dict with the target "rate" and "cachedir"), the wav file is converted to 16-bit stereo first
+def prepareEmbed(wav, isOgg, stream=False, create_wem=False, hash_file=False, normalize=None):
+  wavfile    = wavPath(wav)
+  manifest   = wav if isinstance(wav, WavManifest) else None
+  base_fname = os.path.splitext(os.path.basename(wavfile))[0]
+  if hash_file:
+    st = manifest if manifest is not None else os.stat(wavfile)
+    size, mtime_ns = (st.size, st.mtime_ns) if manifest is not None else (st.st_size, st.st_mtime_ns)
+
+  # Set up unique generated ids
+  ids = embedIds(base_fname)
+
+  # Convert the wavfile to a format the game supports (and / or trim it) if requested
+  bytes_saved = 0
+  if normalize is not None and not isOgg:
+    original    = manifest if manifest is not None else readWavManifest(wavfile)
+    manifest    = normalizeWav(original, normalize)
+    bytes_saved = original.data_size - manifest.data_size
+
+  # Load the wavfile as a WEM
+  if isOgg:
+    wp = WEMParser().loadFromOggFile(wavfile, codebooks=args.codebooks)
+  else:
+    wp = WEMParser().loadFromWavFile(wavfile, stream=stream, manifest=manifest)
+
+  if create_wem and isOgg:
+    wp.saveTo(f"{os.path.splitext(wavfile)[0]}.wem")
+  elif create_wem:
+    convertWavToWem(wavfile, stream=stream, manifest=manifest)
+
+  prepared = {
+    "file"      : wavfile,
+    "name"      : base_fname,
+    "isOgg"     : isOgg,
+    "ids"       : ids,
+    "wem"       : wp.root,
+    "wemlen"    : int(wp.root["wem_length"])+8,
+    "normalize" : normalizeKey(normalize),
+    "saved"     : bytes_saved,
+  }
+  if hash_file:
+    prepared["size"]     = size
+    prepared["mtime_ns"] = mtime_ns
+    prepared["sha1"]     = hashFile(wavfile)
+  return prepared
+
+# Prepare a list of wav files for embedding, yielding results in the same order as the list
+#   Files that haven't changed since they were cached are reused, the rest are loaded using up to jobs worker processes
+def prepareEmbeds(wavs_to_parse, jobs=1, stream=False, create_wems=False, cache=None, normalize=None):
+  if cache is None:
+    prepared = [None] * len(wavs_to_parse)
+  else:
+    prepared = [cache.lookup(w, isOgg = wavPath(w).endswith(".ogg"), create_wem=create_wems, normalize=normalizeKey(normalize)) for w in wavs_to_parse]
+  todo = [w for w,p in zip(wavs_to_parse, prepared) if p is None]
+  if cache is not None:
+    vprint(f"  >> reusing {len(wavs_to_parse)-len(todo)} cached .wav files, loading {len(todo)} new or changed .wav files")
+
+  pool = None
+  n    = len(todo)
+  if jobs > 1 and n > 1:
+    # load wav files in parallel, but embed them in the same order as a serial build so the bank is identical
+    vprint(f"  >> loading .wav files with {jobs} worker processes")
+    pool    = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+    results = pool.map(prepareEmbed,
+      todo,
+      [wavPath(w).endswith(".ogg") for w in todo],
+      [stream] * n,
+      [create_wems] * n,
+      [cache is not None] * n,
+      [normalize] * n,
+      chunksize=max(1, n // (jobs * 4)))
+  else:
+    results = (prepareEmbed(w, isOgg = wavPath(w).endswith(".ogg"), stream=stream, create_wem=create_wems, hash_file=cache is not None, normalize=normalize) for w in todo)
+
+  try:
+    for p in prepared:
+      yield p if p is not None else next(results)
+  finally:
+    if pool is not None:
+      pool.shutdown(cancel_futures=True)
+
+# Sidecar cache of the WEM data embedded in a bank for each wav file, used to quickly rebuild banks when only a few files change
+#   Files are matched by path, size, and mtime (falling back to a content hash if only the mtime changed),
+#   and their WEM data is copied straight out of the previously built bank
+class BankCache(object):
+  version = 1
+
+  def __init__(self,bankfile):
+    self.bankfile  = bankfile
+    self.cachefile = bankfile + BANK_CACHE_EXT
+    self.entries   = {} #cache entries from the last build, keyed by absolute path
+    self.added     = [] #cache entries for the current build, in embedding order
+
+  def load(self):
+    try:
+      with open(self.cachefile,'r') as fin:
+        data = json.load(fin)
+      st = os.stat(self.bankfile)
+    except (OSError, ValueError):
+      return self
+    if data.get("version") != self.version:
+      return self
+    if data.get("bank") != {"size" : st.st_size, "mtime_ns" : st.st_mtime_ns}:
+      vprint(f"  >> {self.bankfile} changed since it was cached, ignoring cache")
+      return self
+    self.entries = data.get("files", {})
+    return self
+
+  #get prepared embed data for a wav file if it hasn't changed since it was cached, or None otherwise
+  #  wav may be either a path or a WavManifest (whose size and mtime are used instead of calling os.stat())
+  #  normalize is the normalizeKey() of the current build's settings, which must match the cached entry's
+  def lookup(self,wav,isOgg,create_wem=False,normalize=None):
+    wavfile = wavPath(wav)
+    e = self.entries.get(os.path.abspath(wavfile), None)
+    if e is None or e["isOgg"] != isOgg or e.get("normalize", None) != normalize:
+      return None
+    if create_wem and not os.path.exists(f"{os.path.splitext(wavfile)[0]}.wem"):
+      return None
+    if isinstance(wav, WavManifest):
+      size, mtime_ns = wav.size, wav.mtime_ns
+    else:
+      try:
+        st = os.stat(wavfile)
+      except OSError:
+        return None
+      size, mtime_ns = st.st_size, st.st_mtime_ns
+    if size != e["size"]:
+      return None
+    if mtime_ns != e["mtime_ns"]: # touched but possibly unchanged
+      if hashFile(wavfile) != e["sha1"]:
+        return None
+      e["mtime_ns"] = mtime_ns
+
+    wem            = Ref({})
+    wem["raw_wem"] = FileSlice(self.bankfile, e["wem_offset"], e["wem_length"])
+    return {
+      "file"      : wavfile,
+      "name"      : e["name"],
+      "isOgg"     : isOgg,
+      "ids"       : e["ids"],
+      "wem"       : wem,
+      "wemlen"    : e["wem_length"],
+      "size"      : e["size"],
+      "mtime_ns"  : e["mtime_ns"],
+      "sha1"      : e["sha1"],
+      "normalize" : e.get("normalize", None),
+      "saved"     : e.get("saved", 0),
+      "wem_sha1"  : e.get("wem_sha1", None),
+    }
+
+  #record a prepared embed as part of the current build
+  def add(self,prepared):
+    self.added.append({k : prepared.get(k, None) for k in ["file", "name", "isOgg", "ids", "size", "mtime_ns", "sha1", "normalize", "saved", "wem_sha1", "wem_file_id"]})
+
+  #save cache entries for the current build after bp has been saved to our bank file
+  def save(self,bp):
+    root      = bp.root
+    data_base = (8 + int(root["seclen"])) + (8 + int(root["didx_seclen"])) + 8 # BKHD + DIDX + DATA headers
+    files     = {}
+    wems      = {int(wfi["wemid"]) : wfi for wfi in root["wemfileinfo"].val}
+    for e in self.added:
+      wfi = wems[e.pop("wem_file_id") or e["ids"]["wemid"]] # deduplicated sounds share another sound's WEM data
+      e["wem_offset"] = data_base + int(wfi["wemoff"])
+      e["wem_length"] = int(wfi["wemlen"])
+      files[os.path.abspath(e.pop("file"))] = e
+    st = os.stat(self.bankfile)
+    with open(self.cachefile + ".tmp",'w') as fout:
+      json.dump({
+        "version" : self.version,
+        "bank"    : {"size" : st.st_size, "mtime_ns" : st.st_mtime_ns},
+        "files"   : files,
+      }, fout)
+    os.replace(self.cachefile + ".tmp", self.cachefile)
+
 # Helper function for converting WAV file to WEM file
-def convertWavToWem(ifname,ofname=None):
+def convertWavToWem(ifname,ofname=None,stream=False,manifest=None):
   if ofname is None: # automatically determine WEM name
     ofname = f"{os.path.splitext(ifname)[0]}.wem"
   vprint(f"    >> exporting {ofname}")
-  wp = WEMParser().loadFromWavFile(ifname)
-  wp.saveTo(ofname)
+  wp = WEMParser().loadFromWavFile(ifname, stream=stream, manifest=manifest)
+  wp.saveTo(ofname, stream=stream)
   # playWEMData(wp.root)
 
   # Debug sanity check that we can get the original .WAV file back
@@ -1336,6 +3407,40 @@ def prompt(message, default='y'):
     values = ('y', 'yes', '') if choices == 'Y/n' else ('y', 'yes')
     return choice.strip().lower() in values
 
+# Spreadsheet columns filled in by --analyze
+ANALYSIS_COLUMNS = ["rms_db", "peak_db", "suggested_volume"]
+
+#Fill in the loudness columns of an existing spreadsheet from analyzeWavs() results, keeping everything else as-is
+#  sounds missing from the spreadsheet are added with their suggested volume
+def updateSpreadsheetAnalysis(csvfile,analysis,target_db=-20.0,defaults={}):
+  with open(csvfile,'r') as fin:
+    rows = [row for row in csv.reader(fin) if len(row) > 0]
+  header = [s.strip() for s in rows[0]]
+  for c in ANALYSIS_COLUMNS:
+    if c not in header:
+      header.append(c)
+  seen = set()
+  for row in rows[1:]:
+    row.extend([""] * (len(header) - len(row)))
+    name = row[0].strip()
+    seen.add(name)
+    if name in analysis:
+      a = analysis[name]
+      row[header.index("rms_db")]           = a["rms_db"]
+      row[header.index("peak_db")]          = a["peak_db"]
+      row[header.index("suggested_volume")] = suggestVolume(a, target_db)
+  for name, a in analysis.items():
+    if name in seen:
+      continue
+    row = [{"name" : name, "volume" : suggestVolume(a, target_db), "rms_db" : a["rms_db"], "peak_db" : a["peak_db"],
+      "suggested_volume" : suggestVolume(a, target_db)}.get(k, defaults.get(k, "")) for k in header]
+    rows.append(row)
+  with open(csvfile,'w') as fout:
+    writer = csv.writer(fout)
+    writer.writerow(header)
+    for row in rows[1:]:
+      writer.writerow(row)
+
 def loadSoundParamsFromCSV(csvfile):
     with open(csvfile,'r') as fin:
       reader = csv.reader(fin)
@@ -1348,73 +3453,668 @@ def loadSoundParamsFromCSV(csvfile):
         ddict[row[0].strip()] = {header[i] : row[i].strip() for i in range(1, minlen)}
     return ddict
 
-def main():
-  sound_params = None
-  if args.spreadsheet and os.path.exists(args.spreadsheet):
-    vprint(f">> Loading sound parameters from {args.spreadsheet}")
+# Problems that can be detected from a wav file's header, as (severity, description)
+WAV_ISSUES = {
+  "not_wav"     : ("warning", "not a RIFF / WAVE file, will be skipped"),
+  "malformed"   : ("error"  , "malformed wave file"),
+  "not_pcm"     : ("error"  , "not PCM data, only PCM wave files are supported"),
+  "8bit"        : ("error"  , "8-bit PCM crashes the game, convert to 16-bit LE PCM"),
+  "wide"        : ("error"  , "24-bit / 32-bit PCM is not supported, convert to 16-bit LE PCM"),
+  "channels"    : ("error"  , "more than 2 channels is not supported"),
+  "block_align" : ("error"  , "block alignment does not match channels * sample width"),
+  "low_mono"    : ("warning", "mono sound with a sample rate below 16000hz, may be pitch shifted in game"),
+  "extra"       : ("info"   , "has extra chunks, which are ignored"),
+}
+
+#Check a wav file's header for formats known to cause problems in game, returning its manifest and a list of issue ids
+def checkWavFile(path,st=None):
+  try:
+    m = readWavManifest(path, st, strict=True)
+  except Exception:
+    return None, ["malformed"]
+  if m is None:
+    return None, ["not_wav"]
+  issues = []
+  if m.format_tag != WAVE_FORMAT_PCM:
+    issues.append("not_pcm")
+  if m.sampwidth == 1:
+    issues.append("8bit")
+  elif m.sampwidth > 2:
+    issues.append("wide")
+  if m.channels > 2:
+    issues.append("channels")
+  if m.block_align != m.channels * m.sampwidth:
+    issues.append("block_align")
+  if m.channels == 1 and m.rate < MIN_MONO_RATE:
+    issues.append("low_mono")
+  if len(m.extra_chunks) > 0:
+    issues.append("extra")
+  return m, issues
+
+#Check the headers of all wav files in a directory (in parallel, without reading any samples) and optionally write a .json or .csv report
+#  Returns the number of files with errors
+def checkWavsInDirectory(path,recursive=False,jobs=1,report=None):
+  files = listWavFiles(path, recursive)
+  with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+    results = list(pool.map(lambda f: checkWavFile(*f), files))
+
+  rows    = []
+  counts  = {"error" : 0, "warning" : 0, "info" : 0}
+  nerrors = 0
+  for (p, _), (m, issues) in zip(files, results):
+    severities = [WAV_ISSUES[i][0] for i in issues]
+    for sev in set(severities):
+      counts[sev] += 1
+    if "error" in severities:
+      nerrors += 1
+    for i in issues:
+      sev, desc = WAV_ISSUES[i]
+      if i == "extra":
+        desc += f" ({', '.join(m.extra_chunks)})"
+      if sev == "error":
+        print(f"{col.RED}ERROR{col.BLN}: {p}: {desc}")
+      elif sev == "warning":
+        warn(f"{col.YLW}WARNING{col.BLN}: {p}: {desc}")
+      else:
+        vprint(f"{p}: {desc}")
+    rows.append({
+      "file"        : p,
+      "channels"    : m.channels if m else None,
+      "rate"        : m.rate if m else None,
+      "bits"        : m.sampwidth*8 if m else None,
+      "frames"      : m.frames if m else None,
+      "seconds"     : round(m.frames / m.rate, 3) if (m and m.rate) else None,
+      "extra_chunks": m.extra_chunks if m else [],
+      "status"      : "error" if "error" in severities else ("warning" if "warning" in severities else "ok"),
+      "issues"      : issues,
+    })
+  print(f"Checked {len(files)} .wav files: {counts['error']} with errors, {counts['warning']} with warnings")
+
+  if report is not None:
+    if report.endswith(".csv"):
+      with open(report,'w',newline='') as fout:
+        writer = csv.writer(fout)
+        writer.writerow(rows[0].keys() if rows else ["file"])
+        for row in rows:
+          writer.writerow([" ".join(v) if isinstance(v, list) else ("" if v is None else v) for v in row.values()])
+    else:
+      with open(report,'w') as fout:
+        json.dump(rows, fout, indent=2)
+    print(f"Saved report to {report}")
+  return nerrors
+
+# Human-readable names for HIRC action types
+ACTION_TYPE_NAMES = {1 : "stop", 2 : "pause", 3 : "resume", 4 : "play", 12 : "setbusvolume", 14 : "setlpf", 18 : "setstate"}
+
+#Print the event index of a bank without parsing any of its audio data
+def listEvents(bankfile):
+  b     = BNKParser().loadHeadersFrom(bankfile)
+  index = b.buildIndex()
+  print(f"{bankfile}: bank id {int(b.root['bankid'])}, {len(index['events'])} events, {len(index['actions'])} actions, {len(index['sfx'])} sounds, {len(index['wems'])} wems")
+  for event_id, action_ids in index["events"].items():
+    print(f"event {col.GRN}{labelId(event_id)}{col.BLN}")
+    for action_id in action_ids:
+      if action_id not in index["actions"]:
+        print(f"  action {action_id} (not in bank)")
+        continue
+      atype, target = index["actions"][action_id]
+      line = f"  action {action_id} {ACTION_TYPE_NAMES.get(atype, atype)} -> {target}"
+      if target in index["sfx"]:
+        wemid = index["sfx"][target]
+        line += f" -> wem {wemid}"
+        if wemid in index["wems"]:
+          off, length = index["wems"][wemid]
+          line += f" @ {off} ({length} bytes)"
+      print(line)
+
+#Find the WEM file played by an event, sound, or WEM file (given as a name or id) in a bank index, returning its id
+def resolveWemId(index,target):
+  tid = int(target) if target.isdigit() else stringToBnkID(target)
+  if tid in index["wems"]:
+    return tid
+  if tid in index["sfx"]:
+    return index["sfx"][tid]
+  for action_id in index["events"].get(tid, []):
+    atype, sfx_id = index["actions"].get(action_id, (None, None))
+    if atype == 4 and index["sfx"].get(sfx_id, None) in index["wems"]: # play action
+      return index["sfx"][sfx_id]
+  raise Exception(f"{col.CRT}{target}{col.BLN} isn't an event, sound, or WEM file in the bank, or doesn't play anything")
+
+#Play one WEM file straight from a bank, streaming its audio data in small chunks from the memory-mapped bank
+#  only the bank's headers and the WEM file's own header are parsed before playback starts
+def previewBank(bankfile,target,sink="audio"):
+  start = time.perf_counter()
+  b     = BNKParser().loadHeadersFrom(bankfile)
+  view  = wp = data = None
+  try:
+    index       = b.buildIndex()
+    wemid       = resolveWemId(index, target)
+    off, length = index["wems"][wemid]
+    view        = memoryview(b._mmap)[off:off+length]
+    wp          = WEMParser().loadFromBuffer(view)
+    if not wp.isPCM():
+      raise Exception(f"WEM file {labelId(wemid)} is Vorbis-encoded, only PCM WEM files can be previewed")
+    channels = int(wp.root["channels"])
+    rate     = int(wp.root["sample_rate"])
+    width    = int(wp.root["sample_width"]) // 8
+    data     = wp.root["wav_data"].val
+    wp       = None # drop the WEM file's other views into the bank so it can be closed afterwards
+    print(f"Previewing WEM file {col.GRN}{labelId(wemid)}{col.BLN}: {channels} channel(s), {rate} Hz, {8*width}-bit, {len(data)} bytes")
+
+    # note when the first chunk is handed to the sink
+    first = []
+    def timed(chunks):
+      for chunk in chunks:
+        if not first:
+          first.append(time.perf_counter() - start)
+        yield chunk
+        chunk.release()
+
+    played = playPCMChunks(timed(pcmChunks(data, channels * width)), channels, rate, width, sink)
+    if first:
+      print(f"  started after {1000*first[0]:.1f} ms, played {played} bytes ({played / max(1, channels * width * rate):.2f} s of audio) to the {sink} sink")
+  finally:
+    wp = None
+    for v in [data, view]:
+      if v is not None:
+        v.release()
+    b.close()
+
+#Name each WEM file in a bank after the event that plays it, given a dict of known names keyed by id
+#  WEM files without a known name are named after their id
+def nameWems(index,names):
+  wemnames = {}
+  used     = set()
+  for event_id, action_ids in index["events"].items():
+    if event_id not in names:
+      continue
+    for action_id in action_ids:
+      atype, target = index["actions"].get(action_id, (None, None))
+      wemid         = index["sfx"].get(target, None)
+      if atype != 4 or wemid is None or wemid in wemnames:
+        continue
+      name = names[event_id].replace("/","_").replace("\\","_")
+      if name in used:
+        name = f"{name}_{wemid}"
+      wemnames[wemid] = name
+      used.add(name)
+  for wemid in index["wems"]:
+    if wemid not in wemnames:
+      wemnames[wemid] = str(wemid)
+  return wemnames
+
+#Extract every WEM file from a bank into outdir, along with a .wav file for each PCM WEM file
+#  WEM data is sliced straight out of the memory-mapped bank and written by a pool of threads
+def extractBank(bankfile,outdir,names=ID_NAMES,jobs=IO_THREADS):
+  b        = BNKParser().loadHeadersFrom(bankfile)
+  index    = b.buildIndex()
+  wemnames = nameWems(index, names)
+  view     = memoryview(b._mmap)
+  os.makedirs(outdir, exist_ok=True)
+
+  # write one WEM file (and its .wav), returning the number of files written
+  def extract(wemid):
+    off, length = index["wems"][wemid]
+    data        = view[off:off+length]
+    base        = os.path.join(outdir, wemnames[wemid])
+    with open(base+".wem", 'wb') as fout:
+      fout.write(data)
+    try:
+      wp = WEMParser().loadFromBuffer(data)
+    except Exception as e:
+      warn(f"WARNING: couldn't parse WEM file {wemid}, extracting it without a .wav: {e}")
+      return 1
+    if not wp.isPCM():
+      return 1
+    wp.saveToWavFile(base+".wav")
+    return 2
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+    nfiles = sum(pool.map(extract, index["wems"]))
+  view.release()
+  b.close()
+  print(f"Extracted {nfiles} files for {len(index['wems'])} WEM files from {bankfile} to {outdir}")
+  return nfiles
+
+#Check that a bank survives being parsed and re-serialized byte for byte, reporting the first difference in each section
+#  given the .wav files the bank was built from (and the settings they were converted with), also check every sound's audio data against its source file
+#  returns the number of problems found
+def verifyBank(bankfile,wavs=None,normalize=None,jobs=IO_THREADS):
+  start = time.perf_counter()
+  print(f"Verifying {col.GRN}{bankfile}{col.BLN}")
+  try:
+    b = BNKParser().loadFrom(bankfile)
+  except Exception as e:
+    print(f"  {col.CRT}couldn't parse bank{col.BLN}: {e}")
+    return 1
+  problems = 0
+  index    = b.buildIndex()
+  sections = b.sections()
+  for curve_id, sfx_ids in b.duplicateCurveIds().items():
+    print(f"  {col.CRT}RTPC curve id {curve_id} is used by {len(sfx_ids)} sounds{col.BLN}: {', '.join(str(labelId(x)) for x in sfx_ids)}")
+    problems += 1
+
+  # re-serialize the bank, comparing it against the original as it's written instead of building a copy in memory
+  sink    = CompareSink(b._mmap, sections)
+  decoder = Decoder(None,"write",stream=sink)
+  decoder.dontPrint()
+  b.root.resetState()
+  try:
+    b.parse(decoder,b.root,"write")
+  except Exception as e:
+    print(f"  {col.CRT}couldn't re-serialize bank{col.BLN}: {e}")
+    problems += 1
+  sink.finish()
+  for i, (name, _, _) in enumerate(sink.sections):
+    if i not in sink.diffs:
+      if i < len(sections):
+        print(f"  {name}: {col.GRN}ok{col.BLN}")
+      continue
+    off   = sink.diffs[i]
+    where = "".join(f" (in WEM file {labelId(wemid)})" for wemid, (woff, wlen) in index["wems"].items() if woff <= off < woff + wlen)
+    print(f"  {name}: {col.CRT}first difference at offset {off}{col.BLN}{where}")
+    problems += 1
+
+  # hash each sound's audio data in the bank and in its source file in parallel
+  if wavs:
+    payloads = {int(info["wemid"]) : wem["wav_data"].val for info, wem in zip(b.root["wemfileinfo"].val, b.root["wemfiledata"].val)}
+
+    # check one source file, returning its name and the outcome
+    def check(wav):
+      path = wavPath(wav)
+      name = os.path.splitext(os.path.basename(path))[0]
+      if path.endswith(".ogg"): # Vorbis audio is repacked when embedded, so there's nothing to compare
+        return name, "skipped"
+      try:
+        wemid = resolveWemId(index, str(embedIds(name)["play_event_id"]))
+      except Exception:
+        return name, "missing"
+      m = readWavManifest(path)
+      if m is not None and normalize is not None:
+        m = normalizeWav(m, normalize)
+      if m is None or hashChunked(payloads[wemid]) != hashChunked(FileSlice(m.path, m.data_offset, m.data_size)):
+        return name, "differs"
+      return name, "ok"
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+      results = list(pool.map(check, wavs))
+    del payloads
+    counts = {outcome : sum(1 for _, o in results if o == outcome) for outcome in ["ok", "differs", "missing", "skipped"]}
+    for name, outcome in results:
+      if outcome in ["differs", "missing"]:
+        print(f"  {name}: {col.CRT}{'audio data differs from source file' if outcome == 'differs' else 'no WEM file is played by its event'}{col.BLN}")
+    print(f"  WEM payloads: {counts['ok']} match their source files, {counts['differs']} differ, {counts['missing']} missing, {counts['skipped']} .ogg files not checked")
+    problems += counts["differs"] + counts["missing"]
+
+  del decoder, sink
+  b.root = None # drop our views into the bank so it can be closed
+  b.close()
+  print(f"{col.GRN if problems == 0 else col.CRT}{'Verified' if problems == 0 else 'Failed to verify'}{col.BLN} {bankfile} in {time.perf_counter() - start:.2f} s ({problems} problems found)")
+  return problems
+
+#Snapshot the size and mtime of every .wav file (and .ogg file, with --ogg) in path (plus any extra files that exist), used to cheaply detect changes in --watch mode
+def watchIndex(path,recursive=False,extra=[]):
+  index = {p : (st.st_size, st.st_mtime_ns) for p, st in listWavFiles(path, recursive, exts=AUDIO_FILE_EXTS if args.ogg else (".wav",))}
+  for p in extra:
+    if p and os.path.exists(p):
+      st = os.stat(p)
+      index[p] = (st.st_size, st.st_mtime_ns)
+  return index
+
+#Compare two watch indices, returning lists of added, changed, and removed files
+def diffWatchIndex(old,new):
+  added   = [p for p in new if p not in old]
+  changed = [p for p in new if p in old and new[p] != old[p]]
+  removed = [p for p in old if p not in new]
+  return added, changed, removed
+
+#Build the bank, then keep rebuilding it whenever .wav files in path or any extra files change until interrupted with Ctrl+C
+#  changes are debounced (we wait until nothing has changed for debounce seconds) so copying a batch of files only triggers one rebuild
+#  rebuilds are incremental, and the bank is written to a temporary file and renamed over the old one, so it's never seen half-written
+def watchForChanges(path,recursive=False,extra=[],poll=1.0,debounce=0.5):
+  args.incremental = True
+  index = watchIndex(path, recursive, extra)
+  try:
+    while True:
+      try:
+        buildBank(loadSpreadsheet())
+        args.overwrite = True # don't ask again on every rebuild
+      except Exception as e:
+        warn(f"{col.RED}ERROR: build failed: {e}{col.BLN}")
+      # the build may have written the spreadsheet itself, so don't count that as a change
+      built = dict(index)
+      built.update({p : v for p, v in watchIndex(path, False, extra).items() if p in extra})
+      print(f"Watching {path} for changes (press Ctrl+C to stop)")
+      while (index := watchIndex(path, recursive, extra)) == built:
+        time.sleep(poll)
+      while True: # wait for a burst of changes to settle
+        time.sleep(debounce)
+        settled = watchIndex(path, recursive, extra)
+        if settled == index:
+          break
+        index = settled
+      added, changed, removed = diffWatchIndex(built, index)
+      print(f"\n>> {len(added)} added, {len(changed)} changed, {len(removed)} removed; rebuilding")
+      for p in added + changed + removed:
+        vprint(f"  >> {p}")
+  except KeyboardInterrupt:
+    print("\nStopped watching")
+
+#Load sound parameters from the spreadsheet passed with -s, or None if there isn't one
+def loadSpreadsheet():
+  if not (args.spreadsheet and os.path.exists(args.spreadsheet)):
+    return None
+  vprint(f">> Loading sound parameters from {args.spreadsheet}")
+  with PROFILER.phase("csv load", os.path.getsize(args.spreadsheet)):
     sound_params = loadSoundParamsFromCSV(args.spreadsheet)
-
-  if args.readbank:
-    args.showparse = True
-    args.dumpparse = True
-    b = BNKParser()
-    b.loadFrom(args.input_path)
-    b.root.dump()
-    return
-
-  # build list of wav files to parse
-  vprint(f">> {col.CYN+'recursively '+col.BLN if args.recursive else ''}scanning {col.GRN}{args.input_path}{col.BLN} for wave files")
-  wavs_to_parse = findWavsInDirectory(args.input_path, recursive=args.recursive)
-
+  # names from the spreadsheet are known for this run, even if they aren't in the dictionary
+  ID_NAMES.addMany(name + suffix for name in sound_params for suffix in EMBED_ID_SUFFIXES.values())
+  return sound_params
+
+#Split wav files into shards, returning a dict of shard name -> list of wav files (in scan order)
+#  "size"    : consecutive files are packed into shards of at most budget bytes of audio data (larger files get their own shard)
+#  "channel" : files are grouped by their spreadsheet channel ("sound" or "music")
+#  "folder"  : files are grouped by the top-level subfolder of input_path they're in ("root" for files directly in input_path)
+def shardWavs(wavs,mode,input_path,sound_params=None,budget=0):
+  shards = {}
+  if mode == "size":
+    n, used = 1, 0
+    for w in wavs:
+      if used > 0 and used + w.data_size > budget:
+        n, used = n + 1, 0
+      shards.setdefault(str(n), []).append(w)
+      used += w.data_size
+  elif mode == "channel":
+    params = sound_params or {}
+    for w in wavs:
+      name = os.path.splitext(os.path.basename(wavPath(w)))[0]
+      shards.setdefault(params.get(name, {}).get("channel", "sound"), []).append(w)
+  elif mode == "folder":
+    for w in wavs:
+      parts = os.path.normpath(os.path.relpath(wavPath(w), input_path)).split(os.sep)
+      shards.setdefault(parts[0] if len(parts) > 1 else "root", []).append(w)
+  else:
+    raise Exception(f"unknown shard mode {mode}, expected one of {', '.join(SHARD_MODES)}")
+  return shards
+
+#Save a manifest mapping each event name to the bank it's in (plus each bank's id and events), so banks can be loaded on demand
+def saveShardManifest(fname,banks):
+  manifest = {"version" : 1, "banks" : {}, "events" : {}}
+  for b in banks:
+    bankname = os.path.basename(b["file"])
+    events   = [name + suffix for name in b["names"] for key, suffix in EMBED_ID_SUFFIXES.items() if key.endswith("_event_id")]
+    manifest["banks"][bankname] = {"bank_id" : b["bank_id"], "events" : events}
+    for e in events:
+      if manifest["events"].get(e, bankname) != bankname:
+        raise Exception(f"event {col.CRT}{e}{col.BLN} is in both {manifest['events'][e]} and {bankname}")
+      manifest["events"][e] = bankname
+  with open(fname + ".tmp",'w') as fout:
+    json.dump(manifest, fout, indent=2)
+  os.replace(fname + ".tmp", fname)
+
+#Build a single bank from a list of wav files and save it to outfile, returning a summary of what was built
+def writeBank(wavs_to_parse,outfile,sound_params=None,normalize=None,jobs=1):
   # Generate a bank id from the file name
-  base_bnk_name = os.path.splitext(os.path.basename(args.output_bank_name))[0]
+  base_bnk_name = os.path.splitext(os.path.basename(outfile))[0]
   bank_id       = stringToBnkID(base_bnk_name)
 
   # Create a sound bank in memory and add our wav files
   vprint(f"  >> Creating bank with id {bank_id}")
   bp            = BNKParser().createMinimal(bank_id)
+  bp.dedupe     = args.dedupe
 
   if sound_params is not None:
     bp.setSoundParams(sound_params)
+  if args.vanilla_ids:
+    vprint(f"  >> Loading vanilla ids from {args.vanilla_ids}")
+    bp.ids.loadVanillaIds(args.vanilla_ids)
+
+  # Merge existing banks, leaving out any sounds we're about to replace
+  if args.merge:
+    replace_ids = set()
+    for w in wavs_to_parse:
+      replace_ids.update(embedIds(os.path.splitext(os.path.basename(wavPath(w)))[0]).values())
+    for bankfile in args.merge:
+      vprint(f"  >> merging sounds from {col.GRN}{bankfile}{col.BLN}")
+      with PROFILER.phase("merge"):
+        bp.mergeBank(bankfile, replace_ids)
+
+  # Load the incremental build cache if requested
+  cache = None
+  if args.incremental:
+    vprint(f"  >> loading build cache {col.GRN}{outfile+BANK_CACHE_EXT}{col.BLN}")
+    cache = BankCache(outfile).load()
 
   # Add our .wav files to the sound bank
   vprint(f"  >> embedding {len(wavs_to_parse)} .wav files into sound bank")
-  for w in wavs_to_parse:
-    vprint(f"    >> embedding {col.GRN}{w}{col.BLN} into sound bank")
-    bp.embedFromWav(w, isOgg = w.endswith(".ogg"))
-    if args.create_wems:
-      convertWavToWem(w)
+  shrink        = normalize is not None and (normalize["trim_db"] is not None or normalize["downmix"])
+  total_saved   = 0
+  prepared_wavs = prepareEmbeds(wavs_to_parse, jobs=jobs, stream=args.stream, create_wems=args.create_wems, cache=cache, normalize=normalize)
+  for prepared in PROFILER.iterate("wem build", prepared_wavs, size=lambda p: p["wemlen"]):
+    vprint(f"    >> embedding {col.GRN}{prepared['file']}{col.BLN} into sound bank")
+    if not PROFILER.enabled:
+      bp.embedPrepared(prepared)
+    else:
+      hirc_seclen = int(bp.root["hirc_seclen"])
+      with PROFILER.phase("hirc build"):
+        bp.embedPrepared(prepared)
+      PROFILER.addBytes("hirc build", int(bp.root["hirc_seclen"]) - hirc_seclen)
+    if cache is not None:
+      cache.add(prepared)
+    if shrink:
+      total_saved += prepared["saved"]
+      if prepared["saved"] > 0:
+        print(f"  {prepared['name']}: saved {prepared['saved']} bytes")
+      elif prepared["saved"] < 0: # converting with -N can make files bigger
+        print(f"  {prepared['name']}: grew by {-prepared['saved']} bytes after converting")
 
   # Dump parsed bank information if requested
   if args.dumpparse:
     bp.root.dump()
 
-  # Determine path to our output .bnk file to and save it
+  # Make sure the bank is consistent before saving it
+  if not args.skipchecks:
+    bp.checkReferences()
+
+  # Save our output .bnk file
+  vprint(f"  >> {'streaming' if (args.stream or args.merge) else 'writing'} bank to {col.GRN}{outfile}{col.BLN}")
+  bp.saveTo(outfile, stream=args.stream or len(args.merge) > 0) # always stream merged banks so existing WEM data is never loaded
+  if cache is not None:
+    cache.save(bp)
+  if args.verify and verifyBank(outfile, wavs_to_parse, normalize, jobs=max(jobs, IO_THREADS)) > 0:
+    raise Exception(f"{outfile} failed verification")
+  vprint(">> done :D")
+  print(f"Created soundbank {outfile} with {len(wavs_to_parse)} .wav files")
+  if args.dedupe:
+    print(f"Deduplicated {len(bp.deduped)} sounds, reclaiming {sum(n for _, n in bp.deduped)} bytes")
+    for name, n in bp.deduped:
+      vprint(f"  >> {name}: {n} bytes")
+  if shrink:
+    data_size = int(bp.root["data_seclen"])
+    if total_saved >= 0:
+      print(f"Trimming / downmixing saved {total_saved} bytes ({100.0 * total_saved / max(1, data_size + total_saved):.1f}% of audio data)")
+    else:
+      print(f"Converting / trimming / downmixing grew audio data by {-total_saved} bytes ({100.0 * -total_saved / max(1, data_size + total_saved):.1f}%)")
+  return {"file" : outfile, "bank_id" : bank_id, "names" : bp.embedded_files}
+
+#Write one shard's bank in a worker process, sending back the worker's profile along with it if profiling
+def writeShard(wavs_to_parse,outfile,sound_params,normalize,profile):
+  if not profile:
+    return writeBank(wavs_to_parse, outfile, sound_params, normalize), None
+  PROFILER.enable()
+  bank = writeBank(wavs_to_parse, outfile, sound_params, normalize)
+  return bank, PROFILER.results()
+
+#Build the output bank (or banks, with --shard) from the .wav files in input_path
+def buildBank(sound_params):
+  # build list of wav files to parse
+  vprint(f">> {col.CYN+'recursively '+col.BLN if args.recursive else ''}scanning {col.GRN}{args.input_path}{col.BLN} for wave files")
+  with PROFILER.phase("directory scan"):
+    wavs_to_parse = findWavsInDirectory(args.input_path, recursive=args.recursive, ogg=args.ogg)
+  PROFILER.addBytes("directory scan", sum(w.size for w in wavs_to_parse))
+
+  # Determine path to our output .bnk file
   outfile = args.output_bank_name
   if not outfile.endswith(".bnk"):
     outfile += ".bnk"
   if not os.path.isabs(outfile):
     outfile = os.path.join(args.input_path,outfile)
-  if os.path.exists(outfile):
+  if os.path.exists(outfile) and not args.shard:
     if not args.overwrite:
       if not prompt(f"Overwrite {outfile}?"):
         print(f"Exiting without overwriting {outfile}")
         sys.exit(0)
-    os.remove(outfile)
-  vprint(f"  >> writing bank to {col.GRN}{outfile}{col.BLN}")
-  bp.saveTo(outfile)
-  vprint(">> done :D")
-  print(f"Created soundbank {outfile} with {len(wavs_to_parse)} .wav files")
 
+  # Set up conversion of .wav files to a format the game supports if requested
+  normalize = None
+  if args.normalize or args.trim or args.downmix:
+    if not "numpy" in sys.modules:
+      raise Exception("numpy not loaded, refusing to convert audio (install numpy to use --normalize, --trim or --downmix)")
+    if args.normalize and args.downmix:
+      warn("WARNING: --downmix has no effect with --normalize, which always converts to stereo")
+    normalize = {
+      "convert"  : args.normalize,
+      "rate"     : args.rate,
+      "trim_db"  : args.trim_db if args.trim else None,
+      "downmix"  : args.downmix,
+      "cachedir" : os.path.join(os.path.dirname(os.path.abspath(outfile)), ".wavcache"),
+      }
+    if args.normalize:
+      vprint(f"  >> converting .wav files to 16-bit stereo{f' at {args.rate}hz' if args.rate else ''}, caching conversions in {col.GRN}{normalize['cachedir']}{col.BLN}")
+    if args.trim:
+      vprint(f"  >> trimming leading / trailing silence below {args.trim_db} dBFS")
+    if args.downmix and not args.normalize:
+      vprint(f"  >> downmixing stereo .wav files with identical channels to mono")
+
+  # Measure the loudness of our .wav files if requested
+  analysis = None
+  if args.analyze:
+    wavs = [w for w in wavs_to_parse if w.format_tag != WAVE_FORMAT_WWISE_VORBIS] # only .wav files can be measured
+    vprint(f"  >> analyzing loudness of {len(wavs)} .wav files")
+    with PROFILER.phase("loudness analysis"):
+      analysis = analyzeWavs(wavs, jobs=args.jobs if args.jobs > 1 else os.cpu_count(),
+        cachefile=os.path.join(os.path.dirname(os.path.abspath(outfile)), ".wavcache", "analysis.json"))
+    PROFILER.addBytes("loudness analysis", sum(w.data_size for w in wavs))
+    for name, a in analysis.items():
+      vprint(f"    >> {name}: rms {a['rms_db']} dB, peak {a['peak_db']} dB, suggested volume {suggestVolume(a, args.target_db)}")
+
+  jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+  if not args.shard:
+    banks = [writeBank(wavs_to_parse, outfile, sound_params, normalize, jobs=jobs)]
+  else:
+    # Build each shard as its own bank, in parallel if requested
+    if args.merge:
+      raise Exception("--merge can't be combined with --shard")
+    # each shard only checks its own ids, so make sure no ids clash across shards before splitting
+    ids = BnkIdRegistry()
+    for w in wavs_to_parse:
+      name = os.path.splitext(os.path.basename(wavPath(w)))[0]
+      wids = embedIds(name)
+      ids.registerAll(wids, embedIdNames(name, wids), wavPath(w))
+    shards   = shardWavs(wavs_to_parse, args.shard, args.input_path, sound_params, budget=int(args.shard_size * 1024 * 1024))
+    base     = outfile[:-4]
+    outfiles = [f"{base}_{name}.bnk" for name in shards]
+    vprint(f"  >> splitting {len(wavs_to_parse)} .wav files into {len(shards)} banks by {args.shard}")
+    if not args.overwrite:
+      existing = [f for f in outfiles if os.path.exists(f)]
+      if existing and not prompt(f"Overwrite {', '.join(existing)}?"):
+        print(f"Exiting without overwriting {', '.join(existing)}")
+        sys.exit(0)
+    if jobs > 1 and len(shards) > 1:
+      vprint(f"  >> building banks with {min(jobs, len(shards))} worker processes")
+      banks = []
+      with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(shards))) as pool:
+        for bank, profile in pool.map(writeShard, shards.values(), outfiles, [sound_params] * len(shards), [normalize] * len(shards), [PROFILER.enabled] * len(shards)):
+          banks.append(bank)
+          if profile is not None:
+            PROFILER.merge(profile)
+    else:
+      banks = [writeBank(wavs, f, sound_params, normalize, jobs=jobs) for wavs, f in zip(shards.values(), outfiles)]
+    manifest = base + ".manifest.json"
+    saveShardManifest(manifest, banks)
+    print(f"Saved manifest for {len(banks)} banks to {manifest}")
+
+  embedded = [name for b in banks for name in b["names"]]
   if args.spreadsheet and not os.path.exists(args.spreadsheet):
-    bp.createExampleSpreadsheet(args.spreadsheet)
+    BNKParser().createExampleSpreadsheet(args.spreadsheet, names=embedded, analysis=analysis, target_db=args.target_db)
     print(f"Saved example spreadsheet to {args.spreadsheet}")
+  elif args.spreadsheet and analysis is not None:
+    updateSpreadsheetAnalysis(args.spreadsheet, analysis, target_db=args.target_db, defaults=BNKParser.default_sound_params)
+    print(f"Saved loudness analysis to {args.spreadsheet}")
+  elif analysis is not None:
+    warn("WARNING: pass a spreadsheet with -s to save the loudness analysis")
+
+  if PROFILER.enabled:
+    print()
+    PROFILER.summary()
+    if args.profile_json:
+      PROFILER.saveJson(args.profile_json)
+      print(f"Saved profile trace to {args.profile_json}")
+
+def main():
+  if args.profile or args.profile_json:
+    PROFILER.enable()
+
+  # Load the name dictionary, adding to it if requested
+  names_file = args.names or DEFAULT_NAMES_FILE
+  if os.path.exists(names_file):
+    vprint(f">> Loading name dictionary from {names_file}")
+    ID_NAMES.load(names_file)
+  if args.addnames:
+    for namefile in args.addnames:
+      print(f"Added {ID_NAMES.addFromFile(namefile)} new names from {namefile}")
+    ID_NAMES.save(names_file)
+    print(f"Saved {len(ID_NAMES)} names to {names_file}")
+    return
+
+  if args.input_path is None: # only possible in autorun mode when skipAutorun() is true
+    parser.error("the following arguments are required: -i/--input_path")
+
+  sound_params = loadSpreadsheet()
+
+  if args.listevents:
+    listEvents(args.input_path)
+    return
+
+  if args.preview:
+    previewBank(args.input_path, args.preview, sink=args.sink)
+    return
+
+  if args.verify and args.input_path.endswith(".bnk"):
+    if verifyBank(args.input_path) > 0:
+      sys.exit(1)
+    return
+
+  if args.extract:
+    extractBank(args.input_path, args.extract, names=ID_NAMES, jobs=args.jobs if args.jobs > 1 else IO_THREADS)
+    return
+
+  if args.check:
+    jobs = args.jobs if args.jobs > 1 else IO_THREADS # header reads are mostly waiting on the disk, so use threads even by default
+    if checkWavsInDirectory(args.input_path, recursive=args.recursive, jobs=jobs, report=args.report) > 0:
+      sys.exit(1)
+    return
+
+  if args.readbank:
+    args.showparse = True
+    args.dumpparse = True
+    b = BNKParser()
+    b.loadFrom(args.input_path)
+    b.root.dump()
+    return
+
+  if args.watch:
+    watchForChanges(args.input_path, recursive=args.recursive, extra=[args.spreadsheet], poll=args.poll, debounce=args.debounce)
+  else:
+    buildBank(sound_params)
 
-  # (DEBUG) compute checksums w.r.t. reference bank
-  # os.system(f"/bin/md5sum ./ref.bnk {outfile}")
+#Check whether we were asked to do something other than build a bank, in which case autorun mode shouldn't kick in
+def skipAutorun():
+  return bool(args.addnames or args.listevents or args.preview or args.extract or args.check or args.readbank)
 
 def mainAutorun():
   args.overwrite = True
+  args.incremental = True
   args.input_path = os.path.dirname(os.path.realpath(__file__))
   bankname = "Sounds"
   for file in os.listdir(args.input_path):
@@ -1428,7 +4128,7 @@ def mainAutorun():
   input("Press return to exit")
 
 if __name__ == "__main__":
-  if ALLOW_AUTORUN and (args.input_path is None):
+  if ALLOW_AUTORUN and (args.input_path is None) and not skipAutorun():
     mainAutorun()
   else:
     main()
@@ -0,0 +1,118 @@
+#Tests for gen-gungeon-audio-bank.py
+#  Run with: python -m pytest tests
+
+import os, sys, time, wave, subprocess, threading, importlib.util, concurrent.futures
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "gen-gungeon-audio-bank.py")
+
+#Load gen-gungeon-audio-bank.py as a module without running its main()
+def loadScript():
+  argv     = sys.argv
+  sys.argv = [SCRIPT, "-q", "-i", ".", "-o", "test", "--names", os.devnull]
+  try:
+    spec   = importlib.util.spec_from_file_location("gen_gungeon_audio_bank", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+  finally:
+    sys.argv = argv
+  return module
+
+#Write count identical mono .wav files to path
+def writeDuplicateWavs(path,count,rate=22050):
+  data = bytes((i * 37) & 0xFF for i in range(40000))
+  for i in range(count):
+    with wave.open(os.path.join(path, f"dup_{i:02d}.wav"), 'wb') as fout:
+      fout.setnchannels(1)
+      fout.setsampwidth(2)
+      fout.setframerate(rate)
+      fout.writeframes(data)
+
+#Identical files share a cache name, so converting them at the same time must not trip over each other's temp files
+def test_normalize_duplicates_in_parallel_threads(tmp_path,monkeypatch):
+  pytest.importorskip("numpy")
+  gen       = loadScript()
+  wave_open = wave.open
+
+  # hold each output file open for a moment so the conversions overlap even on a single CPU
+  def slowOpen(*args, **kwargs):
+    w = wave_open(*args, **kwargs)
+    time.sleep(0.05)
+    return w
+  monkeypatch.setattr(wave, "open", slowOpen)
+  writeDuplicateWavs(tmp_path, 16)
+  wavs      = gen.findWavsInDirectory(str(tmp_path))
+  normalize = {"convert" : True, "rate" : 44100, "trim_db" : None, "downmix" : False, "cachedir" : str(tmp_path / ".wavcache")}
+  start     = threading.Barrier(len(wavs))
+
+  def convert(m):
+    start.wait()
+    return gen.normalizeWav(m, normalize)
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers=len(wavs)) as pool:
+    results = list(pool.map(convert, wavs))
+  assert len({r.path for r in results}) == 1
+  assert all(r.channels == 2 and r.rate == 44100 for r in results)
+  assert [f for f in os.listdir(tmp_path / ".wavcache") if f.endswith(".tmp")] == []
+
+def test_normalize_duplicates_in_parallel_workers(tmp_path):
+  pytest.importorskip("numpy")
+  writeDuplicateWavs(tmp_path, 16)
+  out = subprocess.run([sys.executable, SCRIPT, "-q", "-O", "--names", str(tmp_path / "names.bin"), "-i", str(tmp_path), "-o", "out.bnk",
+    "-N", "--rate", "44100", "-j", "16", "--verify"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+  assert out.returncode == 0, out.stdout
+  assert os.path.exists(tmp_path / "out.bnk")
+
+#Replacing a sound whose WEM data is shared with another sound (--dedupe) must keep the data the other sound still plays
+def test_merge_replacing_deduplicated_sound(tmp_path):
+  base, new = tmp_path / "base", tmp_path / "new"
+  base.mkdir()
+  new.mkdir()
+  writeDuplicateWavs(base, 2)
+  os.rename(base / "dup_00.wav", base / "a.wav")
+  writeDuplicateWavs(new, 1, rate=44100)
+  os.rename(new / "dup_00.wav", new / "a.wav")
+  common = [sys.executable, SCRIPT, "-q", "-O", "--names", str(tmp_path / "names.bin")]
+  subprocess.run(common + ["-i", str(base), "-o", "base.bnk", "-D"], check=True)
+  out = subprocess.run(common + ["-i", str(new), "-o", "merged.bnk", "-m", str(base / "base.bnk"), "--verify"],
+    stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+  assert out.returncode == 0, out.stdout
+
+  gen = loadScript()
+  b   = gen.BNKParser().loadFrom(str(new / "merged.bnk"))
+  assert len(b.buildIndex()["wems"]) == 2
+  sound = next(h for h in b.root["hircobjects"].val if isinstance(h, gen.HircSound))
+  sound.wem_file_num_bytes += 1
+  with pytest.raises(Exception, match="expects WEM file"):
+    b.checkReferences()
+
+#Nested phases must not count their time twice or hide the memory they used from the outer phase
+def test_profiler_nested_phases():
+  gen  = loadScript()
+  prof = gen.Profiler()
+  prof.enable()
+  try:
+    with prof.phase("outer"):
+      time.sleep(0.05)
+      with prof.phase("inner"):
+        data = bytearray(8 * 1024 * 1024)
+        time.sleep(0.1)
+        del data
+      time.sleep(0.05)
+  finally:
+    gen.tracemalloc.stop()
+  outer, inner = prof.phases["outer"], prof.phases["inner"]
+  assert 0.09 <= outer["wall"] < 0.15
+  assert inner["wall"] >= 0.1
+  assert outer["peak"] >= 8 * 1024 * 1024 and inner["peak"] >= 8 * 1024 * 1024
+  assert [e[0] for e in prof.events] == ["inner", "outer"]
+
+#Banks built by worker processes with --shard -j must still show up in the profile
+def test_profile_sharded_workers(tmp_path):
+  writeDuplicateWavs(tmp_path, 4)
+  out = subprocess.run([sys.executable, SCRIPT, "-q", "-O", "--names", str(tmp_path / "names.bin"), "-i", str(tmp_path), "-o", "out.bnk",
+    "--shard", "size", "--shard_size", "0.05", "-j", "2", "--profile"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+  assert out.returncode == 0, out.stdout
+  rows = {line.split()[0] : line.split() for line in out.stdout.splitlines() if line.split()}
+  assert rows["serialize"][1] == "4"
+  assert rows["hirc"][2] == "4"